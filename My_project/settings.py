@@ -24,7 +24,7 @@ LOGIN_REDIRECT_URL = 'home/'# change if i want to redirect to another page
 SECRET_KEY = 'django-insecure-(b=uaa4uwik_63-!!c+w7m*ig@zoy*^34xy%j4t@x3!f83+qce'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = []
 
@@ -44,24 +44,33 @@ MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
 
 MIDDLEWARE = [
+    'Pet_walking.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Pet_walking.middleware.UserRoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'My_project.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates measuring the render time for the metrics
+        'BACKEND': 'Pet_walking.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR / 'templates')]
         ,
-        'APP_DIRS': True,
         'OPTIONS': {
+            # outside of development compiled templates are kept in memory
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -87,6 +96,41 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# locmem is per process, so the listing pages get no ETag/Last-Modified headers with it (a write would
+# only move the versions of the process that handled it). Set DJANGO_CACHE_DIR to share a file based
+# cache between the workers of one host, use memcached or redis for several hosts.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+    } if os.environ.get('DJANGO_CACHE_DIR') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pet-walking',
+    }
+}
+
+# Addresses allowed to read /metrics besides logged in staff members (e.g. a Prometheus scraping the app directly),
+# comma separated. None by default: behind a reverse proxy on the same host every request comes from 127.0.0.1.
+METRICS_ALLOWED_IPS = [address.strip() for address in os.environ.get('METRICS_ALLOWED_IPS', '').split(',')
+                       if address.strip()]
+
+# Channels the send_notifications command delivers the notification outbox to. Add
+# 'Pet_walking.outbox.WebhookChannel' to also POST the events to OUTBOX_WEBHOOK_URL
+# (the webhook_stub command serves a local receiver at this address).
+OUTBOX_CHANNELS = ['Pet_walking.outbox.EmailChannel']
+OUTBOX_WEBHOOK_URL = 'http://127.0.0.1:8001/'
+
+# Notification emails are printed to the console, configure SMTP in production
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'notifications@pet-walking.local'
+
+# Users are loaded together with their Owner/Walker profile. ModelBackend stays listed so the
+# sessions it logged in before keep working (their user is loaded without the profile).
+AUTHENTICATION_BACKENDS = ['Pet_walking.backends.ProfileModelBackend', 'django.contrib.auth.backends.ModelBackend']
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
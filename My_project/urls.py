@@ -24,5 +24,6 @@ from django.contrib.messages import middleware
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('Pet_walking/', include('Pet_walking.urls')),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
 
 ]
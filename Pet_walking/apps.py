@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PetWalkingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Pet_walking'
+
+    def ready(self):
+        from Pet_walking import metrics, signals  # noqa: F401 (connects the receivers)
+        from Pet_walking import tasks  # noqa: F401 (registers the background tasks)
@@ -0,0 +1,42 @@
+"""
+Small timing helpers shared by the benchmark management commands.
+"""
+import math
+import time
+
+
+def measure(function, repeat=1):
+    """
+    Calls the function repeat times.
+    :return: A list with the duration of every call in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, fraction):
+    """
+    Returns the nearest-rank percentile (fraction between 0 and 1) of the samples.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """
+    Returns the count, mean and p50/p95/p99 of the samples.
+    """
+    return {
+        'count': len(samples),
+        'mean': sum(samples) / len(samples) if samples else 0.0,
+        'p50': percentile(samples, 0.50),
+        'p95': percentile(samples, 0.95),
+        'p99': percentile(samples, 0.99),
+    }
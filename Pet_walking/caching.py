@@ -0,0 +1,183 @@
+"""
+Versioned caching of per-owner data.
+
+Every cached value lives under a key containing the current version of its scope
+(for example "pets:42:7"). Writes never delete cached values, they bump the version
+of the scope, so readers move on to a new key and the stale entry simply expires.
+
+With the default locmem backend every process keeps its own cache and versions,
+use a shared backend (file based, memcached, redis) when running several processes.
+The listing ETags are only given with a shared backend (see versions_are_shared).
+
+Next to its version every scope records when it last changed, which gives the listing views
+their ETag and Last-Modified values without querying the database (see Pet_walking.views.conditional_listing).
+"""
+import threading
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from Pet_walking.models import Pet
+
+PETS_TIMEOUT = 60 * 60
+# version of every request listing, rendered request tables are cached under it
+REQUESTS_SCOPE = 'requests'
+# versions of the request listings of one user (as owner or walker) and of all users at once, bumped
+# only when the changed users are not known; the ETags of the listing pages are built from them
+LISTINGS_SCOPE = 'listings'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """
+    Returns the hit and miss counters of the versioned cache since the process started.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def render_cache_metrics():
+    """
+    Returns the hit and miss counters of this process in the Prometheus text format,
+    the hit ratio is hits / (hits + misses).
+    """
+    stats = cache_stats()
+    return '\n'.join([
+        '# HELP pet_walking_cache_lookups_total Lookups of the versioned cache, by result.',
+        '# TYPE pet_walking_cache_lookups_total counter',
+        f'pet_walking_cache_lookups_total{{result="hit"}} {stats["hits"]}',
+        f'pet_walking_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+    ]) + '\n'
+
+
+def versions_are_shared():
+    """
+    Tells whether every server process sees the same versions, which the process-local locmem backend does not.
+    """
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def get_version(scope):
+    """
+    Returns the current version of a scope, starting a new one if it is not cached.
+    New versions start from the current time, so they never reuse keys of an evicted version.
+    """
+    key = f'version:{scope}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        cache.add(f'modified:{scope}', time.time(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+async def aget_version(scope):
+    """
+    Async version of get_version.
+    """
+    key = f'version:{scope}'
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        await cache.aadd(f'modified:{scope}', time.time(), timeout=None)
+        version = await cache.aget(key, 0)
+    return version
+
+
+def bump_version(scope):
+    """
+    Invalidates everything cached for a scope by moving it to a new version.
+    """
+    key = f'version:{scope}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+    cache.set(f'modified:{scope}', time.time(), timeout=None)
+
+
+def bump_on_commit(*scopes):
+    """
+    Bumps the scopes once the current transaction commits (right away outside of one). Bumping earlier
+    would let a reader cache the rows of before the change under the new version.
+    """
+    transaction.on_commit(lambda: [bump_version(scope) for scope in scopes])
+
+
+def last_modified(scope):
+    """
+    Returns the time (a UNIX timestamp) of the last version change of a scope. A scope whose
+    time was evicted counts as modified now, so clients fetch it again instead of keeping stale data.
+    """
+    key = f'modified:{scope}'
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, time.time(), timeout=None)
+        modified = cache.get(key, time.time())
+    return modified
+
+
+def get_or_set_versioned(scope, build, timeout):
+    """
+    Returns the value cached for the current version of the scope, building and caching it on a miss.
+    """
+    key = f'{scope}:{get_version(scope)}'
+    value = cache.get(key)
+    if value is None:
+        _count('misses')
+        value = build()
+        cache.set(key, value, timeout)
+    else:
+        _count('hits')
+    return value
+
+
+async def aget_or_set_versioned(scope, build, timeout):
+    """
+    Async version of get_or_set_versioned, build is a coroutine function.
+    """
+    key = f'{scope}:{await aget_version(scope)}'
+    value = await cache.aget(key)
+    if value is None:
+        _count('misses')
+        value = await build()
+        await cache.aset(key, value, timeout)
+    else:
+        _count('hits')
+    return value
+
+
+def pets_scope(owner_id):
+    return f'pets:{owner_id}'
+
+
+def listings_scope(user_id):
+    return f'listings:{user_id}'
+
+
+def owner_pets(owner):
+    """
+    Returns the owner's pets ordered by nickname, from the cache when nothing changed.
+    """
+    return get_or_set_versioned(
+        pets_scope(owner.pk),
+        lambda: list(Pet.objects.filter(owner=owner).order_by('nickname')),
+        PETS_TIMEOUT)
+
+
+async def aowner_pets(owner):
+    """
+    Async version of owner_pets, a miss is loaded with the async ORM.
+    """
+    async def build():
+        return [pet async for pet in Pet.objects.filter(owner=owner).order_by('nickname')]
+    return await aget_or_set_versioned(pets_scope(owner.pk), build, PETS_TIMEOUT)
@@ -0,0 +1,171 @@
+"""
+Automatic dispatch of the open requests of a day to walkers.
+
+A walker is a candidate for a request when its pet is one of the walker's pets (Walker.pets) and
+takes at most Walker.daily_capacity walks a day, including the ones reserved already. The engine
+finds an assignment covering as many requests as possible (a maximum bipartite b-matching):
+a greedy pass assigns most requests, then augmenting paths move already assigned requests
+to other walkers to make room for the rest.
+"""
+from collections import defaultdict, deque, namedtuple
+
+from django.db import connection, transaction
+from django.db.models import BigIntegerField, Case, Count, Value, When
+
+from Pet_walking.models import OutboxEvent, Request, Walker, requests_changed, requests_reserved
+
+# requests assigned by one UPDATE, two query parameters per request
+CHUNK_SIZE = 500
+
+Dispatch = namedtuple('Dispatch', ['open', 'assigned', 'written', 'lost'])
+
+
+def assign(candidates, capacity):
+    """
+    Assigns requests to walkers, covering as many requests as possible.
+    :param candidates: A dict of request id -> walker ids that can take the request.
+    :param capacity: A dict of walker id -> number of requests the walker can still take.
+    :return: A dict of request id -> walker id.
+    """
+    load = defaultdict(int)
+    assigned = {}
+    walker_requests = defaultdict(set)
+
+    def take(request_id, walker_id):
+        previous = assigned.get(request_id)
+        if previous is not None:
+            walker_requests[previous].discard(request_id)
+            load[previous] -= 1
+        assigned[request_id] = walker_id
+        walker_requests[walker_id].add(request_id)
+        load[walker_id] += 1
+
+    # greedy: the most constrained requests first, each to the candidate with the most room left
+    for request_id in sorted(candidates, key=lambda request_id: len(candidates[request_id])):
+        free = [walker_id for walker_id in candidates[request_id] if load[walker_id] < capacity.get(walker_id, 0)]
+        if free:
+            take(request_id, max(free, key=lambda walker_id: capacity[walker_id] - load[walker_id]))
+
+    # augmenting paths: a request -> a full walker -> one of its requests -> ... -> a walker with room.
+    # Walkers seen in a failed search cannot lead to room until an augmentation, so they stay
+    # marked until then.
+    seen = set()
+    for request_id in candidates:
+        if request_id in assigned:
+            continue
+        reached_from = {}
+        queue = deque()
+        for walker_id in candidates[request_id]:
+            if walker_id not in seen:
+                seen.add(walker_id)
+                reached_from[walker_id] = request_id
+                queue.append(walker_id)
+        while queue:
+            walker_id = queue.popleft()
+            if load[walker_id] < capacity.get(walker_id, 0):
+                # shift every request on the path to the walker it was reached through
+                while True:
+                    moved = reached_from[walker_id]
+                    previous = assigned.get(moved)
+                    take(moved, walker_id)
+                    if moved == request_id:
+                        break
+                    walker_id = previous
+                seen.clear()
+                break
+            for other_request in walker_requests[walker_id]:
+                for other_walker in candidates[other_request]:
+                    if other_walker not in seen:
+                        seen.add(other_walker)
+                        reached_from[other_walker] = other_request
+                        queue.append(other_walker)
+    return assigned
+
+
+def load_day(day):
+    """
+    Loads the open requests of the day with their candidate walkers (user ids) and the walkers' free capacity.
+    :return: A (candidates, capacity) pair of dicts as taken by assign().
+    """
+    pets = defaultdict(list)
+    for request_id, pet_id in Request.objects.filter(date=day, available_for_booking=True).values_list('id', 'pet_id'):
+        pets[pet_id].append(request_id)
+    candidates = {request_id: [] for request_ids in pets.values() for request_id in request_ids}
+    preferences = (Walker.pets.through.objects.filter(pet_id__in=list(pets), walker__user__isnull=False)
+                   .values_list('pet_id', 'walker__user_id'))
+    for pet_id, user_id in preferences.iterator(chunk_size=10000):
+        for request_id in pets[pet_id]:
+            candidates[request_id].append(user_id)
+
+    walker_ids = {user_id for user_ids in candidates.values() for user_id in user_ids}
+    capacity = dict(Walker.objects.filter(user_id__in=walker_ids).values_list('user_id', 'daily_capacity'))
+    booked = (Request.objects.filter(date=day, available_for_booking=False, walker_id__in=walker_ids)
+              .values('walker_id').annotate(walks=Count('id')).values_list('walker_id', 'walks'))
+    for user_id, walks in booked:
+        capacity[user_id] = max(0, capacity[user_id] - walks)
+    return candidates, capacity
+
+
+def save_assignment(assignment):
+    """
+    Reserves the assigned requests for their walkers in one transaction, a chunk of requests per UPDATE.
+    Like Request.objects.reserve(), only requests that are still open are taken and their owners are notified.
+    :return: The sorted ids of the reserved requests.
+    """
+    items = sorted(assignment.items())
+    written = []
+    with transaction.atomic():
+        for start in range(0, len(items), CHUNK_SIZE):
+            chunk = items[start:start + CHUNK_SIZE]
+            if connection.vendor in ('postgresql', 'sqlite'):
+                reserved = update_from_values(chunk)
+            else:
+                ids = [request_id for request_id, _ in chunk]
+                Request.objects.filter(id__in=ids, available_for_booking=True).update(
+                    available_for_booking=False,
+                    walker_id=Case(*(When(id=request_id, then=Value(walker_id)) for request_id, walker_id in chunk),
+                                   output_field=BigIntegerField()))
+                reserved = [request_id for request_id, walker_id in
+                            Request.objects.filter(id__in=ids).values_list('id', 'walker_id')
+                            if walker_id == assignment[request_id]]
+            if reserved:
+                requests_reserved.send(sender=Request, ids=reserved)
+            OutboxEvent.objects.record_reserved(reserved)
+            written += reserved
+    if written:
+        requests_changed.send(sender=Request, ids=sorted(written))
+    return sorted(written)
+
+
+def update_from_values(chunk):
+    """
+    Reserves a chunk of (request id, walker id) pairs with one UPDATE ... FROM (VALUES ...) RETURNING,
+    which PostgreSQL and SQLite (3.33+) run as a join instead of a CASE evaluated for every row.
+    :return: The ids of the reserved requests.
+    """
+    quote = connection.ops.quote_name
+    table = quote(Request._meta.db_table)
+    available = quote(Request._meta.get_field('available_for_booking').column)
+    walker = quote(Request._meta.get_field('walker').column)
+    values = ', '.join(['(%s, %s)'] * len(chunk))
+    sql = (f'UPDATE {table} SET {available} = %s, {walker} = assigned.walker_id '
+           f'FROM (SELECT column1 AS id, column2 AS walker_id FROM (VALUES {values}) AS chunk) AS assigned '
+           f'WHERE {table}.{quote("id")} = assigned.id AND {table}.{available} '
+           f'RETURNING {table}.{quote("id")}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [False, *(value for pair in chunk for value in pair)])
+        return [request_id for request_id, in cursor.fetchall()]
+
+
+def dispatch(day, dry_run=False):
+    """
+    Assigns the open requests of the day to walkers and, unless dry_run, saves the assignment.
+    :return: A Dispatch with the number of open, assigned and written requests and the ids
+    that were taken by someone else in the meantime.
+    """
+    candidates, capacity = load_day(day)
+    assignment = assign(candidates, capacity)
+    if dry_run:
+        return Dispatch(len(candidates), len(assignment), 0, [])
+    written = save_assignment(assignment)
+    return Dispatch(len(candidates), len(assignment), len(written), sorted(set(assignment) - set(written)))
@@ -0,0 +1,61 @@
+"""
+Streaming export of walk requests, shared by the export view and the export_requests command.
+"""
+import csv
+import json
+from itertools import chain
+
+from Pet_walking.models import ArchivedRequest, Request
+
+COLUMNS = ('id', 'date', 'pet', 'price', 'duration', 'available_for_booking', 'walker')
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """
+    A file-like object that returns what is written instead of storing it, for csv.writer.
+    """
+    def write(self, value):
+        return value
+
+
+def export_rows(date_from=None, date_to=None, chunk_size=CHUNK_SIZE):
+    """
+    Iterates over the requests (optionally limited to a date range) as tuples of COLUMNS,
+    the archived requests first. Pet nickname and walker username are joined in the same query,
+    and rows are fetched chunk_size at a time (with a server-side cursor on Postgres), so memory use stays flat.
+    """
+    querysets = []
+    for requests in (ArchivedRequest.objects.all(), Request.objects.all()):
+        if date_from:
+            requests = requests.filter(date__gte=date_from)
+        if date_to:
+            requests = requests.filter(date__lte=date_to)
+        querysets.append(requests.order_by('id').values_list(
+            'id', 'date', 'pet__nickname', 'price', 'duration', 'available_for_booking', 'walker__username',
+        ).iterator(chunk_size=chunk_size))
+    return chain(*querysets)
+
+
+def csv_lines(rows):
+    """
+    Yields a CSV header followed by one CSV line per row.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    """
+    Yields one JSON object per row and line.
+    """
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), default=str) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'jsonl': (jsonl_lines, 'application/x-ndjson'),
+}
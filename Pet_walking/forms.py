@@ -1,10 +1,51 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from django.db import transaction
-from .models import Owner, User, Walker
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Availability, Owner, User, Walker, SIZES, WEEKDAYS, Request, RequestSeries, Pet
+from .pagination import decode_cursor
 
 
-class OwnerSignUpForm(UserCreationForm):
+class ProfileSignUpMixin:
+    """
+    Registers a user together with his/her profile (Owner or Walker) as one atomic unit.
+
+    The phone number is not checked upfront: its unique constraint rejects a duplicate, which rolls
+    back the whole registration (no user is left without a profile) and is reported as a form error.
+    """
+    profile_model = None
+    profile_fields = ('phone_number',)
+    user_flag = None
+    duplicate_errors = {
+        'username': 'A user with that username already exists.',
+        'phone_number': 'This phone number already exists. Try again!',
+    }
+
+    def data_save(self):
+        """
+        Save the user and his/her profile in one transaction.
+        :return: The saved user object or None if the username or phone number is already taken.
+        """
+        user = super().save(commit=False)
+        user.first_name = self.cleaned_data.get('first_name')
+        user.last_name = self.cleaned_data.get('last_name')
+        setattr(user, self.user_flag, True)
+        profile = self.profile_model(user=user, **{name: self.cleaned_data.get(name) for name in self.profile_fields})
+        field = 'username'
+        try:
+            with transaction.atomic():
+                user.save()
+                field = 'phone_number'
+                # the role flag is already set, so saving the profile does not write the user again
+                profile.save()
+        except IntegrityError:
+            self.add_error(field, self.duplicate_errors[field])
+            return None
+        return user
+
+
+class OwnerSignUpForm(ProfileSignUpMixin, UserCreationForm):
     """
     A form for signing up an owner, extending Django's UserCreationForm with additional required
      fields for first name, last name, city, street, number of flat, and phone number.
@@ -16,30 +57,15 @@ class OwnerSignUpForm(UserCreationForm):
     number_of_flat = forms.CharField(required=True)
     phone_number = forms.CharField(required=True)
 
+    profile_model = Owner
+    user_flag = 'is_owner'
+    profile_fields = ('city', 'street', 'number_of_flat', 'phone_number')
+
     class Meta(UserCreationForm.Meta):
         model = User
 
-    @transaction.atomic
-    def data_save(self):
-        """
-        Save the owner's data and create an Owner object.
-        :return:  The saved user object.
-        """
-        user = super().save(commit=False)
-        user.first_name = self.cleaned_data.get('first_name')
-        user.last_name = self.cleaned_data.get('last_name')
-        user.is_owner = True
-        user.save()
-        owner = Owner.objects.create(user=user)
-        owner.city = self.cleaned_data.get('city')
-        owner.street = self.cleaned_data.get('street')
-        owner.number_of_flat = self.cleaned_data.get('number_of_flat')
-        owner.phone_number = self.cleaned_data.get('phone_number')
-        owner.save()
-        return user
-
 
-class WalkerSignUpForm(UserCreationForm):
+class WalkerSignUpForm(ProfileSignUpMixin, UserCreationForm):
     """
     A form for signing up a walker, extending Django's UserCreationForm with
      additional required fields for first name, last name, and phone number.
@@ -48,28 +74,159 @@ class WalkerSignUpForm(UserCreationForm):
     last_name = forms.CharField(required=True)
     phone_number = forms.CharField(required=True)
 
+    profile_model = Walker
+    user_flag = 'is_walker'
+
     class Meta(UserCreationForm.Meta):
         model = User
 
-    @transaction.atomic
-    def data_save(self):
-        """
-        Save the walker's data and create a Walker object.
-        :return: The saved user object.
-        """
-        user = super().save(commit=False)
-        user.first_name = self.cleaned_data.get('first_name')
-        user.last_name = self.cleaned_data.get('last_name')
-        user.is_walker = True
-        user.save()
-        walker = Walker.objects.create(user=user)
-        walker.phone_number = self.cleaned_data.get('phone_number')
-        walker.save()
-        return user
-
 
 class Requests(forms.Form):
     """
     A form with a single boolean field for marking a walker as available for booking requests.
     """
     available_for_booking = forms.BooleanField(label='Available for Booking', required=False)
+
+
+class RequestSearchForm(forms.Form):
+    """
+    A form validating the query parameters of the open request search.
+    """
+    SORTS = ('date', '-date', 'price', '-price', 'duration', '-duration')
+
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    price_min = forms.IntegerField(required=False)
+    price_max = forms.IntegerField(required=False)
+    duration_min = forms.IntegerField(required=False, min_value=0)
+    duration_max = forms.IntegerField(required=False, min_value=0)
+    size = forms.TypedMultipleChoiceField(choices=SIZES, coerce=int, required=False)
+    sort = forms.ChoiceField(choices=[(sort, sort) for sort in SORTS], required=False)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=100)
+    after = forms.CharField(required=False)
+
+    def filters(self):
+        """
+        Translates the cleaned data into Request queryset lookups.
+        """
+        lookups = {
+            'date_from': 'date__gte', 'date_to': 'date__lte',
+            'price_min': 'price__gte', 'price_max': 'price__lte',
+            'duration_min': 'duration__gte', 'duration_max': 'duration__lte',
+            'size': 'pet__size__in',
+        }
+        return {lookup: self.cleaned_data[name] for name, lookup in lookups.items()
+                if self.cleaned_data[name] not in (None, [])}
+
+    def ordering(self):
+        """
+        Returns the ordering of the results, always ending with the primary key.
+        """
+        sort = self.cleaned_data['sort'] or 'date'
+        return (sort, '-id' if sort.startswith('-') else 'id')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('after') and 'sort' in cleaned_data:
+            fields = [Request._meta.get_field(name.lstrip('-')) for name in self.ordering()]
+            if decode_cursor(cleaned_data['after'], fields) is None:
+                self.add_error('after', 'The cursor does not belong to this search, start from the first page.')
+        return cleaned_data
+
+
+class PetSearchForm(forms.Form):
+    """
+    A form validating the query parameters of the pet search.
+    """
+    q = forms.CharField(max_length=200)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=100)
+
+
+class ExportForm(forms.Form):
+    """
+    A form validating the format and the optional date range of a request export.
+    """
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON lines')], required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or 'csv'
+
+
+class RequestSeriesForm(forms.ModelForm):
+    """
+    A form for creating a recurring walk of one of the owner's pets.
+    """
+    MAX_DAYS = 366
+
+    weekdays = forms.TypedMultipleChoiceField(choices=WEEKDAYS, coerce=int, widget=forms.CheckboxSelectMultiple)
+    start_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    until = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+
+    class Meta:
+        model = RequestSeries
+        fields = ['pet', 'weekdays', 'start_date', 'until', 'price', 'duration']
+
+    def __init__(self, *args, owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['pet'].queryset = Pet.objects.filter(owner=owner).order_by('nickname')
+
+    def clean_weekdays(self):
+        return ','.join(str(day) for day in sorted(self.cleaned_data['weekdays']))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date, until = cleaned_data.get('start_date'), cleaned_data.get('until')
+        if start_date and until:
+            if start_date < timezone.localdate():
+                self.add_error('start_date', 'The series cannot start in the past.')
+            if until < start_date:
+                self.add_error('until', 'The series has to end after it starts.')
+            elif until - start_date > timedelta(days=self.MAX_DAYS):
+                self.add_error('until', f'A series can last at most {self.MAX_DAYS} days.')
+        return cleaned_data
+
+
+class SeriesChangeForm(forms.Form):
+    """
+    A form validating the new price and duration of the upcoming walks of a series.
+    """
+    price = forms.IntegerField(required=False, min_value=0)
+    duration = forms.IntegerField(min_value=1)
+
+
+class AvailabilityForm(forms.ModelForm):
+    """
+    A form for adding a window of days on which the walker is available.
+    """
+    MAX_DAYS = 366
+    # every window is one date range of the matching query
+    MAX_WINDOWS = 20
+
+    start_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    end_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+
+    class Meta:
+        model = Availability
+        fields = ['start_date', 'end_date', 'max_duration']
+        labels = {'max_duration': 'Longest walk'}
+
+    def __init__(self, *args, walker=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instance.walker = walker
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date, end_date = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start_date and end_date:
+            if end_date < timezone.localdate():
+                self.add_error('end_date', 'The window cannot end in the past.')
+            if end_date < start_date:
+                self.add_error('end_date', 'The window has to end after it starts.')
+            elif end_date - start_date > timedelta(days=self.MAX_DAYS):
+                self.add_error('end_date', f'A window can last at most {self.MAX_DAYS} days.')
+        if Availability.objects.filter(walker=self.instance.walker,
+                                       end_date__gte=timezone.localdate()).count() >= self.MAX_WINDOWS:
+            raise forms.ValidationError(f'You can have at most {self.MAX_WINDOWS} upcoming windows.')
+        return cleaned_data
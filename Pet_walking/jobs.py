@@ -0,0 +1,198 @@
+"""
+A small job queue backed by the Job table.
+
+Functions decorated with @task can be enqueued (task_function.delay(**payload) or enqueue(name, ...))
+from views, which then return at once; the run_worker command claims due jobs and runs them.
+delay_once() enqueues a job only if the same one is not due already, for work that catches up
+with everything pending (such as sending the notification outbox) however often it is asked for.
+Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED where the database supports it (PostgreSQL),
+so concurrent workers never wait for each other, and with a conditional UPDATE elsewhere (SQLite).
+A failing job is retried with exponential backoff until it runs out of attempts.
+Finished (done and failed) jobs are kept for KEEP_FINISHED, then run_worker prunes them.
+"""
+import random
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from Pet_walking.models import Job
+
+# name -> function of every registered task
+TASKS = {}
+
+# retry delays: BACKOFF_BASE * 2 ** (attempt - 1) seconds, at most BACKOFF_MAX, with jitter
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+
+# running jobs not finished after this long are considered abandoned by a crashed worker
+STALE_AFTER = timedelta(minutes=30)
+# done and failed jobs are deleted once they finished this long ago
+KEEP_FINISHED = timedelta(days=7)
+
+
+def task(function=None, name=None, max_attempts=5):
+    """
+    Registers a function as a task. The function gets delay(run_at=None, **payload) and
+    delay_once(**payload) attributes that enqueue it, the payload has to be JSON serializable.
+    """
+    def register(function):
+        task_name = name or f'{function.__module__}.{function.__name__}'
+        TASKS[task_name] = function
+
+        def delay(run_at=None, **payload):
+            return enqueue(task_name, run_at=run_at, max_attempts=max_attempts, **payload)
+
+        def delay_once(**payload):
+            return enqueue_once(task_name, max_attempts=max_attempts, **payload)
+
+        function.task_name = task_name
+        function.delay = delay
+        function.delay_once = delay_once
+        return function
+    return register(function) if function else register
+
+
+def enqueue(task_name, run_at=None, max_attempts=5, **payload):
+    """
+    Adds a job for the registered task, due at run_at (now by default).
+    :return: The created Job.
+    """
+    if task_name not in TASKS:
+        raise KeyError(f'Unknown task {task_name}.')
+    return Job.objects.create(task=task_name, payload=payload, run_at=run_at or timezone.now(),
+                              max_attempts=max_attempts)
+
+
+def enqueue_once(task_name, max_attempts=5, **payload):
+    """
+    Adds a job for the registered task due now, unless a job of the task with the same payload is due already.
+    :return: The created or the already queued Job.
+    """
+    queued = Job.objects.filter(task=task_name, status=Job.QUEUED, run_at__lte=timezone.now(),
+                                payload=payload).order_by('id').first()
+    return queued or enqueue(task_name, max_attempts=max_attempts, **payload)
+
+
+def backoff(attempts):
+    """
+    Returns the delay before retrying a job that failed for the attempts-th time.
+    """
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def claim(worker, limit=1):
+    """
+    Takes up to limit due jobs for the worker and marks them as running.
+    :return: The claimed jobs.
+    """
+    now = timezone.now()
+    token = f'{worker}:{uuid.uuid4().hex[:12]}'
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    claimed = Job.objects.filter(status=Job.QUEUED)
+    if connection.features.has_select_for_update_skip_locked:
+        # the rows stay locked until the UPDATE commits, other workers skip them
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            claimed.filter(id__in=ids).update(status=Job.RUNNING, locked_by=token, locked_at=now,
+                                              attempts=F('attempts') + 1)
+    else:
+        # no row locks: workers may pick the same ids, the conditional UPDATE gives each to one of them.
+        # Both statements run on their own, a read upgraded to a write in one SQLite transaction
+        # fails at once with "database is locked" instead of waiting for the other writers.
+        ids = list(due.values_list('id', flat=True)[:limit])
+        claimed.filter(id__in=ids).update(status=Job.RUNNING, locked_by=token, locked_at=now,
+                                          attempts=F('attempts') + 1)
+    if not ids:
+        return []
+    return list(Job.objects.filter(id__in=ids, locked_by=token, status=Job.RUNNING).order_by('run_at', 'id'))
+
+
+def run(job):
+    """
+    Runs a claimed job and records the outcome: done, queued again with a backoff or failed.
+    :return: The new status of the job.
+    """
+    try:
+        function = TASKS[job.task]
+        function(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            Job.objects.filter(id=job.id).update(status=Job.QUEUED, locked_by='', locked_at=None, last_error=error,
+                                                 run_at=timezone.now() + backoff(job.attempts))
+            return Job.QUEUED
+        Job.objects.filter(id=job.id).update(status=Job.FAILED, finished_at=timezone.now(), last_error=error)
+        return Job.FAILED
+    Job.objects.filter(id=job.id).update(status=Job.DONE, finished_at=timezone.now())
+    return Job.DONE
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """
+    Queues again the jobs left running by workers that stopped (their attempt stays counted).
+    :return: The number of requeued jobs.
+    """
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - older_than).update(
+        status=Job.QUEUED, locked_by='', locked_at=None)
+
+
+def prune(older_than=KEEP_FINISHED):
+    """
+    Deletes the done and failed jobs that finished more than older_than ago.
+    :return: The number of deleted jobs.
+    """
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED],
+                                    finished_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+class WorkerStats:
+    """
+    Thread-safe counters of the jobs run by a worker.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outcomes = {Job.DONE: 0, Job.QUEUED: 0, Job.FAILED: 0}
+        self.run_time = 0.0
+        self.wait_time = 0.0
+
+    def record(self, status, run_time, wait_time):
+        with self.lock:
+            self.outcomes[status] += 1
+            self.run_time += run_time
+            self.wait_time += wait_time
+
+    def summary(self, elapsed):
+        """
+        Returns a line with the throughput and outcomes of the jobs run in elapsed seconds.
+        """
+        with self.lock:
+            jobs = sum(self.outcomes.values())
+            return (f'{jobs} jobs in {elapsed:.1f} s ({jobs / elapsed if elapsed else 0:.1f} jobs/s): '
+                    f'{self.outcomes[Job.DONE]} done, {self.outcomes[Job.QUEUED]} to retry, '
+                    f'{self.outcomes[Job.FAILED]} failed, mean run {self.run_time / jobs * 1000 if jobs else 0:.1f} ms, '
+                    f'mean wait {self.wait_time / jobs if jobs else 0:.2f} s')
+
+
+def render_metrics():
+    """
+    Returns the queue state in the Prometheus text format: queued and running jobs by task and status
+    and the age of the oldest due job. Finished jobs are left out, they pile up until they are pruned.
+    """
+    lines = ['# HELP pet_walking_jobs Queued and running jobs, by task and status.',
+             '# TYPE pet_walking_jobs gauge']
+    for row in (Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING]).values('task', 'status')
+                .annotate(jobs=Count('id')).order_by('task', 'status')):
+        lines.append(f'pet_walking_jobs{{task="{row["task"]}",status="{row["status"]}"}} {row["jobs"]}')
+    oldest = Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now()).aggregate(oldest=Min('run_at'))
+    age = (timezone.now() - oldest['oldest']).total_seconds() if oldest['oldest'] else 0
+    lines += ['# HELP pet_walking_jobs_oldest_due_seconds How long the oldest due job has been waiting.',
+              '# TYPE pet_walking_jobs_oldest_due_seconds gauge',
+              f'pet_walking_jobs_oldest_due_seconds {age}']
+    return '\n'.join(lines) + '\n'
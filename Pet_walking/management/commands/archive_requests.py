@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Pet_walking.retention import BATCH_SIZE, archive
+
+
+class Command(BaseCommand):
+    """
+    Moves past walk requests to the archive table (see Pet_walking.retention).
+
+    Meant to be run periodically (e.g. nightly from cron); every batch is its own short
+    transaction, so the site keeps working while a large backlog is moved.
+    """
+    help = 'Archives walk requests older than --keep-days days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=7, help='Days of history kept in the request table.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['keep_days'] < 0:
+            raise CommandError('--keep-days cannot be negative.')
+        before = timezone.localdate() - timedelta(days=options['keep_days'])
+        start = time.perf_counter()
+        total = archive(before, batch_size=options['batch_size'],
+                        progress=lambda moved: self.stdout.write(f'{moved} requests archived...'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {total} requests dated before {before} in {time.perf_counter() - start:.1f} s.'))
@@ -0,0 +1,108 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from Pet_walking.benchmarking import measure, summarize
+from Pet_walking.models import ArchivedRequest, Pet, Request, User
+from Pet_walking.retention import archive
+from Pet_walking.seeding import DAYS, insert_rows, seed
+
+
+class Command(BaseCommand):
+    """
+    Measures the hot Request queries while history grows, first with the past requests moved to
+    the archive after every step, then with the same amount of history left in the Request table.
+
+    Run it against a scratch database: it inserts (and archives) a lot of rows.
+    """
+    help = 'Benchmarks the hot request queries with and without archiving as history grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200000, help='Requests seeded around today.')
+        parser.add_argument('--pets', type=int, default=20000)
+        parser.add_argument('--history', type=int, default=200000, help='Past requests added per step.')
+        parser.add_argument('--steps', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse the rows already in the database.')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.stdout.write(f"Seeding {options['requests']} requests...")
+            seed(owners=options['pets'] // 5, walkers=max(1, options['pets'] // 20), pets=options['pets'],
+                 requests=options['requests'])
+        today = timezone.localdate()
+        archive(today)
+        self.pet_ids = list(Pet.objects.order_by('id').values_list('id', flat=True))
+        self.walker_ids = list(User.objects.filter(is_walker=True).order_by('id').values_list('id', flat=True))
+        self.generator = random.Random(0)
+        # history is dated before anything seed() writes, every added row gets the next (pet, date) pair
+        self.first_day, self.added = today - timedelta(days=DAYS), 0
+        walker = User.objects.get(id=self.walker_ids[0])
+        queries = {
+            'open requests by date': lambda: Request.objects.filter(
+                available_for_booking=True, date__gte=today).order_by('date', 'id')[:50],
+            'open one hour walks by price': lambda: Request.objects.filter(
+                available_for_booking=True, date__gte=today, duration=1).order_by('price', 'id')[:50],
+            'open requests ahead, count': lambda: [Request.objects.filter(
+                available_for_booking=True, date__gte=today).count()],
+            "walker's upcoming walks": lambda: Request.objects.filter(
+                walker=walker, date__gte=today).order_by('date', 'id')[:50],
+        }
+
+        for mode in ('archived', 'kept'):
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== history {mode}'))
+            for step in range(1, options['steps'] + 1):
+                self.add_history(options['history'])
+                line = f'{step * options["history"]} past requests'
+                if mode == 'archived':
+                    start = time.perf_counter()
+                    moved = archive(today)
+                    line += f' (archived {moved} in {time.perf_counter() - start:.1f} s)'
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                size = self.table_size(Request)
+                self.stdout.write(line + f': {Request.objects.count()} in Request'
+                                         f'{f" ({size / 2 ** 20:.1f} MB with indexes)" if size else ""}, '
+                                         f'{ArchivedRequest.objects.count()} archived')
+                for name, build in queries.items():
+                    stats = summarize(measure(lambda: list(build()), options['repeat']))
+                    self.stdout.write(f"  {name}: p50 {stats['p50']:.2f} ms, p95 {stats['p95']:.2f} ms")
+
+    def table_size(self, model):
+        """
+        Returns the bytes taken by the model's table and its indexes, None when the database cannot tell.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_total_relation_size(%s)', [model._meta.db_table])
+            elif connection.vendor == 'sqlite':
+                try:
+                    cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name IN '
+                                   '(SELECT name FROM sqlite_master WHERE tbl_name = %s)', [model._meta.db_table])
+                except DatabaseError:
+                    # SQLite built without the dbstat table
+                    return None
+            else:
+                return None
+            return cursor.fetchone()[0]
+
+    def add_history(self, count):
+        """
+        Inserts count past requests, 70% of them walked and the rest left open.
+        """
+        def rows():
+            for number in range(self.added, self.added + count):
+                reserved = self.generator.random() < 0.7
+                yield (self.pet_ids[number % len(self.pet_ids)],
+                       str(self.first_day - timedelta(days=number // len(self.pet_ids))),
+                       self.generator.randrange(10, 200), self.generator.randrange(1, 4), not reserved,
+                       self.generator.choice(self.walker_ids) if reserved else None)
+
+        with transaction.atomic():
+            insert_rows(Request, ['pet_id', 'date', 'price', 'duration', 'available_for_booking', 'walker_id'],
+                        rows())
+        self.added += count
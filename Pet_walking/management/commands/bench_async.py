@@ -0,0 +1,105 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from Pet_walking.benchmarking import summarize
+from Pet_walking.models import User
+
+
+class Command(BaseCommand):
+    """
+    Compares concurrent throughput of the sync listing views served by the WSGI application
+    (My_project.wsgi) on a thread pool with their async versions served by the ASGI application
+    (My_project.asgi) on one event loop.
+
+    Uses the users and rows already in the database (see bench_indexes/bench_search for seeding).
+    """
+    help = 'Load tests the listing views under WSGI and ASGI.'
+
+    routes = (
+        ('owner', 'my_pets_view', 'async_my_pets_view'),
+        ('owner', 'owner_requests_view', 'async_owner_requests_view'),
+        ('walker', 'all_created_requests', 'async_all_created_requests'),
+        ('walker', 'selected_requests', 'async_selected_requests'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per route and server.')
+        parser.add_argument('--concurrency', type=int, default=32)
+
+    def handle(self, *args, **options):
+        from My_project.asgi import application as asgi_application
+        from My_project.wsgi import application as wsgi_application
+
+        cookies = {}
+        for role in ('owner', 'walker'):
+            client = Client()
+            client.force_login(User.objects.filter(**{f'is_{role}': True}).earliest('id'))
+            cookies[role] = f"sessionid={client.cookies['sessionid'].value}"
+        connection.close()
+
+        for role, sync_name, async_name in self.routes:
+            wsgi = self.run_wsgi(wsgi_application, reverse(sync_name), cookies[role], options)
+            asgi = asyncio.run(self.run_asgi(asgi_application, reverse(async_name), cookies[role], options))
+            for server, (elapsed, latencies) in (('WSGI', wsgi), ('ASGI', asgi)):
+                stats = summarize(latencies)
+                self.stdout.write(f"{server} {sync_name}: {len(latencies) / elapsed:.1f} req/s, "
+                                  f"p50 {stats['p50']:.2f} ms, p95 {stats['p95']:.2f} ms")
+
+    def run_wsgi(self, application, path, cookie, options):
+        """
+        Calls the WSGI application from a pool of threads, like a threaded WSGI server would.
+        """
+        def call(_):
+            environ = {'PATH_INFO': path, 'HTTP_COOKIE': cookie, 'HTTP_HOST': 'localhost',
+                       'wsgi.input': BytesIO()}
+            setup_testing_defaults(environ)
+            statuses = []
+            start = time.perf_counter()
+            body = application(environ, lambda status, headers: statuses.append(status))
+            b''.join(body)
+            body.close()
+            if not statuses[0].startswith('200'):
+                raise RuntimeError(f'{path} answered {statuses[0]}')
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            latencies = list(pool.map(call, range(options['requests'])))
+        return time.perf_counter() - start, latencies
+
+    async def run_asgi(self, application, path, cookie, options):
+        """
+        Calls the ASGI application with at most `concurrency` requests in flight on one event loop.
+        """
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'root_path': '', 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+        }
+
+        async def call():
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start' and message['status'] != 200:
+                    raise RuntimeError(f"{path} answered {message['status']}")
+
+            async with semaphore:
+                start = time.perf_counter()
+                await application(dict(scope), receive, send)
+                return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(call() for _ in range(options['requests'])))
+        return time.perf_counter() - start, latencies
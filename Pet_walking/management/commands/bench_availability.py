@@ -0,0 +1,79 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Pet_walking.benchmarking import measure, summarize
+from Pet_walking.models import Availability, Request, User
+from Pet_walking.pagination import KeysetPage
+from Pet_walking.seeding import seed
+
+
+class Command(BaseCommand):
+    """
+    Gives every walker a few random availability windows and measures how fast the fitting open
+    requests are found: one date range per window against scanning every open request.
+    """
+    help = 'Benchmarks matching open requests to walker availability windows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--walkers', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=1000000)
+        parser.add_argument('--pets', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse the rows already in the database.')
+        parser.add_argument('--sample', type=int, default=500, help='Walkers whose matches are measured.')
+        parser.add_argument('--scan-sample', type=int, default=20, help='Walkers measured with the full scan.')
+        parser.add_argument('--explain', action='store_true', help='Print the plan of one matching query.')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.stdout.write(f"Seeding {options['walkers']} walkers and {options['requests']} requests...")
+            seed(owners=options['pets'] // 5, walkers=options['walkers'], pets=options['pets'],
+                 requests=options['requests'], random_seed=options['seed'])
+        generator = random.Random(options['seed'])
+        walker_ids = list(User.objects.filter(is_walker=True).order_by('id').values_list('id', flat=True))
+        self.create_windows(walker_ids, generator)
+        sample = generator.sample(walker_ids, min(options['sample'], len(walker_ids)))
+        open_requests = Request.objects.filter(available_for_booking=True)
+
+        def first_page(walker_id):
+            windows = Availability.objects.filter(walker_id=walker_id).windows()
+            return KeysetPage(open_requests.fitting(windows), size=50).rows
+
+        def all_matches(walker_id):
+            return open_requests.fitting(Availability.objects.filter(walker_id=walker_id).windows()).count()
+
+        def scan(walker_id):
+            windows = Availability.objects.filter(walker_id=walker_id).windows()
+            return sum(1 for date, duration in open_requests.filter(date__gte=timezone.localdate())
+                       .values_list('date', 'duration').iterator(chunk_size=10000)
+                       if any(start <= date <= end and duration <= longest for start, end, longest in windows))
+
+        for name, function, walkers in (('first page, date ranges', first_page, sample),
+                                        ('all matches, date ranges', all_matches, sample),
+                                        ('all matches, scanning open requests', scan,
+                                         sample[:options['scan_sample']])):
+            samples = [measure(lambda: function(walker_id))[0] for walker_id in walkers]
+            stats = summarize(samples)
+            self.stdout.write(f"{name} ({len(walkers)} walkers): p50 {stats['p50']:.2f} ms, "
+                              f"p95 {stats['p95']:.2f} ms, p99 {stats['p99']:.2f} ms")
+        if options['explain'] and sample:
+            windows = Availability.objects.filter(walker_id=sample[0]).windows()
+            self.stdout.write(KeysetPage(open_requests.fitting(windows), size=50).page_queryset().explain())
+
+    def create_windows(self, walker_ids, generator):
+        """
+        Replaces the windows of the walkers with one to three windows of 2-14 days in the next 120 days.
+        """
+        today = timezone.localdate()
+        Availability.objects.filter(walker_id__in=walker_ids).delete()
+        windows = []
+        for walker_id in walker_ids:
+            for _ in range(generator.randint(1, 3)):
+                start = today + timedelta(days=generator.randrange(120))
+                windows.append(Availability(walker_id=walker_id, start_date=start,
+                                            end_date=start + timedelta(days=generator.randrange(2, 15)),
+                                            max_duration=generator.randint(1, 3)))
+        Availability.objects.bulk_create(windows, batch_size=10000)
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from Pet_walking.benchmarking import measure, summarize
+from Pet_walking.models import Pet, Request, User
+from Pet_walking.seeding import seed
+
+
+class Command(BaseCommand):
+    """
+    Seeds requests and compares the plans and timings of the hot Request queries
+    without and with the indexes declared on Pet and Request.
+
+    Run it against a scratch database: it inserts the dataset and temporarily drops indexes.
+    """
+    help = 'Benchmarks the Request hot-path queries without and with their indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000000)
+        parser.add_argument('--pets', type=int, default=100000)
+        parser.add_argument('--owners', type=int, default=20000)
+        parser.add_argument('--walkers', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse the rows already in the database.')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.stdout.write(f"Seeding {options['requests']} requests...")
+            seed(owners=options['owners'], walkers=options['walkers'], pets=options['pets'],
+                 requests=options['requests'])
+
+        owner = User.objects.filter(is_owner=True).order_by('id').first()
+        walker = User.objects.filter(is_walker=True).order_by('id').first()
+        queries = {
+            'open requests by date': lambda: Request.objects.filter(
+                available_for_booking=True, date__gte=timezone.localdate()).order_by('date', 'id')[:50],
+            "walker's reservations by date": lambda: Request.objects.filter(
+                walker=walker).order_by('date', 'id')[:50],
+            "owner's pets' requests": lambda: Request.objects.filter(
+                pet__owner=owner).order_by('date', 'id')[:50],
+        }
+
+        indexes = [(Pet, index) for index in Pet._meta.indexes] + \
+                  [(Request, index) for index in Request._meta.indexes]
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        try:
+            self.report('without indexes', queries, options['repeat'])
+        finally:
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+        self.report('with indexes', queries, options['repeat'])
+
+    def report(self, title, queries, repeat):
+        """
+        Prints the plan and the latency summary (in ms) of every query.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {title}'))
+        for name, build in queries.items():
+            stats = summarize(measure(lambda: list(build()), repeat))
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: p50 {stats['p50']:.2f} ms, p95 {stats['p95']:.2f} ms, mean {stats['mean']:.2f} ms"))
+            self.stdout.write(build().explain())
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from Pet_walking.benchmarking import measure, summarize
+from Pet_walking.models import Pet
+from Pet_walking.search import scan_pets, search_pets, terms
+from Pet_walking.seeding import seed
+
+
+class Command(BaseCommand):
+    """
+    Measures the indexed pet search against a LIKE scan of the pet table, for a few typical queries.
+
+    Run it against a scratch database: it seeds a lot of pets.
+    """
+    help = 'Benchmarks the full-text pet search against scanning the pets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pets', type=int, default=500000)
+        parser.add_argument('--seed', type=int, default=0, help='The seed (0-9) of the generated pets.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse the pets already in the database.')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.stdout.write(f"Seeding {options['pets']} pets...")
+            start = time.perf_counter()
+            seed(owners=max(1, options['pets'] // 5), walkers=1, pets=options['pets'], requests=0,
+                 random_seed=options['seed'])
+            self.stdout.write(f'  seeded (and indexed) in {time.perf_counter() - start:.1f} s')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'{Pet.objects.count()} pets on {connection.vendor}')
+        queries = ('labrador', 'calm senior', 'puppy loves fetch', 'nervous cars barks', f"s{options['seed']}pet4242")
+        for query in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== "{query}"'))
+            found = len(search_pets(query))
+            for name, function in (('index', lambda: search_pets(query)),
+                                   ('scan', lambda: scan_pets(terms(query), 20))):
+                stats = summarize(measure(function, options['repeat']))
+                self.stdout.write(f"  {name}: p50 {stats['p50']:.2f} ms, p95 {stats['p95']:.2f} ms")
+            self.stdout.write(f'  {found} results')
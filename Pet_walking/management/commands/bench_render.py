@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine
+from django.test import RequestFactory
+from django.utils import timezone
+
+from Pet_walking.benchmarking import measure, summarize
+from Pet_walking.models import Pet, Request
+
+
+class Command(BaseCommand):
+    """
+    Renders all_created_requests.html with in-memory rows (no database access) and compares
+    recompiling templates on every render, the cached loader and a warm fragment cache.
+    """
+    help = 'Micro-benchmarks rendering of the walker board template.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        loaders = settings.TEMPLATE_LOADERS
+        dirs = settings.TEMPLATES[0]['DIRS']
+        libraries = {'static': 'django.templatetags.static', 'cache': 'django.templatetags.cache'}
+        engines = {
+            'uncached loader': Engine(dirs=dirs, loaders=loaders, libraries=libraries),
+            'cached loader': Engine(dirs=dirs, loaders=[('django.template.loaders.cached.Loader', loaders)],
+                                    libraries=libraries),
+        }
+        http_request = RequestFactory().get('/')
+        http_request.user = AnonymousUser()
+
+        for rows in options['rows']:
+            pet = Pet(id=1, nickname='Max', breed='Akita', size=1)
+            requests = [Request(id=number, pet=pet, date=timezone.localdate() + timedelta(days=number % 365),
+                                price=30, duration=1) for number in range(rows)]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {rows} rows'))
+            for name, engine in engines.items():
+                def render(version):
+                    context = Context({'requests': requests, 'requests_version': version, 'board': 'all',
+                                       'request': http_request, 'user': http_request.user,
+                                       'csrf_token': 'benchmark'})
+                    engine.get_template('all_created_requests.html').render(context)
+
+                versions = iter(range(options['repeat']))
+                cold = summarize(measure(lambda: render(f'cold-{next(versions)}'), options['repeat']))
+                cache.clear()
+                render('warm')
+                warm = summarize(measure(lambda: render('warm'), options['repeat']))
+                self.stdout.write(f"{name}: fragment miss p50 {cold['p50']:.2f} ms, "
+                                  f"fragment hit p50 {warm['p50']:.2f} ms")
@@ -0,0 +1,56 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from Pet_walking.benchmarking import measure, summarize
+from Pet_walking.models import User
+from Pet_walking.seeding import seed
+
+
+class Command(BaseCommand):
+    """
+    Drives the request search endpoint with random filter combinations and reports its latency.
+    """
+    help = 'Benchmarks the JSON request search endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000000)
+        parser.add_argument('--pets', type=int, default=100000)
+        parser.add_argument('--iterations', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse the rows already in the database.')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.stdout.write(f"Seeding {options['requests']} requests...")
+            seed(owners=options['pets'] // 5, walkers=1000, pets=options['pets'], requests=options['requests'],
+                 random_seed=options['seed'])
+
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(User.objects.filter(is_walker=True).first())
+        url = reverse('request_search')
+        generator = random.Random(options['seed'])
+        today = timezone.localdate()
+        scenarios = {
+            'no filters': lambda: {},
+            'date range': lambda: {'date_from': today + timedelta(days=generator.randrange(30)),
+                                   'date_to': today + timedelta(days=generator.randrange(30, 60))},
+            'price range, by price': lambda: {'price_min': generator.randrange(10, 100),
+                                              'price_max': generator.randrange(100, 200), 'sort': 'price'},
+            'duration, by -duration': lambda: {'duration_min': 2, 'sort': '-duration'},
+            'pet size': lambda: {'size': generator.randrange(4)},
+        }
+        for name, build in scenarios.items():
+            def search():
+                params = build()
+                response = client.get(url, params)
+                following = response.json()['next']
+                if following:
+                    client.get(url, {**params, 'after': following})
+            stats = summarize(measure(search, options['iterations']))
+            self.stdout.write(f"{name}: p50 {stats['p50']:.2f} ms, p95 {stats['p95']:.2f} ms, "
+                              f"p99 {stats['p99']:.2f} ms (first page + next page)")
@@ -0,0 +1,98 @@
+import random
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.test import override_settings
+
+from Pet_walking.benchmarking import summarize
+from Pet_walking.forms import OwnerSignUpForm, WalkerSignUpForm
+from Pet_walking.models import User
+
+
+class Command(BaseCommand):
+    """
+    Registers owners or walkers from a pool of threads, with a share of the signups reusing the phone
+    number of another signup of the run, and reports the throughput and the outcome.
+
+    Every duplicate must be rejected by the unique constraint without leaving a user behind.
+    Password hashing dominates a real signup, so a fast hasher is used unless --real-hasher is given.
+    The registered users are deleted at the end unless --keep is given.
+    """
+    help = 'Benchmarks concurrent owner/walker registration with duplicate phone numbers.'
+
+    forms = {'owner': OwnerSignUpForm, 'walker': WalkerSignUpForm}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--role', choices=sorted(self.forms), default='owner')
+        parser.add_argument('--signups', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duplicates', type=float, default=0.2,
+                            help='Share of signups reusing the phone number of another signup.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--real-hasher', action='store_true', help='Hash passwords with the configured hasher.')
+        parser.add_argument('--keep', action='store_true', help='Keep the registered users.')
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        prefix = f'signup-{secrets.token_hex(3)}-'
+        first_phone = 600000000 + generator.randrange(100000000 - options['signups'])
+        phones = []
+        for index in range(options['signups']):
+            if index and generator.random() < options['duplicates']:
+                phones.append(generator.choice(phones))
+            else:
+                phones.append(f'+48{first_phone + index}')
+        signups = [self.signup_data(options['role'], f'{prefix}{index}', phone) for index, phone in enumerate(phones)]
+
+        hashers = {} if options['real_hasher'] else {
+            'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher']}
+        form_class = self.forms[options['role']]
+        with override_settings(**hashers):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                results = list(pool.map(lambda data: self.register(form_class, data), signups))
+            elapsed = time.perf_counter() - start
+
+        outcomes = [outcome for outcome, _ in results]
+        registered = User.objects.filter(username__startswith=prefix)
+        orphans = registered.filter(**{f'{options["role"]}__isnull': True}).count()
+        stats = summarize([latency for _, latency in results])
+        self.stdout.write(
+            f"{outcomes.count('registered')} registered, {outcomes.count('duplicate')} duplicates rejected "
+            f"(expected {len(phones) - len(set(phones))}), {outcomes.count('error')} database errors, "
+            f"{orphans} users without a profile")
+        self.stdout.write(f"{len(signups) / elapsed:.1f} signups/s, p50 {stats['p50']:.2f} ms, "
+                          f"p95 {stats['p95']:.2f} ms, p99 {stats['p99']:.2f} ms")
+        if not options['keep']:
+            registered.delete()
+
+    def signup_data(self, role, username, phone_number):
+        """
+        Returns the POST data of one registration form.
+        """
+        data = {'username': username, 'password1': 'Bench-passw0rd!', 'password2': 'Bench-passw0rd!',
+                'first_name': 'Bench', 'last_name': 'User', 'phone_number': phone_number}
+        if role == 'owner':
+            data.update(city='Krakow', street='Long', number_of_flat='1')
+        return data
+
+    def register(self, form_class, data):
+        """
+        Validates and saves one registration, like the registration views do.
+        :return: The outcome ('registered', 'duplicate' or 'error') and the latency in milliseconds.
+        """
+        start = time.perf_counter()
+        try:
+            form = form_class(data)
+            if not form.is_valid():
+                outcome = 'duplicate' if 'phone_number' in form.errors else 'error'
+            else:
+                outcome = 'registered' if form.data_save() else 'duplicate'
+        except DatabaseError:
+            outcome = 'error'
+        finally:
+            connection.close()
+        return outcome, (time.perf_counter() - start) * 1000
@@ -0,0 +1,221 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from Pet_walking import urls
+from Pet_walking.benchmarking import summarize
+from Pet_walking.models import Availability, Pet, RequestSeries, User
+from Pet_walking.seeding import seed
+
+# role of the logged in user ('anonymous', 'owner', 'walker' or 'staff'), HTTP method, path and data
+Scenario = namedtuple('Scenario', ['role', 'method', 'path', 'data'])
+
+
+class Command(BaseCommand):
+    """
+    Load tests every route of Pet_walking/urls.py in process with the Django test client.
+
+    Each route is requested by several threads, each with its own logged in client, and the
+    throughput, p50/p95/p99 latency and queries per request are reported and stored as JSON.
+    Routes that only accept POST are driven with a request that leaves the data as it is.
+    A route without a scenario below fails the run, so new routes cannot be left out.
+    """
+    help = 'Benchmarks every Pet_walking route and stores the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owners', type=int, default=100)
+        parser.add_argument('--walkers', type=int, default=100)
+        parser.add_argument('--pets', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse the rows already in the database.')
+        parser.add_argument('--iterations', type=int, default=200, help='Requests per route.')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--routes', nargs='*', help='Only benchmark these route names.')
+        parser.add_argument('--output', default='bench_urls.json')
+        parser.add_argument('--compare', help='A previous JSON result to compare this run with.')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.stdout.write(f"Seeding {options['requests']} requests...")
+            seed(owners=options['owners'], walkers=options['walkers'], pets=options['pets'],
+                 requests=options['requests'], random_seed=options['seed'])
+        users = self.bench_users()
+        scenarios = self.scenarios(users)
+
+        names = [pattern.name for pattern in urls.urlpatterns]
+        missing = set(names) - set(scenarios)
+        if missing:
+            raise CommandError(f"No benchmark scenario for the routes: {', '.join(sorted(missing))}.")
+        unknown = set(options['routes'] or ()) - set(names)
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}.")
+
+        results = {}
+        # the clients send requests to "localhost", which is not allowed by default when DEBUG is off
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'localhost']):
+            for name in names:
+                if options['routes'] and name not in options['routes']:
+                    continue
+                results[name] = self.run_route(scenarios[name], users, options)
+                self.report(name, results[name])
+
+        previous = self.load(options['compare']) if options['compare'] else None
+        Path(options['output']).write_text(json.dumps({
+            'date': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in ('owners', 'walkers', 'pets', 'requests', 'seed',
+                                                      'iterations', 'threads')},
+            'routes': results,
+        }, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+        if previous:
+            self.compare(previous, results)
+
+    def bench_users(self):
+        """
+        Picks a seeded owner (with pets) and walker and a staff user for the export.
+        """
+        owner = User.objects.filter(is_owner=True, pet__isnull=False).order_by('id').first()
+        walker = User.objects.filter(is_walker=True).order_by('id').first()
+        if owner is None or walker is None:
+            raise CommandError('The database has no owner with pets or no walker, run without --skip-seed.')
+        staff, _ = User.objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        return {'anonymous': None, 'owner': owner, 'walker': walker, 'staff': staff}
+
+    def scenarios(self, users):
+        """
+        Returns the scenario of every route name.
+        """
+        today = timezone.localdate()
+        pet = Pet.objects.filter(owner=users['owner']).order_by('id').first()
+        series = RequestSeries.objects.filter(pet=pet).order_by('id').first()
+        if series is None:
+            series = RequestSeries.objects.create(pet=pet, weekdays='0,3', start_date=today + timedelta(days=1),
+                                                  until=today + timedelta(days=90), price=40, duration=1)
+            series.expand()
+        if not Availability.objects.filter(walker=users['walker'], end_date__gte=today).exists():
+            Availability.objects.bulk_create([
+                Availability(walker=users['walker'], start_date=today + timedelta(days=start),
+                             end_date=today + timedelta(days=start + 6), max_duration=2) for start in (0, 14, 28)])
+        export_range = {'date_from': today, 'date_to': today + timedelta(days=30)}
+        return {
+            'home': Scenario('anonymous', 'get', reverse('home'), None),
+            'login': Scenario('anonymous', 'get', reverse('login'), None),
+            'about_us': Scenario('anonymous', 'get', reverse('about_us'), None),
+            'registration': Scenario('anonymous', 'get', reverse('registration'), None),
+            'logout': Scenario('anonymous', 'get', reverse('logout'), None),
+            'add_owner': Scenario('anonymous', 'get', reverse('add_owner'), None),
+            'add_walker': Scenario('anonymous', 'get', reverse('add_walker'), None),
+            'add_pet': Scenario('owner', 'get', reverse('add_pet'), None),
+            'my_pets_view': Scenario('owner', 'get', reverse('my_pets_view'), None),
+            'create_request': Scenario('owner', 'get', reverse('create_request'), None),
+            'series': Scenario('owner', 'get', reverse('series'), None),
+            'series_change': Scenario('owner', 'post', reverse('series_change', args=[series.pk]),
+                                      {'price': series.price, 'duration': series.duration}),
+            'owner_requests_view': Scenario('owner', 'get', reverse('owner_requests_view'), None),
+            'all_created_requests': Scenario('walker', 'get', reverse('all_created_requests'), None),
+            'selected_requests': Scenario('walker', 'get', reverse('selected_requests'), None),
+            'availability': Scenario('walker', 'get', reverse('availability'), None),
+            'availability_matches': Scenario('walker', 'get', reverse('availability_matches'), None),
+            'request_search': Scenario('walker', 'get', reverse('request_search'), {'sort': 'price'}),
+            'pet_search': Scenario('walker', 'get', reverse('pet_search'), {'q': 'calm labrador'}),
+            'export_requests': Scenario('staff', 'get', reverse('export_requests'), export_range),
+            'async_my_pets_view': Scenario('owner', 'get', reverse('async_my_pets_view'), None),
+            'async_owner_requests_view': Scenario('owner', 'get', reverse('async_owner_requests_view'), None),
+            'async_all_created_requests': Scenario('walker', 'get', reverse('async_all_created_requests'), None),
+            'async_selected_requests': Scenario('walker', 'get', reverse('async_selected_requests'), None),
+        }
+
+    def run_route(self, scenario, users, options):
+        """
+        Requests the route `iterations` times from `threads` threads.
+        :return: The measurements of the route as a dict.
+        """
+        latencies, queries, statuses = [], [], {}
+        lock = threading.Lock()
+        counts = [options['iterations'] // options['threads'] + (index < options['iterations'] % options['threads'])
+                  for index in range(options['threads'])]
+
+        def worker(count):
+            client = Client(SERVER_NAME='localhost')
+            if users[scenario.role] is not None:
+                client.force_login(users[scenario.role])
+            call = getattr(client, scenario.method)
+            samples = []
+            try:
+                for _ in range(count):
+                    with CaptureQueriesContext(connection) as captured:
+                        start = time.perf_counter()
+                        response = call(scenario.path, scenario.data)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        samples.append(((time.perf_counter() - start) * 1000, response.status_code))
+                    samples[-1] += (len(captured),)
+            finally:
+                connection.close()
+            with lock:
+                for latency, status, query_count in samples:
+                    latencies.append(latency)
+                    queries.append(query_count)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+        threads = [threading.Thread(target=worker, args=(count,)) for count in counts if count]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        stats = summarize(latencies)
+        return {
+            'method': scenario.method.upper(), 'path': scenario.path, 'role': scenario.role,
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'requests': len(latencies),
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'mean': stats['mean'], 'p50': stats['p50'], 'p95': stats['p95'], 'p99': stats['p99'],
+            'queries_per_request': sum(queries) / len(queries) if queries else 0.0,
+        }
+
+    def report(self, name, result):
+        errors = sum(count for status, count in result['statuses'].items() if int(status) >= 400)
+        line = (f"{name} ({result['method']} as {result['role']}): {result['throughput']:.1f} req/s, "
+                f"p50 {result['p50']:.2f} ms, p95 {result['p95']:.2f} ms, p99 {result['p99']:.2f} ms, "
+                f"{result['queries_per_request']:.1f} queries/request")
+        if errors:
+            self.stdout.write(self.style.WARNING(f"{line}, {errors} error responses {result['statuses']}"))
+        else:
+            self.stdout.write(line)
+
+    def load(self, path):
+        try:
+            return json.loads(Path(path).read_text())
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+    def compare(self, previous, results):
+        """
+        Prints the change of throughput, p95 latency and queries per route against a previous run.
+        """
+        self.stdout.write(f"Compared with the run of {previous.get('date')}:")
+        for name, result in results.items():
+            before = previous.get('routes', {}).get(name)
+            if not before:
+                self.stdout.write(f'{name}: new route')
+                continue
+            throughput = (result['throughput'] / before['throughput'] - 1) * 100 if before['throughput'] else 0.0
+            self.stdout.write(f"{name}: throughput {throughput:+.1f} %, p95 {before['p95']:.2f} -> "
+                              f"{result['p95']:.2f} ms, queries {before['queries_per_request']:.1f} -> "
+                              f"{result['queries_per_request']:.1f}")
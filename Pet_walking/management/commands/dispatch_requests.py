@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from Pet_walking.dispatch import dispatch
+from Pet_walking.tasks import dispatch_day
+
+
+class Command(BaseCommand):
+    """
+    Assigns the open requests of one or more days to walkers (see Pet_walking.dispatch).
+
+    Meant to be run periodically (e.g. from cron every evening for the next day), directly or
+    as background jobs with --enqueue; requests reserved manually in the meantime are left as they are.
+    """
+    help = 'Automatically dispatches the open walk requests of a day to walkers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='The first day to dispatch (YYYY-MM-DD), tomorrow by default.')
+        parser.add_argument('--days', type=int, default=1)
+        parser.add_argument('--dry-run', action='store_true', help='Compute the assignment without saving it.')
+        parser.add_argument('--enqueue', action='store_true', help='Queue a job per day for run_worker instead.')
+
+    def handle(self, *args, **options):
+        day = parse_date(options['date']) if options['date'] else timezone.localdate() + timedelta(days=1)
+        if day is None:
+            raise CommandError(f"Invalid date {options['date']}.")
+        for offset in range(options['days']):
+            if options['enqueue']:
+                job = dispatch_day.delay(day=str(day + timedelta(days=offset)))
+                self.stdout.write(f'{day + timedelta(days=offset)}: queued as job #{job.id}')
+                continue
+            start = time.perf_counter()
+            result = dispatch(day + timedelta(days=offset), dry_run=options['dry_run'])
+            elapsed = time.perf_counter() - start
+            line = (f'{day + timedelta(days=offset)}: {result.assigned} of {result.open} open requests assigned'
+                    f'{" (dry run)" if options["dry_run"] else f", {result.written} saved"} in {elapsed:.2f} s')
+            if result.lost:
+                line += f', {len(result.lost)} were reserved by someone else meanwhile'
+            self.stdout.write(line)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Pet_walking.exports import FORMATS, export_rows
+from Pet_walking.forms import ExportForm
+
+
+class Command(BaseCommand):
+    """
+    Streams all walk requests (with pet and walker) to a file or the standard output.
+    """
+    help = 'Exports walk requests as CSV or JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--date-from')
+        parser.add_argument('--date-to')
+        parser.add_argument('--output', default='-', help='Output file, "-" for the standard output.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        form = ExportForm({'format': options['format'], 'date_from': options['date_from'],
+                           'date_to': options['date_to']})
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        lines, _ = FORMATS[form.cleaned_data['format']]
+        rows = export_rows(form.cleaned_data['date_from'], form.cleaned_data['date_to'], options['chunk_size'])
+        if options['output'] == '-':
+            for line in lines(rows):
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            output.writelines(lines(rows))
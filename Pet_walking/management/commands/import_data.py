@@ -0,0 +1,194 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from Pet_walking.caching import bump_on_commit, pets_scope
+from Pet_walking.models import Pet, Request, SIZES, User, requests_changed, requests_created
+
+# sizes may be given by value or by label
+SIZE_VALUES = {**{str(value): value for value, _ in SIZES}, **{label: value for value, label in SIZES}}
+# columns that have to be strings (or missing), JSONL rows may hold any JSON value
+TEXT_COLUMNS = {'pets': ('nickname', 'breed', 'description', 'owner'), 'requests': ('pet', 'date')}
+
+
+def read_rows(path):
+    """
+    Streams the rows of a CSV (with a header) or JSONL file as (line number, dict) pairs.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if Path(path).suffix.lower() == '.csv':
+            for number, row in enumerate(csv.DictReader(file), start=2):
+                yield number, row
+        else:
+            for number, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError:
+                        yield number, None
+
+
+class Command(BaseCommand):
+    """
+    Imports pets or walk requests from CSV/JSONL files.
+
+    The file is read in chunks. Every chunk is validated with one lookup query per referenced
+    model, then inserted with bulk_create. Pet columns: nickname, breed, description, size, owner
+    (username). Request columns: pet (nickname), date, price, duration.
+    """
+    help = 'Bulk imports pets or walk requests from a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=['pets', 'requests'])
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--rejects', help='Write rejected rows to this JSONL file instead of printing them.')
+
+    def handle(self, *args, **options):
+        if not Path(options['path']).is_file():
+            raise CommandError(f"File {options['path']} does not exist.")
+        import_chunk = self.import_pets if options['model'] == 'pets' else self.import_requests
+        self.seen = set()
+        rejected = []
+        imported = total = 0
+        start = time.perf_counter()
+
+        rows = read_rows(options['path'])
+        while True:
+            chunk = list(islice(rows, options['chunk_size']))
+            if not chunk:
+                break
+            total += len(chunk)
+            valid, chunk_rejected = [], []
+            for number, row in chunk:
+                if not isinstance(row, dict):
+                    chunk_rejected.append((number, row, 'Not a valid row.'))
+                    continue
+                column = next((column for column in TEXT_COLUMNS[options['model']]
+                               if not isinstance(row.get(column, ''), (str, type(None)))), None)
+                if column:
+                    chunk_rejected.append((number, row, f'The {column} has to be text.'))
+                else:
+                    valid.append((number, row))
+            imported += import_chunk(valid, chunk_rejected)
+            rejected += chunk_rejected
+
+        elapsed = time.perf_counter() - start
+        self.report_rejected(rejected, options['rejects'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} of {total} rows in {elapsed:.2f} s '
+            f'({total / elapsed if elapsed else 0:.0f} rows/s), rejected {len(rejected)}.'))
+
+    def import_pets(self, chunk, rejected):
+        """
+        Validates and inserts one chunk of pets.
+        :return: The number of inserted pets.
+        """
+        owners = dict(User.objects.filter(username__in={row.get('owner') for _, row in chunk})
+                      .values_list('username', 'id'))
+        # nicknames are stored stripped, so they are looked up and compared stripped too
+        nicknames = {number: (row.get('nickname') or '').strip() for number, row in chunk}
+        taken = set(Pet.objects.filter(nickname__in=set(nicknames.values())).values_list('nickname', flat=True))
+        pets = []
+        for number, row in chunk:
+            nickname = nicknames[number]
+            if row.get('owner') not in owners:
+                rejected.append((number, row, 'Unknown owner.'))
+                continue
+            if nickname in taken or nickname in self.seen:
+                rejected.append((number, row, 'Dog with this nickname already exists.'))
+                continue
+            size = SIZE_VALUES.get(str(row.get('size') or 0).strip().lower(), row.get('size'))
+            pet = Pet(nickname=nickname, breed=row.get('breed') or '', description=row.get('description') or '',
+                      size=size, owner_id=owners[row['owner']])
+            try:
+                pet.clean_fields(exclude=['owner'])
+            except ValidationError as error:
+                rejected.append((number, row, '; '.join(error.messages)))
+                continue
+            self.seen.add(nickname)
+            pets.append((number, row, pet))
+        inserted = self.insert(Pet, pets, rejected)
+        bump_on_commit(*{pets_scope(pet.owner_id) for pet in inserted})
+        return len(inserted)
+
+    def import_requests(self, chunk, rejected):
+        """
+        Validates and inserts one chunk of walk requests.
+        :return: The number of inserted requests.
+        """
+        # pets are referenced by their nickname, which is stored stripped
+        nicknames = {number: (row.get('pet') or '').strip() for number, row in chunk}
+        pets = dict(Pet.objects.filter(nickname__in=set(nicknames.values())).values_list('nickname', 'id'))
+        requests = []
+        for number, row in chunk:
+            if nicknames[number] not in pets:
+                rejected.append((number, row, 'Unknown pet.'))
+                continue
+            # a price of 0 is kept, only a missing or empty one means no price
+            price = row.get('price')
+            request = Request(pet_id=pets[nicknames[number]], date=row.get('date'),
+                              price=None if price is None or price == '' else price, duration=row.get('duration'))
+            try:
+                request.clean_fields(exclude=['pet', 'walker'])
+            except ValidationError as error:
+                rejected.append((number, row, '; '.join(error.messages)))
+                continue
+            if (request.pet_id, request.date) in self.seen:
+                rejected.append((number, row, 'This pet already has a request on this date.'))
+                continue
+            self.seen.add((request.pet_id, request.date))
+            requests.append((number, row, request))
+
+        taken = set(Request.objects.filter(pet_id__in={request.pet_id for _, _, request in requests},
+                                           date__in={request.date for _, _, request in requests})
+                    .values_list('pet_id', 'date'))
+        new_requests = []
+        for number, row, request in requests:
+            if (request.pet_id, request.date) in taken:
+                rejected.append((number, row, 'This pet already has a request on this date.'))
+            else:
+                new_requests.append((number, row, request))
+        inserted = self.insert(Request, new_requests, rejected, signal=requests_created)
+        if inserted:
+            requests_changed.send(sender=Request, ids=[request.id for request in inserted])
+        return len(inserted)
+
+    def insert(self, model, entries, rejected, signal=None):
+        """
+        Inserts the validated (line number, row, object) entries of a chunk in one transaction,
+        sending the signal (if any) with the new ids inside it.
+        If a concurrent writer took one of the unique values in the meantime, all of them are rejected.
+        :return: The inserted objects.
+        """
+        objects = [instance for _, _, instance in entries]
+        if not objects:
+            return []
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(objects, batch_size=1000)
+                if signal:
+                    signal.send(sender=model, ids=[instance.id for instance in objects])
+        except IntegrityError as error:
+            rejected.extend((number, row, f'Chunk rolled back: {error}') for number, row, _ in entries)
+            return []
+        return objects
+
+    def report_rejected(self, rejected, path):
+        """
+        Writes the rejected rows with their line numbers and reasons to a file or the error output.
+        """
+        rejected.sort(key=lambda item: item[0])
+        if path:
+            with open(path, 'w', encoding='utf-8') as file:
+                for number, row, reason in rejected:
+                    file.write(json.dumps({'line': number, 'reason': reason, 'row': row}, default=str) + '\n')
+        else:
+            for number, row, reason in rejected:
+                self.stderr.write(f'line {number}: {reason}')
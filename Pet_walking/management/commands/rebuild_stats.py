@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Pet_walking import stats
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the request statistics (see Pet_walking.stats) from the current and archived requests,
+    compares them with the incrementally maintained rows and replaces the rows with the recomputed ones.
+    """
+    help = 'Rebuilds the dashboard statistics and reports where they drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare, and fail when the stored statistics differ.')
+        parser.add_argument('--show', type=int, default=10, help='Differences printed.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        expected, actual = stats.recompute(), stats.stored()
+        different = stats.differences(expected, actual)
+        self.stdout.write(f'Recomputed {len(expected)} rows in {time.perf_counter() - start:.1f} s, '
+                          f'{len(different)} differ from the stored statistics.')
+        empty = (0,) * len(stats.FIELDS)
+        for key in different[:options['show']]:
+            self.stdout.write(f'user {key[0]} on {key[1]}: stored {dict(zip(stats.FIELDS, actual.get(key, empty)))}, '
+                              f'expected {dict(zip(stats.FIELDS, expected.get(key, empty)))}')
+        if options['check']:
+            if different:
+                raise CommandError(f'{len(different)} statistics rows differ.')
+            return
+        stats.rebuild(expected)
+        self.stdout.write(self.style.SUCCESS(f'Stored {len(expected)} rows.'))
@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from Pet_walking.jobs import KEEP_FINISHED, WorkerStats, claim, prune, requeue_stale, run
+
+# finished jobs are pruned when the worker starts and then this often (in seconds)
+PRUNE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    """
+    Runs background jobs (see Pet_walking.jobs) from a pool of threads or processes.
+
+    Every worker claims due jobs in batches, runs them and polls the table again when the queue
+    is empty. Throughput is reported every --report-interval seconds and when the worker stops
+    (on SIGINT/SIGTERM, or once the queue is empty with --once). Threads suit jobs waiting on the
+    database or network, processes suit CPU bound jobs (they need the fork start method).
+    Done and failed jobs older than --keep-days are deleted on start and every PRUNE_INTERVAL.
+    """
+    help = 'Runs queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of threads or processes.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--batch-size', type=int, default=1, help='Jobs claimed at once by a worker.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when idle.')
+        parser.add_argument('--report-interval', type=float, default=60.0)
+        parser.add_argument('--once', action='store_true', help='Stop when no job is due.')
+        parser.add_argument('--keep-days', type=float, default=KEEP_FINISHED.days,
+                            help='Days to keep finished jobs for.')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} jobs abandoned by stopped workers.')
+        self.keep = timedelta(days=options['keep_days'])
+        self.prune_finished()
+        name = f'{socket.gethostname()[:50]}:{os.getpid()}'
+        if options['pool'] == 'process':
+            self.run_processes(name, options)
+        else:
+            self.run_threads(name, options)
+
+    def work(self, name, stats, stop, options, supervise=None):
+        """
+        The loop of one worker: claim a batch of due jobs, run them, repeat.
+        :param supervise: An optional function called after every batch and idle wait.
+        """
+        while not stop.is_set():
+            jobs = claim(name, options['batch_size'])
+            if not jobs:
+                if options['once']:
+                    break
+                stop.wait(options['poll_interval'])
+            for job in jobs:
+                start = time.perf_counter()
+                status = run(job)
+                stats.record(status, time.perf_counter() - start, (job.locked_at - job.run_at).total_seconds())
+            if supervise:
+                supervise()
+
+    def work_in_thread(self, name, stats, stop, options):
+        try:
+            self.work(name, stats, stop, options)
+        finally:
+            # every thread has its own database connection
+            connection.close()
+
+    def prune_finished(self):
+        """
+        Deletes the finished jobs older than --keep-days and remembers when.
+        """
+        self.last_prune = time.perf_counter()
+        pruned = prune(self.keep)
+        if pruned:
+            self.stdout.write(f'Pruned {pruned} finished jobs.')
+
+    def prune_when_due(self):
+        if time.perf_counter() - self.last_prune >= PRUNE_INTERVAL:
+            self.prune_finished()
+
+    def stop_on_signals(self, stop):
+        """
+        Makes SIGINT and SIGTERM set the stop event, so the workers finish their current jobs and the
+        final summary is printed.
+        :return: The previous handlers, to be passed to restore_signals().
+        """
+        return {number: signal.signal(number, lambda *_: stop.set()) for number in (signal.SIGINT, signal.SIGTERM)}
+
+    def restore_signals(self, previous):
+        for number, handler in previous.items():
+            signal.signal(number, handler)
+
+    def run_threads(self, name, options):
+        stats, stop = WorkerStats(), threading.Event()
+        start = last_report = time.perf_counter()
+
+        def supervise():
+            nonlocal last_report
+            if time.perf_counter() - last_report >= options['report_interval']:
+                last_report = time.perf_counter()
+                self.stdout.write(stats.summary(last_report - start))
+            self.prune_when_due()
+
+        previous = self.stop_on_signals(stop)
+        try:
+            if options['concurrency'] == 1:
+                # a single worker runs in this thread, on its database connection, and supervises itself
+                self.work(f'{name}:0', stats, stop, options, supervise)
+            else:
+                threads = [threading.Thread(target=self.work_in_thread,
+                                            args=(f'{name}:{index}', stats, stop, options))
+                           for index in range(options['concurrency'])]
+                for thread in threads:
+                    thread.start()
+                while any(thread.is_alive() for thread in threads):
+                    threads[0].join(0.5)
+                    supervise()
+        finally:
+            self.restore_signals(previous)
+        self.stdout.write(self.style.SUCCESS(stats.summary(time.perf_counter() - start)))
+
+    def run_processes(self, name, options):
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        # every process opens its own database connections
+        connections.close_all()
+        processes = [context.Process(target=self.run_process, args=(f'{name}:{index}', stop, options))
+                     for index in range(options['concurrency'])]
+        previous = self.stop_on_signals(stop)
+        try:
+            for process in processes:
+                process.start()
+            while any(process.is_alive() for process in processes):
+                processes[0].join(0.5)
+                self.prune_when_due()
+        finally:
+            self.restore_signals(previous)
+
+    def run_process(self, name, stop, options):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        stats = WorkerStats()
+        start = time.perf_counter()
+        self.work_in_thread(name, stats, stop, options)
+        self.stdout.write(f'{name}: {stats.summary(time.perf_counter() - start)}')
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from Pet_walking import stats
+from Pet_walking.seeding import seed
+
+
+class Command(BaseCommand):
+    """
+    Fills the database with a deterministic synthetic dataset (see Pet_walking.seeding.seed).
+
+    Rows are written with COPY on PostgreSQL and with bulk inserts elsewhere, all users share one
+    precomputed password hash ("password"). Different seeds produce datasets that can coexist.
+    The dashboard statistics are rebuilt afterwards.
+    """
+    help = 'Generates owners, walkers, pets and walk requests for benchmarks and capacity tests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owners', type=int, default=20000)
+        parser.add_argument('--walkers', type=int, default=5000)
+        parser.add_argument('--pets', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=1000000)
+        parser.add_argument('--seed', type=int, default=0, help='0-9, every seed gets its own usernames and phones.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            counts = seed(owners=options['owners'], walkers=options['walkers'], pets=options['pets'],
+                          requests=options['requests'], random_seed=options['seed'],
+                          batch_size=options['batch_size'])
+        except ValueError as error:
+            raise CommandError(error)
+        # the requests were inserted without signals
+        stats.rebuild()
+        elapsed = time.perf_counter() - start
+        rows = sum(counts.values()) + counts['owners'] + counts['walkers']
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {', '.join(f'{count} {name}' for name, count in counts.items())} into {connection.vendor} "
+            f"in {elapsed:.1f} s ({rows / elapsed if elapsed else 0:.0f} rows/s)."))
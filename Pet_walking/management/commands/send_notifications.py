@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Pet_walking.outbox import BATCH_SIZE, drain, load_channels
+
+
+class Command(BaseCommand):
+    """
+    Delivers the notification outbox (see Pet_walking.outbox) to the channels of settings.OUTBOX_CHANNELS.
+
+    Batches are sent back to back while events are pending, the outbox is polled again
+    every --poll-interval seconds once it is empty (or the command stops with --once).
+    """
+    help = 'Sends the pending notifications of the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when idle.')
+        parser.add_argument('--once', action='store_true', help='Stop when no event is pending.')
+
+    def handle(self, *args, **options):
+        channels = load_channels()
+        total_sent = total_failed = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                sent, failed = drain(channels, options['batch_size'])
+                total_sent, total_failed = total_sent + sent, total_failed + failed
+                if failed:
+                    self.stderr.write(f'{failed} events could not be delivered, they will be retried.')
+                if sent + failed < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'{total_sent} events sent, {total_failed} failed '
+                                             f'in {time.perf_counter() - start:.1f} s'))
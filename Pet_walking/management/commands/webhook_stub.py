@@ -0,0 +1,43 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    A local webhook receiver for developing the outbox WebhookChannel: prints every event once,
+    redelivered events (known keys) are only counted.
+    """
+    help = 'Runs a local stub receiving the notification webhook.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8001)
+
+    def handle(self, *args, **options):
+        command, seen = self, set()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                events = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['events']
+                duplicates = 0
+                for event in events:
+                    if event['key'] in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(event['key'])
+                    command.stdout.write(f"{event['kind']} {json.dumps(event['payload'])}")
+                if duplicates:
+                    command.stdout.write(f'{duplicates} events received again')
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(f"Listening on http://127.0.0.1:{options['port']}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,216 @@
+"""
+Per-view performance metrics: request latency histograms, database queries and time, template render time.
+
+MetricsMiddleware measures every request and adds a Server-Timing header to the response.
+The totals of the process are kept in memory (every server process has its own) and are
+exposed in the Prometheus text format by MetricsView.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+# upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# timings of the request being handled (None outside of MetricsMiddleware)
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Database and template time collected while one request is handled.
+    """
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+class ViewStats:
+    """
+    Totals of one view: a latency histogram and the summed database and template time.
+    """
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.responses = {}
+
+
+class Registry:
+    """
+    Thread-safe in-memory store of the ViewStats of every view.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, method, status, duration, timings):
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.buckets[bisect_left(BUCKETS, duration)] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += timings.queries
+            stats.db_time += timings.db_time
+            stats.template_time += timings.template_time
+            stats.responses[method, status] = stats.responses.get((method, status), 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            views = {view: stats for view, stats in sorted(self.views.items())}
+            lines = [
+                '# HELP pet_walking_request_duration_seconds Time spent handling requests, by view.',
+                '# TYPE pet_walking_request_duration_seconds histogram',
+            ]
+            for view, stats in views.items():
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, '+Inf'), stats.buckets):
+                    cumulative += count
+                    lines.append(f'pet_walking_request_duration_seconds_bucket{{view="{escape(view)}",le="{bound}"}} '
+                                 f'{cumulative}')
+                lines.append(f'pet_walking_request_duration_seconds_sum{{view="{escape(view)}"}} {stats.duration}')
+                lines.append(f'pet_walking_request_duration_seconds_count{{view="{escape(view)}"}} {stats.count}')
+            lines += ['# HELP pet_walking_responses_total Responses, by view, method and status code.',
+                      '# TYPE pet_walking_responses_total counter']
+            for view, stats in views.items():
+                for (method, status), count in sorted(stats.responses.items()):
+                    lines.append(f'pet_walking_responses_total{{view="{escape(view)}",method="{method}",'
+                                 f'status="{status}"}} {count}')
+            for name, attribute, description in (
+                    ('db_queries_total', 'queries', 'Database queries executed'),
+                    ('db_duration_seconds_total', 'db_time', 'Time spent in database queries'),
+                    ('template_duration_seconds_total', 'template_time', 'Time spent rendering templates')):
+                lines += [f'# HELP pet_walking_{name} {description}, by view.',
+                          f'# TYPE pet_walking_{name} counter']
+                lines += [f'pet_walking_{name}{{view="{escape(view)}"}} {getattr(stats, attribute)}'
+                          for view, stats in views.items()]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding the query and its duration to the current request's timings.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_time += time.perf_counter() - start
+        timings.queries += 1
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """
+    Installs time_query on every database connection (once, connections are reopened per request).
+    Being permanent, it also sees the queries that async views run in worker threads.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = current_timings.get()
+        if timings is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, measuring how long the templates take to render.
+    Lazy querysets evaluated in a template count as both template and database time.
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, database queries and time and template time of every request by view name
+    and reports them to the client in a Server-Timing header. Should be the first middleware.
+    Streaming responses are measured until their content starts to be sent. Works in both sync and
+    async chains, the timings context variable is carried into the threads of sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.record(request, response, time.perf_counter() - start, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.record(request, response, time.perf_counter() - start, timings)
+
+    def record(self, request, response, duration, timings):
+        match = request.resolver_match
+        view = (match.view_name or match.route) if match else 'unresolved'
+        registry.observe(view, request.method, response.status_code, duration, timings)
+        response['Server-Timing'] = (f'app;dur={duration * 1000:.1f}, '
+                                     f'db;dur={timings.db_time * 1000:.1f};desc="{timings.queries} queries", '
+                                     f'tpl;dur={timings.template_time * 1000:.1f}')
+        return response
@@ -0,0 +1,48 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+
+def store_role(session, user):
+    """
+    Saves the user's role ('owner', 'walker' or None) and profile id in the session.
+    With ProfileModelBackend the profiles are already loaded, so no query is made.
+    """
+    for role in ('owner', 'walker'):
+        profile = getattr(user, role, None)
+        if profile is not None:
+            session['user_type'] = role
+            session['user_id'] = profile.id
+            return
+    session['user_type'] = None
+    session['user_id'] = None
+
+
+class UserRoleMiddleware:
+    """
+    Makes sure the role and profile id of an authenticated user are cached in the session
+    (they are normally stored on login, this covers sessions created before).
+    Must come after AuthenticationMiddleware. Works in both sync and async chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self.store_missing_role(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # loading the session and the user may query the database
+        await sync_to_async(self.store_missing_role)(request)
+        return await self.get_response(request)
+
+    @staticmethod
+    def store_missing_role(request):
+        if 'user_type' not in request.session and request.user.is_authenticated:
+            store_role(request.session, request.user)
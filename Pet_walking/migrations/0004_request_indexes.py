@@ -0,0 +1,25 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0003_alter_request_walker'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['owner', 'nickname'], name='pet_owner_nickname_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('available_for_booking', True)), fields=['date', 'id'], name='request_open_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['walker', 'date', 'id'], name='request_walker_date_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0004_request_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['size', 'id'], name='pet_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('available_for_booking', True)), fields=['price', 'id'], name='request_open_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('available_for_booking', True)), fields=['duration', 'id'], name='request_open_duration_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0005_request_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekdays', models.CharField(help_text='Comma separated weekday numbers, 0 is Monday', max_length=13)),
+                ('start_date', models.DateField()),
+                ('until', models.DateField()),
+                ('price', models.IntegerField(null=True)),
+                ('duration', models.PositiveIntegerField()),
+                ('pet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='Pet_walking.pet')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='Pet_walking.requestseries'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0006_request_series'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='owner',
+            name='user',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='owner', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='walker',
+            name='user',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='walker', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.6 on 2026-10-18 03:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0007_fix_profile_related_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Availability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('max_duration', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('available_for_booking', True)), fields=['date', 'duration'], name='request_open_date_duration_idx'),
+        ),
+        migrations.AddField(
+            model_name='availability',
+            name='walker',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(fields=['walker', 'end_date'], name='availability_walker_end_idx'),
+        ),
+    ]
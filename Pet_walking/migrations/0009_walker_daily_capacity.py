@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0008_availability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='walker',
+            name='daily_capacity',
+            field=models.PositiveSmallIntegerField(default=3, help_text='Most walks a day the walker can take'),
+        ),
+    ]
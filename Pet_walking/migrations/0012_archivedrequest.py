@@ -0,0 +1,38 @@
+# Generated by Django 4.1.6 on 2026-10-18 03:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0011_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRequest',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('price', models.IntegerField(null=True)),
+                ('duration', models.PositiveIntegerField()),
+                ('available_for_booking', models.BooleanField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('pet', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_requests', to='Pet_walking.pet')),
+                ('series', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Pet_walking.requestseries')),
+                ('walker', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_walks', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedrequest',
+            index=models.Index(fields=['pet', 'date', 'id'], name='archived_pet_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedrequest',
+            index=models.Index(fields=['walker', 'date', 'id'], name='archived_walker_date_idx'),
+        ),
+    ]
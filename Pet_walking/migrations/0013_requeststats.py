@@ -0,0 +1,44 @@
+# Generated by Django 4.1.6 on 2026-10-18 03:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from Pet_walking import stats
+
+
+def backfill(apps, schema_editor):
+    """
+    Fills the statistics from the existing requests, so the counters start from the real values.
+    """
+    stats.rebuild(stats.recompute([apps.get_model('Pet_walking', 'Request'),
+                                   apps.get_model('Pet_walking', 'ArchivedRequest')]),
+                  stats_model=apps.get_model('Pet_walking', 'RequestStats'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0012_archivedrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('open_requests', models.IntegerField(default=0)),
+                ('reserved_requests', models.IntegerField(default=0)),
+                ('spend', models.BigIntegerField(default=0)),
+                ('walks', models.IntegerField(default=0)),
+                ('earnings', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='request_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='requeststats',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='request_stats_user_date_uniq'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
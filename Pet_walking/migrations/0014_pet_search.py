@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# the index as it was created by this migration, Pet_walking.search keeps its own copy
+# (and repairs the SQLite triggers after later migrations rebuild the pet table)
+FTS_TABLE = 'pet_search'
+VECTOR_COLUMN = 'search_vector'
+VECTOR_INDEX = 'pet_search_vector_idx'
+TRIGGERS = {
+    'pet_search_insert': "AFTER INSERT ON {pet} BEGIN "
+                         "INSERT INTO {fts}(rowid, nickname, breed, description) "
+                         "VALUES (new.id, new.nickname, new.breed, new.description); END",
+    'pet_search_delete': "AFTER DELETE ON {pet} BEGIN "
+                         "INSERT INTO {fts}({fts}, rowid, nickname, breed, description) "
+                         "VALUES ('delete', old.id, old.nickname, old.breed, old.description); END",
+    'pet_search_update': "AFTER UPDATE OF nickname, breed, description ON {pet} BEGIN "
+                         "INSERT INTO {fts}({fts}, rowid, nickname, breed, description) "
+                         "VALUES ('delete', old.id, old.nickname, old.breed, old.description); "
+                         "INSERT INTO {fts}(rowid, nickname, breed, description) "
+                         "VALUES (new.id, new.nickname, new.breed, new.description); END",
+}
+
+
+def install(apps, schema_editor):
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    pet = quote(apps.get_model('Pet_walking', 'Pet')._meta.db_table)
+    if connection.vendor == 'postgresql':
+        document = ' || '.join(f"setweight(to_tsvector('english', coalesce({quote(field)}, '')), '{weight}')"
+                               for field, weight in (('nickname', 'A'), ('breed', 'B'), ('description', 'C')))
+        schema_editor.execute(f'ALTER TABLE {pet} ADD COLUMN IF NOT EXISTS {VECTOR_COLUMN} tsvector '
+                              f'GENERATED ALWAYS AS ({document}) STORED')
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {VECTOR_INDEX} ON {pet} USING GIN ({VECTOR_COLUMN})')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(nickname, breed, "
+                              f"description, content={pet}, content_rowid='id', tokenize='porter unicode61')")
+        for name, body in TRIGGERS.items():
+            schema_editor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body.format(pet=pet, fts=FTS_TABLE)}')
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall(apps, schema_editor):
+    connection = schema_editor.connection
+    pet = connection.ops.quote_name(apps.get_model('Pet_walking', 'Pet')._meta.db_table)
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {VECTOR_INDEX}')
+        schema_editor.execute(f'ALTER TABLE {pet} DROP COLUMN IF EXISTS {VECTOR_COLUMN}')
+    elif connection.vendor == 'sqlite':
+        for name in TRIGGERS:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the full-text index of pets (see Pet_walking.search): a generated tsvector column with
+    a GIN index on PostgreSQL, an FTS5 table kept in sync by triggers on SQLite. The DDL is
+    written out here, so the migration does not change with the search module or the Pet model.
+    """
+
+    dependencies = [
+        ('Pet_walking', '0013_requeststats'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pet_walking', '0014_pet_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status__in', ['done', 'failed'])), fields=['finished_at'], name='job_finished_at_idx'),
+        ),
+    ]
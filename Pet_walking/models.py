@@ -1,9 +1,68 @@
-from django.db import models
+from collections import namedtuple
+from datetime import timedelta
+from django.db import connections, models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 from django.contrib.auth.models import AbstractUser, User
 
 
-class User(AbstractUser):
+class TrackedFieldsMixin:
+    """
+    Remembers the field values a model instance was loaded or last saved with.
+
+    A later save() of an existing instance writes only the fields that changed since
+    (using update_fields) and does not touch the database at all when nothing changed.
+    Saves with explicit update_fields or positional arguments, of new instances and of copies
+    (with a cleared or changed primary key) behave as usual.
+    """
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _snapshot(self, field_names=None):
+        """
+        Remembers the current values of the given fields (all loaded fields by default).
+        """
+        deferred = self.get_deferred_fields()
+        if field_names is not None:
+            field_names = {self._meta.get_field(name).attname for name in field_names}
+        values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+                  if field.attname not in deferred and (field_names is None or field.attname in field_names)}
+        self._loaded_values = {**(self._loaded_values or {}), **values}
+
+    def changed_fields(self):
+        """
+        Returns the attnames of the fields modified since the instance was loaded or saved,
+        or None when this is not known (a new instance).
+        """
+        if self._state.adding or self._loaded_values is None:
+            return None
+        return [field.attname for field in self._meta.concrete_fields
+                if field.attname in self._loaded_values
+                and getattr(self, field.attname) != self._loaded_values[field.attname]]
+
+    def save(self, *args, **kwargs):
+        if not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            changed = self.changed_fields()
+            if changed == []:
+                return
+            # a copy (pk set to None) or a changed pk has to be saved in full, as an insert
+            if changed is not None and self.pk is not None and self._meta.pk.attname not in changed:
+                kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self._snapshot(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._snapshot(fields)
+
+
+class User(TrackedFieldsMixin, AbstractUser):
     """
     A custom user model that allows for both owners and walkers.
 
@@ -19,12 +78,12 @@ class User(AbstractUser):
     last_name = models.CharField(max_length=80)
 
 
-class Owner(models.Model):
+class Owner(TrackedFieldsMixin, models.Model):
     """
     A model representing an owner who has one-to-one relationship with a user model
     and his/her attributes(address and owner's pets and requests).
     """
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='walker', null=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='owner', null=True)
     city = models.CharField(max_length=255, null=True, blank=True)
     street = models.CharField(max_length=255, null=True, blank=True)
     number_of_flat = models.CharField(max_length=255, null=True, blank=True)
@@ -36,6 +95,7 @@ class Owner(models.Model):
     def save(self, *args, **kwargs):
         """
         Overrides the default save method to set is_owner and is_walker fields of the User model.
+        The user is written only when the flags actually change.
         """
         if self.user:
             self.user.is_owner = True
@@ -62,6 +122,14 @@ class Pet(models.Model):
     size = models.IntegerField(choices=SIZES, default=0)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # an owner's pets, listed by nickname
+            models.Index(fields=['owner', 'nickname'], name='pet_owner_nickname_idx'),
+            # the size filter of the request search
+            models.Index(fields=['size', 'id'], name='pet_size_idx'),
+        ]
+
     def __str__(self):
         """
         Returns a string representation of the pet's nickname.
@@ -69,19 +137,22 @@ class Pet(models.Model):
         return self.nickname
 
 
-class Walker(models.Model):
+class Walker(TrackedFieldsMixin, models.Model):
     """
     A model representing a walker who has one-to-one relationship with a user model
-    and his/her attributes(phone number and pets with which can reserve a walk).
+    and his/her attributes(phone number, pets with which can reserve a walk and how many walks
+    a day he/she can take when walks are dispatched automatically).
     """
-    user = models.OneToOneField(User, on_delete=models.CASCADE,  related_name='owner', null=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='walker', null=True)
     phone_number = PhoneNumberField(null=False, blank=False,
                                     unique=True, help_text='Phone number')
     pets = models.ManyToManyField('Pet', related_name='walkers')
+    daily_capacity = models.PositiveSmallIntegerField(default=3, help_text='Most walks a day the walker can take')
 
     def save(self, *args, **kwargs):
         """
         Overrides the default save method to set is_owner and is_walker fields of the User model.
+        The user is written only when the flags actually change.
         """
         if self.user:
             self.user.is_owner = False
@@ -90,6 +161,87 @@ class Walker(models.Model):
         super().save(*args, **kwargs)
 
 
+Reservation = namedtuple('Reservation', ['claimed', 'lost'])
+
+# sent after requests were changed in bulk (queryset updates and bulk inserts skip post_save),
+# with the changed request ids as `ids` (None when they are not known) and optionally the ids of the
+# owners and walkers of the changed requests as `users` (when the ids cannot tell them)
+requests_changed = Signal()
+# sent inside the transaction that bulk inserted open requests or reserved open requests with a
+# queryset update, with their ids as `ids`, so derived data can be kept in step with them
+requests_created = Signal()
+requests_reserved = Signal()
+
+
+class RequestQuerySet(models.QuerySet):
+    """
+    Queryset of walk requests with the reservation operation used by walkers.
+    """
+    def reserve(self, request_ids, walker):
+        """
+        Reserves every still open request from request_ids for the walker.
+
+        All selected requests are claimed with one conditional UPDATE, so when several walkers
+        race for the same walk the database lets exactly one of them flip it. Only the rows this
+        UPDATE flipped count as claimed (PostgreSQL and SQLite return them with RETURNING, other
+        databases lock the open rows first), so reserving a request again reports it as lost and
+        notifies nobody. A notification of every claimed request is added to the outbox in the
+        same transaction.
+
+        The open conditions are put on the updated row itself, not in a subquery: under READ
+        COMMITTED PostgreSQL re-checks a row changed by a concurrent reservation against the outer
+        WHERE only, a subquery would still see the row as open and let the second walker overwrite it.
+        :return: A Reservation with sorted lists of claimed ids (now reserved by this walker)
+        and lost ids (taken by someone else, already reserved or not existing).
+        """
+        requested = {int(request_id) for request_id in request_ids}
+        if not requested:
+            return Reservation([], [])
+        with transaction.atomic(using=self.db):
+            connection = connections[self.db]
+            if connection.vendor in ('postgresql', 'sqlite'):
+                quote = connection.ops.quote_name
+                available = quote(Request._meta.get_field('available_for_booking').column)
+                walker_column = quote(Request._meta.get_field('walker').column)
+                # a filtered queryset only reserves the requests it contains
+                ids = sorted(self.filter(id__in=requested).values_list('id', flat=True)
+                             if self.query.has_filters() else requested)
+                claimed = set()
+                with connection.cursor() as cursor:
+                    for start in range(0, len(ids), 500):
+                        chunk = ids[start:start + 500]
+                        cursor.execute(f'UPDATE {quote(Request._meta.db_table)} '
+                                       f'SET {available} = %s, {walker_column} = %s '
+                                       f'WHERE {quote("id")} IN ({", ".join(["%s"] * len(chunk))}) '
+                                       f'AND {available} AND {walker_column} IS NULL RETURNING {quote("id")}',
+                                       [False, walker.pk, *chunk])
+                        claimed.update(request_id for request_id, in cursor.fetchall())
+            else:
+                claimed = set(self.filter(id__in=requested, available_for_booking=True, walker__isnull=True)
+                              .select_for_update().values_list('id', flat=True))
+                self.filter(id__in=claimed).update(available_for_booking=False, walker=walker)
+            if claimed:
+                requests_reserved.send(sender=Request, ids=sorted(claimed))
+                OutboxEvent.objects.using(self.db).record_reserved(claimed)
+        if claimed:
+            requests_changed.send(sender=Request, ids=sorted(claimed))
+        return Reservation(sorted(claimed), sorted(requested - claimed))
+
+    def fitting(self, windows):
+        """
+        Filters the requests that fit one of the (start_date, end_date, max_duration) windows.
+
+        Every window is looked up on its own, as one range of request_open_date_duration_idx
+        (so this is meant for querysets of open requests), and the matching ids are united.
+        A single OR condition would make the database walk the whole date index instead.
+        """
+        parts = [self.filter(date__range=(start_date, end_date), duration__lte=max_duration).order_by().values('id')
+                 for start_date, end_date, max_duration in windows]
+        if not parts:
+            return self.none()
+        return self.filter(id__in=parts[0].union(*parts[1:]) if len(parts) > 1 else parts[0])
+
+
 class Request(models.Model):
     """
     A model representing a pet walking request with attributes(walker who respond on this request)
@@ -100,6 +252,303 @@ class Request(models.Model):
     duration = models.PositiveIntegerField(default=None)
     available_for_booking = models.BooleanField(default=True)
     walker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='walkers', null=True)
+    series = models.ForeignKey('RequestSeries', on_delete=models.SET_NULL, related_name='occurrences',
+                               null=True, blank=True)
+
+    objects = RequestQuerySet.as_manager()
 
     class Meta:
         unique_together = ('pet', 'date')
+        indexes = [
+            # the walker board: open requests by date (partial, only open rows are indexed)
+            models.Index(fields=['date', 'id'], name='request_open_date_idx',
+                         condition=models.Q(available_for_booking=True)),
+            # price and duration filters/sorting of the request search
+            models.Index(fields=['price', 'id'], name='request_open_price_idx',
+                         condition=models.Q(available_for_booking=True)),
+            models.Index(fields=['duration', 'id'], name='request_open_duration_idx',
+                         condition=models.Q(available_for_booking=True)),
+            # matching walker availability: a date range, with the duration read from the index
+            models.Index(fields=['date', 'duration'], name='request_open_date_duration_idx',
+                         condition=models.Q(available_for_booking=True)),
+            # a walker's reservations by date
+            models.Index(fields=['walker', 'date', 'id'], name='request_walker_date_idx'),
+            # an owner's requests are reached through pet_owner_nickname_idx and the (pet, date) constraint
+        ]
+
+
+class ArchivedRequest(models.Model):
+    """
+    A model representing a past walk request moved out of the Request table (see Pet_walking.retention).
+    The id and the columns of the request are kept, so archived and current requests can be listed together.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    date = models.DateField()
+    # the foreign keys are covered by the indexes below
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='archived_requests', db_index=False)
+    price = models.IntegerField(null=True)
+    duration = models.PositiveIntegerField()
+    available_for_booking = models.BooleanField()
+    walker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_walks', null=True,
+                               db_index=False)
+    series = models.ForeignKey('RequestSeries', on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # an owner's and a walker's history, listed like the current requests
+            models.Index(fields=['pet', 'date', 'id'], name='archived_pet_date_idx'),
+            models.Index(fields=['walker', 'date', 'id'], name='archived_walker_date_idx'),
+        ]
+
+
+WEEKDAYS = (
+    (0, 'Mon'),
+    (1, 'Tue'),
+    (2, 'Wed'),
+    (3, 'Thu'),
+    (4, 'Fri'),
+    (5, 'Sat'),
+    (6, 'Sun')
+)
+
+
+class RequestSeries(models.Model):
+    """
+    A model representing a recurring walk of a pet (e.g. every Mon/Wed/Fri until a date),
+    expanded into one Request per occurrence.
+    """
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='series')
+    weekdays = models.CharField(max_length=13, help_text='Comma separated weekday numbers, 0 is Monday')
+    start_date = models.DateField()
+    until = models.DateField()
+    price = models.IntegerField(null=True)
+    duration = models.PositiveIntegerField()
+
+    def weekday_numbers(self):
+        return {int(day) for day in self.weekdays.split(',') if day != ''}
+
+    def weekday_names(self):
+        return ', '.join(name for number, name in WEEKDAYS if number in self.weekday_numbers())
+
+    def dates(self):
+        """
+        Yields every date of the series from start_date to until (inclusive).
+        """
+        days = self.weekday_numbers()
+        day = self.start_date
+        while day <= self.until:
+            if day.weekday() in days:
+                yield day
+            day += timedelta(days=1)
+
+    def expand(self):
+        """
+        Creates the requests of all occurrences with one bulk insert.
+        Dates on which the pet already has a request are skipped instead of raising.
+        :return: The number of created requests.
+        """
+        with transaction.atomic():
+            before = set(self.occurrences.values_list('id', flat=True))
+            Request.objects.bulk_create(
+                [Request(pet_id=self.pet_id, date=day, price=self.price, duration=self.duration, series=self)
+                 for day in self.dates()],
+                ignore_conflicts=True)
+            created = sorted(set(self.occurrences.values_list('id', flat=True)) - before)
+            if created:
+                requests_created.send(sender=Request, ids=created)
+        if created:
+            requests_changed.send(sender=Request, ids=created)
+        return len(created)
+
+    def future_occurrences(self):
+        """
+        Returns the occurrences from today on that no walker has reserved yet.
+        """
+        return self.occurrences.filter(date__gte=timezone.localdate(), available_for_booking=True)
+
+    def update_future(self, price, duration):
+        """
+        Changes the price and duration of the series and of all its future open occurrences in one UPDATE,
+        in one transaction with the series.
+        :return: The number of updated requests.
+        """
+        with transaction.atomic():
+            self.price, self.duration = price, duration
+            self.save(update_fields=['price', 'duration'])
+            updated = self.future_occurrences().update(price=price, duration=duration)
+            if updated:
+                # open requests have no walker, only the owner's listings changed
+                owner_id = self.pet.owner_id
+                transaction.on_commit(lambda: requests_changed.send(sender=Request, ids=None, users=[owner_id]))
+        return updated
+
+    def cancel(self):
+        """
+        Ends the series today and removes its future open occurrences, reserved walks are kept.
+        :return: The number of removed requests.
+        """
+        self.until = min(self.until, timezone.localdate() - timedelta(days=1))
+        self.save(update_fields=['until'])
+        _, removed = self.future_occurrences().delete()
+        return removed.get(Request._meta.label, 0)
+
+
+class AvailabilityQuerySet(models.QuerySet):
+    """
+    Queryset of availability windows.
+    """
+    def windows(self, today=None):
+        """
+        Returns the upcoming windows as sorted (start_date, end_date, max_duration) tuples.
+        Days before today are cut off and windows with the same max_duration that overlap
+        or touch are joined, so matching needs as few date ranges as possible.
+        """
+        today = today or timezone.localdate()
+        merged = []
+        for start_date, end_date, max_duration in (self.filter(end_date__gte=today)
+                                                   .order_by('max_duration', 'start_date')
+                                                   .values_list('start_date', 'end_date', 'max_duration')):
+            start_date = max(start_date, today)
+            if merged and merged[-1][2] == max_duration and start_date <= merged[-1][1] + timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end_date), max_duration)
+            else:
+                merged.append((start_date, end_date, max_duration))
+        return sorted(merged)
+
+
+class Availability(models.Model):
+    """
+    A model representing the days (start_date to end_date, inclusive) on which a walker
+    can take walks lasting at most max_duration.
+    """
+    walker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='availability')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    max_duration = models.PositiveIntegerField()
+
+    objects = AvailabilityQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # a walker's windows that have not ended yet
+            models.Index(fields=['walker', 'end_date'], name='availability_walker_end_idx'),
+        ]
+
+
+class Job(models.Model):
+    """
+    A model representing a background job: a registered task (see Pet_walking.jobs) called with
+    the JSON payload as keyword arguments by the run_worker command.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # workers take the due jobs in order (partial, finished jobs are not indexed)
+            models.Index(fields=['run_at', 'id'], name='job_queued_run_at_idx', condition=models.Q(status='queued')),
+            # finished jobs are pruned by age (see Pet_walking.jobs.prune)
+            models.Index(fields=['finished_at'], name='job_finished_at_idx',
+                         condition=models.Q(status__in=['done', 'failed'])),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.id} ({self.status})'
+
+
+class OutboxQuerySet(models.QuerySet):
+    """
+    Queryset of outbox events with the helpers recording them.
+    """
+    def record_created(self, request):
+        """
+        Records that a request was created, to be called in the transaction creating it.
+        """
+        return self.bulk_create([OutboxEvent(
+            kind=OutboxEvent.CREATED, key=f'{OutboxEvent.CREATED}:{request.id}',
+            payload={'request': request.id, 'pet': request.pet_id, 'date': str(request.date),
+                     'duration': int(request.duration), 'price': None if request.price is None else int(request.price)})],
+            ignore_conflicts=True)
+
+    def record_reserved(self, request_ids):
+        """
+        Records that the requests were reserved by their current walkers, to be called in the
+        transaction reserving them. The key contains the walker, so a reservation is recorded once.
+        """
+        rows = (Request.objects.filter(id__in=request_ids, walker__isnull=False)
+                .values_list('id', 'date', 'walker_id', 'walker__username', 'pet_id', 'pet__nickname', 'pet__owner_id'))
+        return self.bulk_create([OutboxEvent(
+            kind=OutboxEvent.RESERVED, key=f'{OutboxEvent.RESERVED}:{request_id}:{walker_id}',
+            payload={'request': request_id, 'date': str(date), 'walker': walker_id, 'walker_name': username,
+                     'pet': pet_id, 'pet_name': nickname, 'owner': owner_id})
+            for request_id, date, walker_id, username, pet_id, nickname, owner_id in rows],
+            batch_size=500, ignore_conflicts=True)
+
+
+class OutboxEvent(models.Model):
+    """
+    A model representing a notification waiting to be delivered (see Pet_walking.outbox).
+    Events are written in the same transaction as the change they describe and delivered later
+    by the send_notifications command; key identifies the change, so it is recorded only once.
+    """
+    CREATED = 'request_created'
+    RESERVED = 'request_reserved'
+    KINDS = ((CREATED, 'Request created'), (RESERVED, 'Request reserved'))
+
+    kind = models.CharField(max_length=30, choices=KINDS)
+    key = models.CharField(max_length=100, unique=True)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    delivered = models.JSONField(default=list, blank=True, help_text='Channels that delivered the event already')
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    objects = OutboxQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # the dispatcher takes the pending events in order (partial, sent events are not indexed)
+            models.Index(fields=['next_attempt_at', 'id'], name='outbox_pending_idx',
+                         condition=models.Q(sent_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f'{self.key} ({"sent" if self.sent_at else "pending"})'
+
+
+class RequestStats(models.Model):
+    """
+    A model representing the request statistics of a user on a day, kept up to date by Pet_walking.stats:
+    the open and reserved requests and the spend of an owner, the walks and the earnings of a walker.
+    """
+    # the foreign key is covered by the unique constraint
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='request_stats', db_index=False)
+    date = models.DateField()
+    open_requests = models.IntegerField(default=0)
+    reserved_requests = models.IntegerField(default=0)
+    spend = models.BigIntegerField(default=0)
+    walks = models.IntegerField(default=0)
+    earnings = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='request_stats_user_date_uniq'),
+        ]
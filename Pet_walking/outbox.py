@@ -0,0 +1,186 @@
+"""
+Delivery of the notification outbox (OutboxEvent rows) to pluggable channels.
+
+Views only insert events, in the transaction of the change they describe, so a notification is
+never lost or sent for a rolled back change and the write request does not wait for any email
+or webhook. Along with the events they enqueue a send_notifications job (see Pet_walking.tasks)
+for run_worker, the send_notifications command can poll the outbox instead. Both drain it in
+batches: every channel gets the whole batch at once, events are marked sent when all channels
+delivered them, and failed deliveries are retried with backoff without repeating the channels
+that succeeded already.
+Events are unique by key, so the same change is only recorded (and delivered) once.
+"""
+import json
+import urllib.request
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from Pet_walking.jobs import backoff
+from Pet_walking.models import OutboxEvent, Request, User, Walker
+
+BATCH_SIZE = 100
+# events still not delivered after this many attempts are left in the table for inspection
+MAX_ATTEMPTS = 10
+# without row locks (SQLite) a dispatcher claims its batch by moving it this far into the future,
+# events of a dispatcher that stopped while sending are taken again afterwards
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+class Channel:
+    """
+    A destination of outbox events. send() gets a batch of events and raises when the delivery failed.
+    """
+    name = None
+
+    def send(self, events):
+        raise NotImplementedError
+
+
+class EmailChannel(Channel):
+    """
+    Emails owners whose requests were reserved and walkers who can take a new request of one
+    of their pets, one message per recipient and batch. New requests that were reserved before
+    the batch was sent are skipped.
+    """
+    name = 'email'
+
+    def recipients(self, events):
+        """
+        Returns the lines to send as a dict of email address -> lines.
+        """
+        lines = defaultdict(list)
+        reserved = [event.payload for event in events if event.kind == OutboxEvent.RESERVED]
+        emails = dict(User.objects.filter(id__in={payload['owner'] for payload in reserved})
+                      .exclude(email='').values_list('id', 'email'))
+        for payload in reserved:
+            if payload['owner'] in emails:
+                lines[emails[payload['owner']]].append(
+                    f"{payload['walker_name']} will walk {payload['pet_name']} on {payload['date']}.")
+
+        created = [event.payload for event in events if event.kind == OutboxEvent.CREATED]
+        still_open = set(Request.objects.filter(id__in=[payload['request'] for payload in created],
+                                                available_for_booking=True).values_list('id', flat=True))
+        created = [payload for payload in created if payload['request'] in still_open]
+        walkers = defaultdict(list)
+        for pet_id, email in (Walker.pets.through.objects.filter(pet_id__in={payload['pet'] for payload in created})
+                              .exclude(walker__user__email='').values_list('pet_id', 'walker__user__email')):
+            walkers[pet_id].append(email)
+        for payload in created:
+            for email in walkers[payload['pet']]:
+                lines[email].append(f"New walk on {payload['date']}: {payload['duration']} h "
+                                    f"for {payload['price']} (request #{payload['request']}).")
+        return lines
+
+    def send(self, events):
+        messages = [EmailMessage(f'Pet walking: {len(lines)} update{"s" if len(lines) > 1 else ""}',
+                                 '\n'.join(lines), to=[email])
+                    for email, lines in self.recipients(events).items()]
+        if messages:
+            get_connection(fail_silently=False).send_messages(messages)
+
+
+class WebhookChannel(Channel):
+    """
+    POSTs the batch as JSON to settings.OUTBOX_WEBHOOK_URL. Every event carries its key,
+    so the receiver can ignore events it got already (a retried batch is sent again whole).
+    """
+    name = 'webhook'
+    timeout = 5
+
+    def send(self, events):
+        body = json.dumps({'events': [{'key': event.key, 'kind': event.kind, 'created_at': event.created_at.isoformat(),
+                                       'payload': event.payload} for event in events]}).encode()
+        http_request = urllib.request.Request(settings.OUTBOX_WEBHOOK_URL, data=body, method='POST',
+                                              headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+            response.read()
+
+
+def load_channels():
+    """
+    Instantiates the channels listed in settings.OUTBOX_CHANNELS.
+    """
+    return [import_string(path)() for path in settings.OUTBOX_CHANNELS]
+
+
+def pending():
+    """
+    Returns the events due for a (new) delivery attempt, oldest first.
+    """
+    return (OutboxEvent.objects.filter(sent_at__isnull=True, next_attempt_at__lte=timezone.now(),
+                                       attempts__lt=MAX_ATTEMPTS).order_by('next_attempt_at', 'id'))
+
+
+def deliver(events, channels):
+    """
+    Sends the events to every channel that has not delivered them yet and saves the outcome.
+    :return: A (sent, failed) pair of event counts.
+    """
+    errors = defaultdict(list)
+    for channel in channels:
+        batch = [event for event in events if channel.name not in event.delivered]
+        if not batch:
+            continue
+        try:
+            channel.send(batch)
+        except Exception as error:
+            for event in batch:
+                errors[event.id].append(f'{channel.name}: {error!r}')
+        else:
+            for event in batch:
+                event.delivered = event.delivered + [channel.name]
+    now = timezone.now()
+    for event in events:
+        if event.id in errors:
+            event.attempts += 1
+            event.next_attempt_at = now + backoff(event.attempts)
+            event.last_error = '\n'.join(errors[event.id])
+        else:
+            event.sent_at = now
+    OutboxEvent.objects.bulk_update(events, ['delivered', 'sent_at', 'attempts', 'next_attempt_at', 'last_error'])
+    return len(events) - len(errors), len(errors)
+
+
+def claim(batch_size):
+    """
+    Takes up to batch_size pending events with a conditional UPDATE ... RETURNING that moves their
+    next attempt CLAIM_TIMEOUT ahead, so a concurrent dispatcher picking the same ids gets none of them.
+    :return: The claimed events, oldest first.
+    """
+    ids = list(pending().values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    quote = connection.ops.quote_name
+    next_attempt_at = OutboxEvent._meta.get_field('next_attempt_at')
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {quote(OutboxEvent._meta.db_table)} SET {quote(next_attempt_at.column)} = %s '
+                       f'WHERE {quote("id")} IN ({", ".join(["%s"] * len(ids))}) '
+                       f'AND {quote("sent_at")} IS NULL AND {quote(next_attempt_at.column)} <= %s '
+                       f'RETURNING {quote("id")}',
+                       [next_attempt_at.get_db_prep_value(now + CLAIM_TIMEOUT, connection), *ids,
+                        next_attempt_at.get_db_prep_value(now, connection)])
+        claimed = [event_id for event_id, in cursor.fetchall()]
+    return list(OutboxEvent.objects.filter(id__in=claimed).order_by('id'))
+
+
+def drain(channels, batch_size=BATCH_SIZE):
+    """
+    Delivers one batch of pending events.
+
+    Where the database supports SKIP LOCKED the batch stays locked while it is sent. Elsewhere (SQLite)
+    nothing is held open during the delivery, which keeps the writers unblocked, and the batch is
+    claimed with a conditional UPDATE instead. Either way several dispatchers can run side by side
+    without sending an event twice.
+    :return: A (sent, failed) pair of event counts, (0, 0) when nothing was pending.
+    """
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            return deliver(list(pending().select_for_update(skip_locked=True)[:batch_size]), channels)
+    return deliver(claim(batch_size), channels)
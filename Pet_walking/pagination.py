@@ -0,0 +1,194 @@
+"""
+Keyset (cursor) pagination used by the request listings.
+
+Instead of OFFSET, every page continues strictly after the last row of the previous one,
+so the database can seek straight to it using an index on the ordering columns.
+Rows with NULL in a nullable ordering column come last in either direction.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(values):
+    """
+    Encodes the ordering values of a row into an opaque, URL safe cursor.
+    """
+    return urlsafe_base64_encode(json.dumps([None if value is None else str(value) for value in values]).encode())
+
+
+def decode_cursor(cursor, fields):
+    """
+    Decodes a cursor back into python values of the given model fields.
+    :return: A list of values or None if the cursor is missing or malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        raw_values = json.loads(urlsafe_base64_decode(cursor))
+        if len(raw_values) != len(fields):
+            return None
+        if any(value is None and not field.null for field, value in zip(fields, raw_values)):
+            return None
+        return [field.to_python(value) for field, value in zip(fields, raw_values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+class KeysetPage:
+    """
+    A lazily evaluated page of a queryset ordered by a stable, unique key.
+
+    The ordering must end with a unique field (the primary key) so that every row has
+    exactly one position. Rows are fetched on first use, one row more than the page size,
+    to find out whether a next page exists.
+    """
+    def __init__(self, queryset, cursor=None, ordering=('date', 'id'), size=None):
+        self.ordering = ordering
+        self.cursor = cursor
+        self.size = size or PAGE_SIZE
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+        self.queryset = queryset.order_by(*self.order_by())
+        self._rows = None
+        self._has_next = False
+
+    def order_by(self):
+        """
+        Returns the ordering as order_by() arguments, putting NULLs of nullable fields last.
+        """
+        return [(F(field.name).desc(nulls_last=True) if name.startswith('-') else F(field.name).asc(nulls_last=True))
+                if field.null else name for name, field in zip(self.ordering, self.fields)]
+
+    def _position_filter(self, values):
+        """
+        Builds the "comes after" condition: a >= x AND ((a > x) OR (a = x AND b > y) OR ...).
+        The redundant leading bound lets the database seek the index on the first column.
+        As NULLs come last, nothing comes after a NULL in its column and every NULL comes after a value.
+        """
+        def after(name, field, value):
+            if value is None:
+                return None
+            step = Q(**{f"{field.name}__{'lt' if name.startswith('-') else 'gt'}": value})
+            return step | Q(**{f'{field.name}__isnull': True}) if field.null else step
+
+        def same(field, value):
+            return Q(**{f'{field.name}__isnull': True}) if value is None else Q(**{field.name: value})
+
+        condition = Q()
+        for index, (name, field) in enumerate(zip(self.ordering, self.fields)):
+            step = after(name, field, values[index])
+            if step is None:
+                continue
+            for previous_field, previous_value in zip(self.fields[:index], values[:index]):
+                step &= same(previous_field, previous_value)
+            condition |= step
+        first, field = self.ordering[0], self.fields[0]
+        if values[0] is None:
+            bound = same(field, None)
+        else:
+            bound = Q(**{f"{field.name}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+            if field.null:
+                bound |= Q(**{f'{field.name}__isnull': True})
+        return bound & condition
+
+    def page_queryset(self):
+        """
+        Returns the sliced queryset of this page (including one look-ahead row).
+        """
+        queryset = self.queryset
+        values = decode_cursor(self.cursor, self.fields)
+        if values is not None:
+            queryset = queryset.filter(self._position_filter(values))
+        return queryset[:self.size + 1]
+
+    def set_rows(self, rows):
+        """
+        Stores the fetched rows, splitting off the look-ahead row.
+        """
+        self._has_next = len(rows) > self.size
+        self._rows = rows[:self.size]
+
+    async def afetch(self):
+        """
+        Fetches the rows with the async ORM, so iterating the page later needs no query.
+        """
+        if self._rows is None:
+            self.set_rows([row async for row in self.page_queryset()])
+        return self
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self.set_rows(list(self.page_queryset()))
+        return self._rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def has_previous(self):
+        return bool(self.cursor)
+
+    @property
+    def has_next(self):
+        return bool(self.rows) and self._has_next
+
+    @property
+    def next_cursor(self):
+        """
+        The cursor of the page following this one or None if this is the last page.
+        """
+        if not self.has_next:
+            return None
+        last = self.rows[-1]
+        return encode_cursor(getattr(last, field.attname) for field in self.fields)
+
+
+class MergedKeysetPage(KeysetPage):
+    """
+    A keyset page over several querysets with the same ordering fields, e.g. a table and its archive.
+
+    Every queryset is queried for a page of its own, each still seeking its own index, and the
+    rows are merged in order; a row's position does not depend on the queryset it comes from,
+    so cursors work across them.
+    """
+    def __init__(self, querysets, cursor=None, ordering=('date', 'id'), size=None):
+        super().__init__(querysets[0], cursor, ordering, size)
+        self.querysets = [queryset.order_by(*self.order_by()) for queryset in querysets]
+
+    def page_querysets(self):
+        """
+        Returns the sliced queryset of this page (including one look-ahead row) for every queryset.
+        """
+        values = decode_cursor(self.cursor, self.fields)
+        if values is not None:
+            return [queryset.filter(self._position_filter(values))[:self.size + 1] for queryset in self.querysets]
+        return [queryset[:self.size + 1] for queryset in self.querysets]
+
+    def set_rows(self, rows):
+        descending = self.ordering[0].startswith('-')
+
+        def key(row):
+            # NULLs last whichever way the rows are sorted
+            return tuple((value is not None if descending else value is None, value)
+                         for value in (getattr(row, field.attname) for field in self.fields))
+        rows.sort(key=key, reverse=descending)
+        super().set_rows(rows)
+
+    async def afetch(self):
+        if self._rows is None:
+            self.set_rows([row for queryset in self.page_querysets() async for row in queryset])
+        return self
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self.set_rows([row for queryset in self.page_querysets() for row in queryset])
+        return self._rows
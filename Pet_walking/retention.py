@@ -0,0 +1,70 @@
+"""
+Retention of walk requests: past requests are moved from the Request table to ArchivedRequest.
+
+Walkers only ever look at future dates, so keeping history out of the Request table keeps its
+indexes (and every scan of them) as small as the upcoming requests. Rows are moved in bounded
+batches, each one a short transaction of INSERT ... SELECT and DELETE, and found by walking the
+primary key from where the previous batch stopped, so no index on the date alone is needed and
+a full pass reads the table once. The owner and walker history listings read both tables
+(see Pet_walking.pagination.MergedKeysetPage).
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from Pet_walking.models import ArchivedRequest, Owner, Request, requests_changed
+
+BATCH_SIZE = 1000
+# primary keys examined per batch when looking for past requests
+SCAN_SIZE = 20000
+
+COLUMNS = ('id', 'date', 'pet', 'price', 'duration', 'available_for_booking', 'walker', 'series')
+
+
+def move(ids, archived_at):
+    """
+    Copies the requests into the archive and deletes them, in one transaction.
+    """
+    quote = connection.ops.quote_name
+    source, target = quote(Request._meta.db_table), quote(ArchivedRequest._meta.db_table)
+    source_columns = ', '.join(quote(Request._meta.get_field(name).column) for name in COLUMNS)
+    target_columns = ', '.join(quote(ArchivedRequest._meta.get_field(name).column) for name in COLUMNS)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        # the legacy Owner.requests link would cascade the delete to the owner
+        Owner.objects.filter(requests_id__in=ids).update(requests=None)
+        cursor.execute(f'INSERT INTO {target} ({target_columns}, {quote("archived_at")}) '
+                       f'SELECT {source_columns}, %s FROM {source} WHERE {quote("id")} IN ({placeholders})',
+                       [archived_at, *ids])
+        # a raw DELETE: Request has no other dependent rows, and the per-row delete signals are replaced by
+        # one requests_changed at the end
+        cursor.execute(f'DELETE FROM {source} WHERE {quote("id")} IN ({placeholders})', ids)
+
+
+def archive(before, batch_size=BATCH_SIZE, scan_size=SCAN_SIZE, progress=None):
+    """
+    Moves every request dated before the given day to the archive, at most batch_size rows per transaction.
+    :param progress: An optional function called with the number of moved rows after every batch.
+    :return: The number of archived requests.
+    """
+    archived_at = timezone.now()
+    last_id, total = 0, 0
+    while True:
+        # the id scan_size rows further reads the primary key index only
+        upper = (Request.objects.filter(id__gt=last_id).order_by('id')
+                 .values_list('id', flat=True)[scan_size - 1:scan_size].first())
+        window = Request.objects.filter(id__gt=last_id)
+        if upper is not None:
+            window = window.filter(id__lte=upper)
+        past = list(window.filter(date__lt=before).order_by('id').values_list('id', flat=True))
+        for start in range(0, len(past), batch_size):
+            batch = past[start:start + batch_size]
+            move(batch, archived_at)
+            total += len(batch)
+            if progress:
+                progress(total)
+        if upper is None:
+            break
+        last_id = upper
+    if total:
+        requests_changed.send(sender=Request, ids=None)
+    return total
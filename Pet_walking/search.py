@@ -0,0 +1,141 @@
+"""
+Ranked full-text search over pets (nickname, breed and description).
+
+The words are looked up in an inverted index instead of scanning every description:
+- PostgreSQL: a generated tsvector column (nickname weighted above breed above description)
+  with a GIN index, ranked with ts_rank_cd.
+- SQLite: an FTS5 table with the porter stemmer, ranked with bm25.
+Both are maintained by the database itself (the generated column, or triggers on the pet table),
+so every save, delete and bulk insert of pets is indexed. Django rebuilds an SQLite table when a
+migration alters it, which drops its triggers, so install() runs again after every migrate
+and reindexes when a trigger had to be recreated. Other databases fall back to scan_pets().
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from Pet_walking.models import Pet
+
+MAX_TERMS = 10
+FTS_TABLE = 'pet_search'
+VECTOR_COLUMN = 'search_vector'
+VECTOR_INDEX = 'pet_search_vector_idx'
+TRIGGERS = {
+    'pet_search_insert': "AFTER INSERT ON {pet} BEGIN "
+                         "INSERT INTO {fts}(rowid, nickname, breed, description) "
+                         "VALUES (new.id, new.nickname, new.breed, new.description); END",
+    'pet_search_delete': "AFTER DELETE ON {pet} BEGIN "
+                         "INSERT INTO {fts}({fts}, rowid, nickname, breed, description) "
+                         "VALUES ('delete', old.id, old.nickname, old.breed, old.description); END",
+    'pet_search_update': "AFTER UPDATE OF nickname, breed, description ON {pet} BEGIN "
+                         "INSERT INTO {fts}({fts}, rowid, nickname, breed, description) "
+                         "VALUES ('delete', old.id, old.nickname, old.breed, old.description); "
+                         "INSERT INTO {fts}(rowid, nickname, breed, description) "
+                         "VALUES (new.id, new.nickname, new.breed, new.description); END",
+}
+
+
+def install(using_connection=connection, create=True):
+    """
+    Creates the search index of the database if it is missing (safe to run repeatedly).
+    With create=False an SQLite index is only repaired: its missing triggers are recreated
+    if the FTS table exists already.
+    """
+    quote = using_connection.ops.quote_name
+    pet = quote(Pet._meta.db_table)
+    with using_connection.cursor() as cursor:
+        if using_connection.vendor == 'postgresql' and create:
+            document = ' || '.join(f"setweight(to_tsvector('english', coalesce({quote(field)}, '')), '{weight}')"
+                                   for field, weight in (('nickname', 'A'), ('breed', 'B'), ('description', 'C')))
+            cursor.execute(f'ALTER TABLE {pet} ADD COLUMN IF NOT EXISTS {VECTOR_COLUMN} tsvector '
+                           f'GENERATED ALWAYS AS ({document}) STORED')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {VECTOR_INDEX} ON {pet} USING GIN ({VECTOR_COLUMN})')
+        elif using_connection.vendor == 'sqlite':
+            if not create and FTS_TABLE not in using_connection.introspection.table_names(cursor):
+                return
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(nickname, breed, description, "
+                           f"content={pet}, content_rowid='id', tokenize='porter unicode61')")
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                           [Pet._meta.db_table])
+            existing = {name for name, in cursor.fetchall()}
+            for name, body in TRIGGERS.items():
+                if name not in existing:
+                    cursor.execute(f'CREATE TRIGGER {name} {body.format(pet=pet, fts=FTS_TABLE)}')
+            if existing != set(TRIGGERS):
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall(using_connection=connection):
+    """
+    Drops the search index of the database.
+    """
+    pet = using_connection.ops.quote_name(Pet._meta.db_table)
+    with using_connection.cursor() as cursor:
+        if using_connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {VECTOR_INDEX}')
+            cursor.execute(f'ALTER TABLE {pet} DROP COLUMN IF EXISTS {VECTOR_COLUMN}')
+        elif using_connection.vendor == 'sqlite':
+            for name in TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def terms(query):
+    """
+    Splits a search query into at most MAX_TERMS lowercase words.
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def ranked_ids(words, limit):
+    """
+    Looks the words up in the index.
+    :return: A list of (pet id, rank) pairs of the pets matching all words, the best match first.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"SELECT id, ts_rank_cd({VECTOR_COLUMN}, query) AS rank "
+                           f"FROM {connection.ops.quote_name(Pet._meta.db_table)}, "
+                           f"plainto_tsquery('english', %s) AS query WHERE {VECTOR_COLUMN} @@ query "
+                           f"ORDER BY rank DESC, id LIMIT %s", [' '.join(words), limit])
+            return cursor.fetchall()
+        # bm25 is lower for better matches, the weights favour nickname and breed over description
+        cursor.execute(f'SELECT rowid, -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) AS rank FROM {FTS_TABLE} '
+                       f'WHERE {FTS_TABLE} MATCH %s ORDER BY rank DESC, rowid LIMIT %s',
+                       [' '.join(f'"{word}"' for word in words), limit])
+        return cursor.fetchall()
+
+
+def scan_pets(words, limit):
+    """
+    Finds the pets containing all words in their nickname, breed or description with LIKE conditions,
+    which reads every pet: the fallback for databases without an index, unranked.
+    """
+    pets = Pet.objects.all()
+    for word in words:
+        pets = pets.filter(Q(nickname__icontains=word) | Q(breed__icontains=word) | Q(description__icontains=word))
+    return list(pets.order_by('id')[:limit])
+
+
+def search_pets(query, limit=20):
+    """
+    Searches pets matching every word of the query.
+    :return: A list of at most limit pets, the best match first, each with a `rank` attribute.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        pets = scan_pets(words, limit)
+        for pet in pets:
+            pet.rank = 0.0
+        return pets
+    ranks = ranked_ids(words, limit)
+    pets = Pet.objects.in_bulk([pet_id for pet_id, _ in ranks])
+    results = []
+    for pet_id, rank in ranks:
+        if pet_id in pets:
+            pets[pet_id].rank = rank
+            results.append(pets[pet_id])
+    return results
@@ -0,0 +1,138 @@
+"""
+Generation of synthetic owners, walkers, pets and requests for benchmarks and capacity tests.
+"""
+import csv
+import io
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from Pet_walking.models import Owner, Pet, Request, SIZES, User, Walker, requests_changed
+
+# requests are spread over this many days around today, 37 is coprime with it
+# so the occurrences of one pet never land on the same date
+DAYS = 730
+BREEDS = ('Akita', 'Beagle', 'Boxer', 'Husky', 'Labrador', 'Poodle', 'Pug', 'Spaniel', 'Terrier')
+# pet descriptions are built from these words, so full-text searches have something to find
+DESCRIPTION_WORDS = ('calm', 'playful', 'senior', 'puppy', 'friendly', 'shy', 'energetic', 'gentle', 'loves',
+                     'fetch', 'swimming', 'parks', 'cats', 'children', 'leash', 'training', 'pulls', 'barks',
+                     'quiet', 'walks', 'long', 'short', 'treats', 'other', 'dogs', 'nervous', 'cars')
+CITIES = ('Krakow', 'Warszawa', 'Gdansk', 'Wroclaw', 'Poznan', 'Lodz', 'Katowice', 'Lublin')
+STREETS = ('Dluga', 'Krotka', 'Polna', 'Lesna', 'Sloneczna', 'Ogrodowa', 'Lipowa', 'Kwiatowa')
+# valid Polish mobile numbers: +48 50<seed> xxx xxx for owners and +48 60<seed> xxx xxx for walkers
+OWNER_PHONES = 500000000
+WALKER_PHONES = 600000000
+PHONES_PER_SEED = 1000000
+
+
+def insert_rows(model, fields, rows, batch_size=10000):
+    """
+    Inserts rows (tuples of the values of the given attnames, in database format) into the model's table.
+
+    The other columns get their default values. The rows are streamed with COPY on PostgreSQL
+    and with executemany() on other databases, no model instances are created.
+    :return: The number of inserted rows.
+    """
+    columns = [field for field in model._meta.concrete_fields if not field.primary_key]
+    positions = {name: index for index, name in enumerate(fields)}
+    defaults = [None if field.attname in positions else field.get_db_prep_save(field.get_default(), connection)
+                for field in columns]
+    picks = [(positions.get(field.attname), default) for field, default in zip(columns, defaults)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    names = ', '.join(connection.ops.quote_name(field.column) for field in columns)
+
+    count = 0
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while True:
+            batch = [[default if position is None else row[position] for position, default in picks]
+                     for row in islice(rows, batch_size)]
+            if not batch:
+                return count
+            count += len(batch)
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows([r'\N' if value is None else value for value in row] for row in batch)
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY {table} ({names}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+            else:
+                placeholders = ', '.join(['%s'] * len(columns))
+                cursor.executemany(f'INSERT INTO {table} ({names}) VALUES ({placeholders})', batch)
+
+
+def seed(owners=100, walkers=100, pets=1000, requests=10000, random_seed=0, batch_size=10000):
+    """
+    Inserts a deterministic dataset: users with their Owner/Walker profiles, pets and requests.
+
+    Every user shares one password hash ("password"), so no time is spent hashing per row.
+    Pet nicknames and phone numbers are unique, requests are spread over the year before and
+    after today and (pet, date) pairs never repeat. Seeds 0-9 can be loaded side by side.
+    :return: A dict with the number of created rows per model.
+    """
+    if not 0 <= random_seed < 10:
+        raise ValueError('The seed has to be between 0 and 9.')
+    if min(owners, walkers, pets, requests) < 0:
+        raise ValueError('The counts cannot be negative.')
+    # pets are given to the owners and requests to the pets in turn
+    if pets and not owners:
+        raise ValueError('Pets need at least one owner.')
+    if requests and not pets:
+        raise ValueError('Requests need at least one pet.')
+    if max(owners, walkers) > PHONES_PER_SEED:
+        raise ValueError(f'At most {PHONES_PER_SEED} owners and walkers can be generated.')
+    if pets and requests > pets * DAYS:
+        raise ValueError(f'At most {DAYS} requests per pet can be generated.')
+    generator = random.Random(random_seed)
+    password = make_password('password')
+    prefix = f's{random_seed}'
+    first_day = timezone.localdate() - timedelta(days=DAYS // 2)
+    dates = [str(first_day + timedelta(days=day)) for day in range(DAYS)]
+
+    # a generator of its own keeps the rest of the dataset identical to the one seeded without descriptions
+    descriptions = random.Random(f'{random_seed}-descriptions')
+
+    def describe():
+        return ' '.join(descriptions.sample(DESCRIPTION_WORDS, descriptions.randrange(3, 9)))
+
+    with transaction.atomic():
+        for role, count in (('owner', owners), ('walker', walkers)):
+            insert_rows(User, ['username', 'password', f'is_{role}', 'first_name', 'last_name'],
+                        ((f'{prefix}{role}{number}', password, True, role.title(), str(number))
+                         for number in range(count)), batch_size)
+        owner_ids = list(User.objects.filter(username__startswith=f'{prefix}owner')
+                         .order_by('id').values_list('id', flat=True))
+        walker_ids = list(User.objects.filter(username__startswith=f'{prefix}walker')
+                          .order_by('id').values_list('id', flat=True))
+
+        insert_rows(Owner, ['user_id', 'city', 'street', 'number_of_flat', 'phone_number'],
+                    ((user_id, generator.choice(CITIES), generator.choice(STREETS), str(generator.randrange(1, 200)),
+                      f'+48{OWNER_PHONES + random_seed * PHONES_PER_SEED + number}')
+                     for number, user_id in enumerate(owner_ids)), batch_size)
+        insert_rows(Walker, ['user_id', 'phone_number'],
+                    ((user_id, f'+48{WALKER_PHONES + random_seed * PHONES_PER_SEED + number}')
+                     for number, user_id in enumerate(walker_ids)), batch_size)
+
+        insert_rows(Pet, ['nickname', 'breed', 'description', 'size', 'owner_id'],
+                    ((f'{prefix}pet{number}', generator.choice(BREEDS), describe(), generator.choice(SIZES)[0],
+                      owner_ids[number % len(owner_ids)]) for number in range(pets)), batch_size)
+        pet_ids = list(Pet.objects.filter(nickname__startswith=f'{prefix}pet')
+                       .order_by('id').values_list('id', flat=True))
+
+        def generate_requests():
+            for number in range(requests):
+                pet_index, occurrence = number % len(pet_ids), number // len(pet_ids)
+                reserved = walker_ids and generator.random() < 0.3
+                yield (pet_ids[pet_index], dates[(pet_index + occurrence * 37) % DAYS],
+                       generator.randrange(10, 200), generator.randrange(1, 4), not reserved,
+                       generator.choice(walker_ids) if reserved else None)
+
+        insert_rows(Request, ['pet_id', 'date', 'price', 'duration', 'available_for_booking', 'walker_id'],
+                    generate_requests(), batch_size)
+
+    # the rows were inserted without signals
+    requests_changed.send(sender=Request, ids=None)
+    return {'owners': owners, 'walkers': walkers, 'pets': pets, 'requests': requests}
@@ -0,0 +1,183 @@
+from collections import defaultdict
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import connections
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from Pet_walking import search, stats
+from Pet_walking.caching import LISTINGS_SCOPE, REQUESTS_SCOPE, bump_on_commit, listings_scope, pets_scope
+from Pet_walking.middleware import store_role
+from Pet_walking.models import ArchivedRequest, Pet, Request, User, requests_changed, requests_created, requests_reserved
+
+
+@receiver(post_save, sender=Pet)
+@receiver(post_delete, sender=Pet)
+def invalidate_owner_pets(sender, instance, created=False, **kwargs):
+    """
+    Moves the cached pet list of the pet's owner to a new version, and when an existing pet changed
+    the request tables and listings of its owner and walkers too (they show pet nicknames).
+    """
+    if kwargs['signal'] is post_save and not created:
+        walkers = {walker_id for model in (Request, ArchivedRequest) for walker_id in
+                   model.objects.filter(pet=instance, walker__isnull=False).values_list('walker_id', flat=True)}
+        bump_on_commit(pets_scope(instance.owner_id), REQUESTS_SCOPE,
+                       *{listings_scope(user_id) for user_id in {instance.owner_id, *walkers}})
+    else:
+        bump_on_commit(pets_scope(instance.owner_id))
+
+
+@receiver(post_save, sender=Request)
+@receiver(post_delete, sender=Request)
+@receiver(post_delete, sender=ArchivedRequest)
+def invalidate_request_listings(sender, instance, **kwargs):
+    """
+    Moves the cached request tables and the listings of the request's owner and (previous) walker to a new version.
+    """
+    if cascaded(instance, kwargs.get('origin')):
+        return
+    owner_id, walker_id = current_state(instance)[:2]
+    previous_walker_id = (getattr(instance, '_stats_before', None) or (None, None))[1]
+    bump_on_commit(REQUESTS_SCOPE, *{listings_scope(user_id) for user_id in (owner_id, walker_id, previous_walker_id)
+                                     if user_id is not None})
+
+
+@receiver(requests_changed, sender=Request)
+def invalidate_changed_listings(sender, ids, users=None, **kwargs):
+    """
+    Moves the cached request tables and the listings of the users of requests changed in bulk to a new version,
+    the listings of all users when they are not known.
+    """
+    if users is None and ids is not None:
+        users = {user_id for pair in Request.objects.filter(id__in=ids).values_list('pet__owner_id', 'walker_id')
+                 for user_id in pair}
+    if users is None:
+        bump_on_commit(REQUESTS_SCOPE, LISTINGS_SCOPE)
+    else:
+        bump_on_commit(REQUESTS_SCOPE, *{listings_scope(user_id) for user_id in users if user_id is not None})
+
+
+@receiver(user_logged_in)
+def store_user_role(sender, request, user, **kwargs):
+    """
+    Caches the role and profile id of the user who just logged in in his/her session.
+    """
+    store_role(request.session, user)
+
+
+def current_state(instance):
+    """
+    Returns the stats.request_state() of a request, looking its owner up at most once per save or delete:
+    the receivers share it and the pre-save query already knows the owner of an existing request.
+    """
+    pet_id, owner_id = getattr(instance, '_stats_owner', (None, None))
+    state = stats.request_state(instance, owner_id if pet_id == instance.pet_id else None)
+    instance._stats_owner = (instance.pet_id, state[0])
+    return state
+
+
+def cascaded(instance, origin):
+    """
+    Tells whether a deleted request was already counted by count_cascading_requests().
+    """
+    return (type(instance), instance.pk) in getattr(origin, '_stats_cascaded', ())
+
+
+@receiver(pre_save, sender=Request)
+def remember_request_state(sender, instance, **kwargs):
+    """
+    Remembers what an existing request counted in the statistics before the save changes it, and its owner.
+    """
+    instance._stats_before = None
+    instance._stats_owner = (None, None)
+    if instance.pk is not None:
+        before = Request.objects.filter(pk=instance.pk).values_list(
+            'pet_id', 'pet__owner_id', 'walker_id', 'date', 'price', 'available_for_booking').first()
+        if before:
+            instance._stats_owner, instance._stats_before = before[:2], before[1:]
+
+
+@receiver(pre_delete, sender=Request)
+@receiver(pre_delete, sender=ArchivedRequest)
+def forget_request_owner(sender, instance, **kwargs):
+    """
+    Makes a delete look the owner up afresh, the pet may have changed hands since the instance was saved.
+    """
+    instance._stats_owner = (None, None)
+
+
+@receiver(post_save, sender=Request)
+def count_saved_request(sender, instance, **kwargs):
+    """
+    Adds the difference between the new and the previous state of the request to the statistics.
+    """
+    deltas = stats.merge(defaultdict(lambda: defaultdict(int)), stats.contribution(*current_state(instance)))
+    if getattr(instance, '_stats_before', None):
+        stats.merge(deltas, stats.contribution(*instance._stats_before), sign=-1)
+    stats.apply(deltas)
+
+
+@receiver(post_delete, sender=Request)
+@receiver(post_delete, sender=ArchivedRequest)
+def count_deleted_request(sender, instance, origin=None, **kwargs):
+    """
+    Removes the deleted (current or archived) request from the statistics, except for a user who is
+    being deleted with it.
+    """
+    if cascaded(instance, origin):
+        return
+    deltas = stats.merge(defaultdict(lambda: defaultdict(int)), stats.contribution(*current_state(instance)), sign=-1)
+    if isinstance(origin, User):
+        deltas = {key: values for key, values in deltas.items() if key[0] != origin.pk}
+    stats.apply(deltas)
+
+
+@receiver(pre_delete, sender=Pet)
+@receiver(pre_delete, sender=User)
+def count_cascading_requests(sender, instance, origin=None, **kwargs):
+    """
+    Removes the current and archived requests deleted along with a pet or a walker from the statistics
+    and moves their listings to a new version with one query per model and one upsert, instead of
+    a lookup and an upsert per request. The requests are remembered on the origin of the delete,
+    so the receivers of the single requests skip them.
+    """
+    if origin is None:
+        return
+    counted = getattr(origin, '_stats_cascaded', None)
+    if counted is None:
+        counted = origin._stats_cascaded = set()
+    deleted = Q(pet=instance) if sender is Pet else Q(walker=instance)
+    deltas = defaultdict(lambda: defaultdict(int))
+    users = set()
+    for model in (Request, ArchivedRequest):
+        for request_id, *state in model.objects.filter(deleted).values_list(
+                'id', 'pet__owner_id', 'walker_id', 'date', 'price', 'available_for_booking'):
+            if (model, request_id) not in counted:
+                counted.add((model, request_id))
+                stats.merge(deltas, stats.contribution(*state), sign=-1)
+                users.update(state[:2])
+    if isinstance(origin, User):
+        deltas = {key: values for key, values in deltas.items() if key[0] != origin.pk}
+    stats.apply(deltas)
+    if users:
+        bump_on_commit(REQUESTS_SCOPE, *{listings_scope(user_id) for user_id in users if user_id is not None})
+
+
+@receiver(requests_created, sender=Request)
+def count_created_requests(sender, ids, **kwargs):
+    stats.add_created(ids)
+
+
+@receiver(requests_reserved, sender=Request)
+def count_reserved_requests(sender, ids, **kwargs):
+    stats.add_reserved(ids)
+
+
+@receiver(post_migrate)
+def repair_search_index(sender, using, **kwargs):
+    """
+    Recreates the triggers of the SQLite pet search index dropped when a migration rebuilt the pet table.
+    """
+    if sender.name == 'Pet_walking':
+        search.install(connections[using], create=False)
@@ -0,0 +1,179 @@
+"""
+Request statistics for the home page dashboards, kept in RequestStats rows per user and day.
+
+Every change of a request adds its difference to the rows of the owner and the walker, in the
+transaction of the change (see the receivers in Pet_walking.signals): single saves and deletes
+through the model signals, bulk inserts and reservations through requests_created and
+requests_reserved. Differences are added with one upsert, so concurrent writers never lose an
+increment, and a dashboard only sums the few rows of one user. Archiving moves requests without
+changing them, so it leaves the statistics alone. The rebuild_stats command recomputes the rows
+from the current and archived requests and reports where the stored values drifted.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from Pet_walking.models import ArchivedRequest, Pet, Request, RequestStats
+from Pet_walking.seeding import insert_rows
+
+FIELDS = ('open_requests', 'reserved_requests', 'spend', 'walks', 'earnings')
+# (user, date) rows added by one upsert, seven query parameters per row
+CHUNK_SIZE = 500
+
+
+def contribution(owner_id, walker_id, date, price, available_for_booking):
+    """
+    Returns what one request adds to the statistics, as a dict of (user id, date) -> {field: value}.
+    """
+    price = price or 0
+    counts = {(owner_id, date): {'open_requests': int(available_for_booking),
+                                 'reserved_requests': int(not available_for_booking),
+                                 'spend': 0 if available_for_booking else price}}
+    if not available_for_booking and walker_id is not None:
+        counts[(walker_id, date)] = {'walks': 1, 'earnings': price}
+    return counts
+
+
+def merge(deltas, counts, sign=1):
+    """
+    Adds (or with sign=-1 subtracts) the counts of a contribution() to the deltas.
+    """
+    for key, values in counts.items():
+        for field, value in values.items():
+            deltas[key][field] += sign * value
+    return deltas
+
+
+def request_state(request, owner_id=None):
+    """
+    Returns the (owner id, walker id, date, price, available_for_booking) of a Request or ArchivedRequest instance.
+    """
+    if owner_id is None:
+        owner_id = (request.pet.owner_id if type(request).pet.is_cached(request)
+                    else Pet.objects.filter(id=request.pet_id).values_list('owner_id', flat=True).first())
+    return (owner_id, request.walker_id, request._meta.get_field('date').to_python(request.date),
+            None if request.price in (None, '') else int(request.price), request.available_for_booking)
+
+
+def apply(deltas):
+    """
+    Adds the deltas (a dict of (user id, date) -> {field: value}) to the stored statistics.
+    PostgreSQL and SQLite add up to CHUNK_SIZE of them with one INSERT ... ON CONFLICT DO UPDATE.
+    """
+    rows = [(user_id, date, *(values.get(field, 0) for field in FIELDS))
+            for (user_id, date), values in sorted(deltas.items()) if any(values.values())]
+    if not rows:
+        return
+    if connection.vendor in ('postgresql', 'sqlite'):
+        quote = connection.ops.quote_name
+        table = quote(RequestStats._meta.db_table)
+        columns = ', '.join(quote(name) for name in ('user_id', 'date', *FIELDS))
+        updates = ', '.join(f'{quote(field)} = {table}.{quote(field)} + excluded.{quote(field)}' for field in FIELDS)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), CHUNK_SIZE):
+                chunk = rows[start:start + CHUNK_SIZE]
+                values = ', '.join([f"({', '.join(['%s'] * (len(FIELDS) + 2))})"] * len(chunk))
+                cursor.execute(f'INSERT INTO {table} ({columns}) VALUES {values} '
+                               f'ON CONFLICT ({quote("user_id")}, {quote("date")}) DO UPDATE SET {updates}',
+                               [value for row in chunk for value in row])
+        return
+    with transaction.atomic():
+        for user_id, date, *values in rows:
+            changes = dict(zip(FIELDS, values))
+            if not RequestStats.objects.filter(user_id=user_id, date=date).update(
+                    **{field: F(field) + value for field, value in changes.items()}):
+                RequestStats.objects.create(user_id=user_id, date=date, **changes)
+
+
+def add_created(ids):
+    """
+    Adds the requests inserted in bulk.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for row in Request.objects.filter(id__in=ids).values_list(
+            'pet__owner_id', 'walker_id', 'date', 'price', 'available_for_booking'):
+        merge(deltas, contribution(*row))
+    apply(deltas)
+
+
+def add_reserved(ids):
+    """
+    Moves the requests that were just reserved from open to reserved.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for owner_id, walker_id, date, price in Request.objects.filter(id__in=ids).values_list(
+            'pet__owner_id', 'walker_id', 'date', 'price'):
+        merge(deltas, contribution(owner_id, walker_id, date, price, False))
+        merge(deltas, contribution(owner_id, None, date, price, True), sign=-1)
+    apply(deltas)
+
+
+def recompute(request_models=(Request, ArchivedRequest)):
+    """
+    Computes the statistics from scratch out of the current and archived requests
+    (the migration creating RequestStats passes their historical models).
+    :return: A dict of (user id, date) -> tuple of FIELDS values, without all-zero rows.
+    """
+    totals = defaultdict(lambda: [0] * len(FIELDS))
+    reserved = Q(available_for_booking=False)
+    for model in request_models:
+        for owner_id, date, open_requests, reserved_requests, spend in (
+                model.objects.values('pet__owner_id', 'date').order_by()
+                .annotate(open_requests=Count('id', filter=Q(available_for_booking=True)),
+                          reserved_requests=Count('id', filter=reserved), spend=Sum('price', filter=reserved))
+                .values_list('pet__owner_id', 'date', 'open_requests', 'reserved_requests', 'spend')
+                .iterator(chunk_size=10000)):
+            row = totals[(owner_id, date)]
+            row[0], row[1], row[2] = row[0] + open_requests, row[1] + reserved_requests, row[2] + (spend or 0)
+        for walker_id, date, walks, earnings in (
+                model.objects.filter(reserved, walker__isnull=False).values('walker_id', 'date').order_by()
+                .annotate(walks=Count('id'), earnings=Sum('price'))
+                .values_list('walker_id', 'date', 'walks', 'earnings').iterator(chunk_size=10000)):
+            row = totals[(walker_id, date)]
+            row[3], row[4] = row[3] + walks, row[4] + (earnings or 0)
+    return {key: tuple(values) for key, values in totals.items() if any(values)}
+
+
+def stored():
+    """
+    Returns the stored statistics in the format of recompute().
+    """
+    return {(user_id, date): tuple(values) for user_id, date, *values in
+            RequestStats.objects.values_list('user_id', 'date', *FIELDS).iterator(chunk_size=10000)
+            if any(values)}
+
+
+def differences(expected, actual):
+    """
+    Returns the sorted (user id, date) keys whose values differ between two recompute()-like dicts.
+    """
+    return sorted(key for key in expected.keys() | actual.keys()
+                  if expected.get(key, (0,) * len(FIELDS)) != actual.get(key, (0,) * len(FIELDS)))
+
+
+def rebuild(expected=None, stats_model=RequestStats):
+    """
+    Replaces the stored statistics with the recomputed ones (or the given recompute() result).
+    Writes made while this runs may be lost, so run it when the site is quiet and check again afterwards.
+    :return: The number of stored rows.
+    """
+    expected = recompute() if expected is None else expected
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        insert_rows(stats_model, ['user_id', 'date', *FIELDS],
+                    ((user_id, date, *values) for (user_id, date), values in expected.items()))
+    return len(expected)
+
+
+def dashboard(user):
+    """
+    Returns the dashboard numbers of the user with one query: upcoming open and reserved requests
+    and the total spend of an owner, upcoming walks and the total earnings of a walker.
+    """
+    upcoming = Q(date__gte=timezone.localdate())
+    totals = RequestStats.objects.filter(user=user).aggregate(
+        open_requests=Sum('open_requests', filter=upcoming), reserved_requests=Sum('reserved_requests', filter=upcoming),
+        spend=Sum('spend'), walks=Sum('walks', filter=upcoming), earnings=Sum('earnings'))
+    return {name: value or 0 for name, value in totals.items()}
@@ -0,0 +1,28 @@
+"""
+Background tasks run by the run_worker command (see Pet_walking.jobs).
+"""
+from django.utils.dateparse import parse_date
+
+from Pet_walking.dispatch import dispatch
+from Pet_walking.jobs import task
+from Pet_walking.outbox import BATCH_SIZE, drain, load_channels
+
+
+@task(name='dispatch_day', max_attempts=3)
+def dispatch_day(day):
+    """
+    Dispatches the open requests of the day (an ISO date) to walkers.
+    """
+    dispatch(parse_date(day))
+    send_notifications.delay_once()
+
+
+@task(name='send_notifications', max_attempts=3)
+def send_notifications():
+    """
+    Delivers the pending events of the notification outbox, batch after batch until it is empty.
+    Events that fail are retried by the outbox itself, with their own backoff.
+    """
+    channels = load_channels()
+    while sum(drain(channels)) >= BATCH_SIZE:
+        pass
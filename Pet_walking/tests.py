@@ -1,10 +1,63 @@
-from datetime import datetime
+import json
+import os
+import random
+import signal
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.sessions.backends.db import SessionStore
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, transaction
+from django.http import HttpResponse
 from django.urls import reverse, resolve
-from Pet_walking.models import User, Pet, Request
-from django.test import Client, TestCase
+from django.utils import timezone
+from Pet_walking import stats, urls
+from Pet_walking.caching import cache_stats
+from Pet_walking.dispatch import assign, dispatch, save_assignment
+from Pet_walking.jobs import claim, render_metrics, requeue_stale, run, task
+from Pet_walking.forms import OwnerSignUpForm, WalkerSignUpForm
+from Pet_walking.metrics import MetricsMiddleware, registry
+from Pet_walking.middleware import UserRoleMiddleware
+from Pet_walking.outbox import Channel, EmailChannel, drain
+from Pet_walking.pagination import MergedKeysetPage
+from Pet_walking.retention import archive
+from Pet_walking.search import search_pets
+from Pet_walking.models import (ArchivedRequest, Availability, Job, OutboxEvent, Owner, User, Pet, Request,
+                                RequestSeries, RequestStats, Walker)
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 import pytest
 
 
+class QueryBudgetMixin:
+    """
+    Test helper that keeps listing views at a fixed number of queries, however many rows they show.
+    """
+    def assertQueryBudget(self, url, budget, add_rows):
+        """
+        Requests the url, calls add_rows() to put more rows on the page and requests it again.
+        Both responses must stay within the budget and run the same number of queries.
+        The cache is cleared before each request, so the uncached path is measured.
+        """
+        cache.clear()
+        with CaptureQueriesContext(connection) as small_page:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        add_rows()
+        cache.clear()
+        with CaptureQueriesContext(connection) as big_page:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        queries = '\n'.join(query['sql'] for query in big_page.captured_queries)
+        self.assertLessEqual(len(big_page), budget, queries)
+        self.assertEqual(len(small_page), len(big_page), queries)
+
+
 class LoginViewTestCase(TestCase):
     def test_detail_login(self):
         """
@@ -273,8 +326,9 @@ class AllRequestViewTest(TestCase):
         self.pet1 = Pet.objects.create(owner=self.owner_user, nickname='Max', breed='Akita')
         self.pet2 = Pet.objects.create(owner=self.owner_user, nickname='Mittens', breed='Akita')
 
-        self.request1 = Request.objects.create(pet=self.pet1, date='2022-04-12', price=30, duration=1)
-        self.request2 = Request.objects.create(pet=self.pet2, date='2022-04-13', price=30, duration=1)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.request1 = Request.objects.create(pet=self.pet1, date=tomorrow, price=30, duration=1)
+        self.request2 = Request.objects.create(pet=self.pet2, date=tomorrow, price=30, duration=1)
 
         self.client.login(username='walker', password='testpassword')
 
@@ -290,6 +344,37 @@ class AllRequestViewTest(TestCase):
         self.assertEqual(len(response.context['pets']), 2)
         self.assertEqual(len(response.context['requests']), 2)
 
+    def test_get_skips_booked_and_past_requests(self):
+        """
+        Checks that reserved requests and requests from the past are filtered out of the board.
+        """
+        Request.objects.filter(id=self.request1.id).update(available_for_booking=False)
+        Request.objects.create(pet=self.pet1, date=timezone.localdate() - timedelta(days=1), price=30, duration=1)
+        response = self.client.get(reverse('all_created_requests'))
+        self.assertEqual([request.id for request in response.context['requests']], [self.request2.id])
+
+    def test_get_pages_with_cursor(self):
+        """
+        Checks that the board is split into pages and that following the cursor continues
+        exactly after the last row of the previous page.
+        """
+        for days in range(2, 5):
+            Request.objects.create(pet=self.pet1, date=timezone.localdate() + timedelta(days=days),
+                                   price=30, duration=1)
+        url = reverse('all_created_requests')
+        with patch('Pet_walking.pagination.PAGE_SIZE', 2):
+            first = self.client.get(url).context['requests']
+            self.assertEqual(len(first), 2)
+            self.assertTrue(first.has_next)
+            seen = [request.id for request in first]
+            cursor = first.next_cursor
+            while cursor:
+                page = self.client.get(url, {'after': cursor}).context['requests']
+                seen += [request.id for request in page]
+                cursor = page.next_cursor
+        expected = list(Request.objects.order_by('date', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
     def test_post(self):
         """
         Checks if the view successfully reserves a walk and updates the request object accordingly.
@@ -303,6 +388,18 @@ class AllRequestViewTest(TestCase):
         self.assertFalse(Request.objects.get(id=self.request1.id).available_for_booking)
         self.assertEqual(Request.objects.get(id=self.request1.id).walker, self.walker_user)
 
+    def test_post_already_reserved(self):
+        """
+        Checks that a walk reserved by another walker is reported as lost and is not taken over.
+        """
+        Request.objects.filter(id=self.request1.id).update(available_for_booking=False, walker=self.owner_user)
+        response = self.client.post(reverse('all_created_requests'),
+                                    data={'request': [self.request1.id, self.request2.id]})
+        self.assertEqual(response.context['reservation'].claimed, [self.request2.id])
+        self.assertEqual(response.context['reservation'].lost, [self.request1.id])
+        self.assertContains(response, 'already reserved by someone else')
+        self.assertEqual(Request.objects.get(id=self.request1.id).walker, self.owner_user)
+
 
 class SelectedRequestsTest(TestCase):
     def setUp(self):
@@ -343,3 +440,1557 @@ class SelectedRequestsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'walker_message.html')
         self.assertContains(response, 'You must be logged in to see your requests.')
+
+
+class ReservationConcurrencyTest(TransactionTestCase):
+    def setUp(self):
+        """
+        Sets up one open request and a group of walkers that will all try to reserve it.
+        """
+        owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        pet = Pet.objects.create(owner=owner, nickname='Max', breed='Akita')
+        self.request = Request.objects.create(pet=pet, date=timezone.localdate(), price=30, duration=1)
+        self.walkers = [User.objects.create_user(username=f'walker{number}', password='testpassword',
+                                                 is_walker=True) for number in range(8)]
+
+    def test_only_one_walker_wins(self):
+        """
+        Hammers a single request from many threads at once and checks that exactly one walker claims it.
+        """
+        barrier = threading.Barrier(len(self.walkers))
+        results = {}
+
+        def reserve(walker):
+            try:
+                barrier.wait()
+                results[walker.id] = Request.objects.reserve([self.request.id], walker)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(walker,)) for walker in self.walkers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [walker_id for walker_id, result in results.items() if result.claimed]
+        self.assertEqual(len(results), len(self.walkers))
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(Request.objects.get(id=self.request.id).walker_id, winners[0])
+        for walker_id, result in results.items():
+            if walker_id != winners[0]:
+                self.assertEqual(result.lost, [self.request.id])
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason='SQLite serializes writers')
+    def test_waiting_walker_sees_the_committed_reservation(self):
+        """
+        Checks that a walker blocked on a reservation that is still being committed claims nothing
+        once it goes through, instead of overwriting the first walker (READ COMMITTED re-checks).
+        """
+        reserved, results = threading.Event(), {}
+
+        def first():
+            try:
+                with transaction.atomic():
+                    results['first'] = Request.objects.reserve([self.request.id], self.walkers[0])
+                    reserved.set()
+                    time.sleep(0.5)
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                reserved.wait()
+                results['second'] = Request.objects.reserve([self.request.id], self.walkers[1])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results['first'].claimed, [self.request.id])
+        self.assertEqual(results['second'], ([], [self.request.id]))
+        self.assertEqual(Request.objects.get(id=self.request.id).walker_id, self.walkers[0].id)
+
+    def test_reserving_again_claims_nothing(self):
+        """
+        Checks that a repeated reservation by the winner reports the request as lost and records no second event.
+        """
+        self.assertEqual(Request.objects.reserve([self.request.id], self.walkers[0]).claimed, [self.request.id])
+        self.assertEqual(Request.objects.reserve([self.request.id], self.walkers[0]),
+                         ([], [self.request.id]))
+        self.assertEqual(OutboxEvent.objects.filter(kind=OutboxEvent.RESERVED).count(), 1)
+
+
+class ListingQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    Session, user and listing query: every listing view has to fit in three queries,
+    the history listings in four (a page of current and a page of archived requests).
+    """
+    budget = 3
+    history_budget = 4
+    history_views = ('owner_requests_view', 'selected_requests')
+
+    def setUp(self):
+        """
+        Sets up an owner and a walker with one pet, one open request and one reserved walk.
+        """
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.walker = User.objects.create_user(username='walker', password='testpassword', is_walker=True)
+        self.add_rows(1)
+
+    def add_rows(self, count=10):
+        """
+        Adds pets with one open request and one walk reserved by the walker each.
+        """
+        for _ in range(count):
+            number = Pet.objects.count()
+            pet = Pet.objects.create(owner=self.owner, nickname=f'Pet{number}', breed='Akita')
+            Request.objects.create(pet=pet, date=timezone.localdate(), price=30, duration=1)
+            Request.objects.create(pet=pet, date=timezone.localdate() + timedelta(days=1), price=30, duration=1,
+                                   available_for_booking=False, walker=self.walker)
+
+    def test_owner_listings(self):
+        """
+        Checks the query budget of every listing an owner can open.
+        """
+        self.client.force_login(self.owner)
+        for name in ('my_pets_view', 'add_pet', 'create_request', 'owner_requests_view', 'all_created_requests'):
+            with self.subTest(view=name):
+                budget = self.history_budget if name in self.history_views else self.budget
+                self.assertQueryBudget(reverse(name), budget, self.add_rows)
+
+    def test_walker_listings(self):
+        """
+        Checks the query budget of every listing a walker can open.
+        """
+        self.client.force_login(self.walker)
+        for name in ('all_created_requests', 'selected_requests'):
+            with self.subTest(view=name):
+                budget = self.history_budget if name in self.history_views else self.budget
+                self.assertQueryBudget(reverse(name), budget, self.add_rows)
+
+
+class RequestSearchViewTest(TestCase):
+    def setUp(self):
+        """
+        Sets up a walker and open requests of pets with different sizes, prices and durations.
+        """
+        owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.walker = User.objects.create_user(username='walker', password='testpassword', is_walker=True)
+        self.small = Pet.objects.create(owner=owner, nickname='Max', breed='Pug', size=1)
+        self.big = Pet.objects.create(owner=owner, nickname='Rex', breed='Akita', size=3)
+        today = timezone.localdate()
+        self.cheap = Request.objects.create(pet=self.small, date=today, price=20, duration=1)
+        self.long = Request.objects.create(pet=self.big, date=today + timedelta(days=2), price=50, duration=3)
+        self.expensive = Request.objects.create(pet=self.big, date=today + timedelta(days=1), price=90, duration=1)
+        Request.objects.create(pet=self.small, date=today + timedelta(days=3), price=30, duration=1,
+                               available_for_booking=False, walker=self.walker)
+        self.url = reverse('request_search')
+        self.client.force_login(self.walker)
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_returns_open_requests_by_date(self):
+        """
+        Checks that only open requests are returned, ordered by date, with their pet.
+        """
+        data = self.search()
+        self.assertEqual([row['id'] for row in data['results']], [self.cheap.id, self.expensive.id, self.long.id])
+        self.assertEqual(data['results'][0]['pet']['nickname'], 'Max')
+        self.assertIsNone(data['next'])
+
+    def test_range_and_size_filters(self):
+        """
+        Checks the price, duration and size filters.
+        """
+        self.assertEqual([row['id'] for row in self.search(price_min=30, price_max=60)['results']], [self.long.id])
+        self.assertEqual([row['id'] for row in self.search(duration_min=2)['results']], [self.long.id])
+        self.assertEqual([row['id'] for row in self.search(size=1)['results']], [self.cheap.id])
+
+    def test_sort_and_cursor(self):
+        """
+        Checks that a descending sort is paged by the cursor without gaps or repeats.
+        """
+        first = self.search(sort='-price', limit=2)
+        self.assertEqual([row['id'] for row in first['results']], [self.expensive.id, self.long.id])
+        second = self.search(sort='-price', limit=2, after=first['next'])
+        self.assertEqual([row['id'] for row in second['results']], [self.cheap.id])
+        self.assertIsNone(second['next'])
+
+    def test_unpriced_requests_are_paged_last(self):
+        """
+        Checks that requests without a price come last in both price sorts and the cursor pages through them.
+        """
+        today = timezone.localdate()
+        unpriced = [Request.objects.create(pet=pet, date=today + timedelta(days=5), price=None, duration=1)
+                    for pet in (self.small, self.big)]
+        for sort, expected in (('price', [self.cheap, self.long, self.expensive, *unpriced]),
+                               ('-price', [self.expensive, self.long, self.cheap, *unpriced[::-1]])):
+            with self.subTest(sort):
+                ids, after = [], None
+                while True:
+                    page = self.search(sort=sort, limit=2, **({'after': after} if after else {}))
+                    ids += [row['id'] for row in page['results']]
+                    after = page['next']
+                    if after is None:
+                        break
+                self.assertEqual(ids, [request.id for request in expected])
+
+    def test_invalid_and_anonymous(self):
+        """
+        Checks that invalid parameters and cursors are rejected and anonymous users are refused.
+        """
+        self.assertEqual(self.client.get(self.url, {'sort': 'pet'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'after': 'not-a-cursor'}).status_code, 400)
+        cursor = self.search(sort='price', limit=1)['next']
+        self.assertEqual(self.client.get(self.url, {'sort': 'date', 'after': cursor}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class PetListCacheTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner with one pet and an empty cache.
+        """
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        Pet.objects.create(owner=self.owner, nickname='Fido', breed='Akita')
+        self.client.force_login(self.owner)
+
+    def pet_queries(self, url):
+        """
+        Requests the url and returns the queries that read the pet table.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [query['sql'] for query in queries.captured_queries if 'Pet_walking_pet' in query['sql']]
+
+    def check_repeat_views_are_cached(self):
+        stats = cache_stats()
+        self.assertEqual(len(self.pet_queries(reverse('my_pets_view'))), 1)
+        self.assertEqual(self.pet_queries(reverse('my_pets_view')), [])
+        self.assertEqual(self.pet_queries(reverse('add_pet')), [])
+        self.assertEqual(cache_stats()['misses'] - stats['misses'], 1)
+        self.assertEqual(cache_stats()['hits'] - stats['hits'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Pet.objects.create(owner=self.owner, nickname='Rex', breed='Boxer')
+        self.assertEqual(len(self.pet_queries(reverse('my_pets_view'))), 1)
+        self.assertContains(self.client.get(reverse('my_pets_view')), 'Rex')
+
+    def test_repeat_views_are_cached(self):
+        """
+        Checks that repeated views of the pet list are served from the cache
+        and that adding a pet invalidates it.
+        """
+        self.check_repeat_views_are_cached()
+
+    def test_file_based_cache(self):
+        """
+        Checks the same behaviour with the file based cache backend.
+        """
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}):
+                self.check_repeat_views_are_cached()
+
+
+class RequestTableCacheTest(TestCase):
+    def setUp(self):
+        """
+        Sets up a walker, an owner's pet with one open request and an empty cache.
+        """
+        cache.clear()
+        owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.walker = User.objects.create_user(username='walker', password='testpassword', is_walker=True)
+        self.pet = Pet.objects.create(owner=owner, nickname='Max', breed='Akita')
+        self.request = Request.objects.create(pet=self.pet, date=timezone.localdate(), price=30, duration=1)
+        self.client.force_login(self.walker)
+
+    def request_queries(self):
+        """
+        Opens the walker board and returns the response and the queries that read the request table.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('all_created_requests'))
+        return response, [query for query in queries.captured_queries if 'Pet_walking_request' in query['sql']]
+
+    def test_table_is_cached_until_a_request_changes(self):
+        """
+        Checks that the second view of the board renders the table from the cache without
+        querying requests, and that creating or reserving a request invalidates it once committed.
+        """
+        self.assertEqual(len(self.request_queries()[1]), 1)
+        response, queries = self.request_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, f'value="{self.request.id}"')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            new_request = Request.objects.create(pet=self.pet, date=timezone.localdate() + timedelta(days=1),
+                                                 price=40, duration=2)
+        # until the change commits, readers keep getting the cached table of before it
+        self.assertEqual(self.request_queries()[1], [])
+        for callback in callbacks:
+            callback()
+        response, queries = self.request_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, f'value="{new_request.id}"')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Request.objects.reserve([new_request.id], self.walker)
+        response, queries = self.request_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertNotContains(response, f'value="{new_request.id}"')
+
+
+class AsyncListingViewsTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner's pet with an open request and a walk reserved by a walker.
+        """
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.walker = User.objects.create_user(username='walker', password='testpassword', is_walker=True)
+        self.pet = Pet.objects.create(owner=self.owner, nickname='Max', breed='Akita')
+        self.open = Request.objects.create(pet=self.pet, date=timezone.localdate(), price=30, duration=1)
+        self.reserved = Request.objects.create(pet=self.pet, date=timezone.localdate() + timedelta(days=1),
+                                               price=45, duration=2, available_for_booking=False,
+                                               walker=self.walker)
+
+    async def test_owner_views(self):
+        """
+        Checks that the async owner listings render the owner's pets and requests.
+        """
+        await sync_to_async(self.async_client.force_login)(self.owner)
+        response = await self.async_client.get(reverse('async_my_pets_view'))
+        self.assertContains(response, 'Max')
+        response = await self.async_client.get(reverse('async_owner_requests_view'))
+        self.assertEqual(len(response.context['requests']), 2)
+        self.assertContains(response, 'Reserved')
+
+    async def test_walker_views(self):
+        """
+        Checks that the async walker listings render the open board and the reserved walks.
+        """
+        await sync_to_async(self.async_client.force_login)(self.walker)
+        response = await self.async_client.get(reverse('async_all_created_requests'))
+        self.assertContains(response, f'value="{self.open.id}"')
+        self.assertNotContains(response, f'value="{self.reserved.id}"')
+        response = await self.async_client.get(reverse('async_selected_requests'))
+        self.assertEqual([request.id for request in response.context['requests']], [self.reserved.id])
+
+    async def test_anonymous(self):
+        """
+        Checks the message shown to anonymous users.
+        """
+        response = await self.async_client.get(reverse('async_selected_requests'))
+        self.assertContains(response, 'You must be logged in to see your requests.')
+
+
+class ImportDataCommandTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner with an existing pet and request and a temporary directory for the files.
+        """
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.pet = Pet.objects.create(owner=self.owner, nickname='Fido', breed='Akita', description='calm')
+        Request.objects.create(pet=self.pet, date='2030-01-01', price=30, duration=1)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = f'{self.directory.name}/{name}'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_import_pets_from_csv(self):
+        """
+        Checks that valid pets are inserted and duplicates, unknown owners and bad sizes are rejected.
+        """
+        path = self.write('pets.csv', 'nickname,breed,description,size,owner\n'
+                                      'Rex,Boxer,loud,big,owner\n'
+                                      'Luna,Pug,small and calm,1,owner\n'
+                                      'Fido,Akita,duplicate from the database,1,owner\n'
+                                      'Rex,Boxer,duplicate from the file,3,owner\n'
+                                      'Bella,Beagle,unknown owner,1,nobody\n'
+                                      'Milo,Husky,bad size,7,owner\n'
+                                      ' Fido ,Akita,duplicate with spaces,1,owner\n'
+                                      'Nala,Akita,inserted with the row above,1,owner\n')
+        rejects = f'{self.directory.name}/rejects.jsonl'
+        out = StringIO()
+        call_command('import_data', 'pets', path, '--chunk-size', '2', '--rejects', rejects, stdout=out)
+        self.assertEqual(set(Pet.objects.values_list('nickname', flat=True)), {'Fido', 'Rex', 'Luna', 'Nala'})
+        self.assertEqual(Pet.objects.get(nickname='Rex').size, 3)
+        with open(rejects, encoding='utf-8') as file:
+            self.assertEqual([json.loads(line)['line'] for line in file], [4, 5, 6, 7, 8])
+        self.assertIn('Imported 3 of 8 rows', out.getvalue())
+
+    def test_import_requests_from_jsonl(self):
+        """
+        Checks that requests are inserted once per (pet, date) and invalid rows are rejected.
+        """
+        path = self.write('requests.jsonl', '\n'.join([
+            '{"pet": "Fido", "date": "2030-01-02", "price": 30, "duration": 1}',
+            '{"pet": "Fido", "date": "2030-01-01", "price": 30, "duration": 1}',
+            '{"pet": "Fido", "date": "2030-01-02", "price": 40, "duration": 2}',
+            '{"pet": "Ghost", "date": "2030-01-03", "price": 30, "duration": 1}',
+            '{"pet": "Fido", "date": "not a date", "price": 30, "duration": 1}',
+            'not json',
+        ]))
+        out = StringIO()
+        call_command('import_data', 'requests', path, stdout=out, stderr=StringIO())
+        self.assertEqual(Request.objects.filter(pet=self.pet).count(), 2)
+        self.assertIn('Imported 1 of 6 rows', out.getvalue())
+
+    def test_unexpected_json_types_are_rejected(self):
+        """
+        Checks that JSON values of the wrong type reject their rows instead of stopping the import,
+        that a price of 0 is kept and that pets are looked up by their stripped nickname.
+        """
+        path = self.write('pets.jsonl', '\n'.join([
+            '{"nickname": 5, "breed": "Pug", "size": 1, "owner": "owner"}',
+            '{"nickname": "Rex", "breed": "Pug", "size": 1, "owner": ["owner"]}',
+            '{"nickname": "Luna", "breed": "Pug", "size": {"big": true}, "owner": "owner"}',
+            '{"nickname": "Nala", "breed": "Pug", "description": "calm", "size": 1, "owner": "owner"}',
+        ]))
+        stderr = StringIO()
+        call_command('import_data', 'pets', path, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(set(Pet.objects.values_list('nickname', flat=True)), {'Fido', 'Nala'})
+        self.assertIn('line 1: The nickname has to be text.', stderr.getvalue())
+        self.assertIn('line 2: The owner has to be text.', stderr.getvalue())
+
+        path = self.write('requests.jsonl', '\n'.join([
+            '{"pet": " Fido ", "date": "2030-01-02", "price": 0, "duration": 1}',
+            '{"pet": {"nickname": "Fido"}, "date": "2030-01-03", "price": 30, "duration": 1}',
+            '{"pet": "Fido", "date": 20300104, "price": 30, "duration": 1}',
+            '{"pet": "Fido", "date": "2030-01-05", "price": [30], "duration": 1}',
+        ]))
+        out = StringIO()
+        call_command('import_data', 'requests', path, stdout=out, stderr=StringIO())
+        self.assertIn('Imported 1 of 4 rows', out.getvalue())
+        self.assertEqual(Request.objects.get(pet=self.pet, date='2030-01-02').price, 0)
+
+
+class ExportRequestsTest(TestCase):
+    def setUp(self):
+        """
+        Sets up a staff member and requests in January and February, one of them reserved.
+        """
+        self.staff = User.objects.create_user(username='finance', password='testpassword', is_staff=True)
+        walker = User.objects.create_user(username='walker', password='testpassword', is_walker=True)
+        pet = Pet.objects.create(owner=self.staff, nickname='Max', breed='Akita')
+        Request.objects.create(pet=pet, date='2030-01-10', price=30, duration=1,
+                               available_for_booking=False, walker=walker)
+        Request.objects.create(pet=pet, date='2030-02-10', price=50, duration=2)
+
+    def test_streams_csv_with_pet_and_walker_in_one_query(self):
+        """
+        Checks that the export is streamed, joins pet and walker and runs a single query per table.
+        """
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_requests'))
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as queries:
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        # one for the archived requests and one for the current ones
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(lines[0], 'id,date,pet,price,duration,available_for_booking,walker')
+        self.assertEqual(lines[1].split(',')[1:], ['2030-01-10', 'Max', '30', '1', 'False', 'walker'])
+        self.assertEqual(len(lines), 3)
+
+    def test_date_range_and_jsonl(self):
+        """
+        Checks the date range filter of the JSONL export.
+        """
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_requests'), {'format': 'jsonl', 'date_from': '2030-02-01'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['date'] for row in rows], ['2030-02-10'])
+        self.assertIsNone(rows[0]['walker'])
+
+    def test_export_command(self):
+        """
+        Checks that the command writes the export to its standard output, so call_command can capture it.
+        """
+        out = StringIO()
+        call_command('export_requests', '--format', 'jsonl', '--date-to', '2030-01-31', stdout=out)
+        self.assertEqual([json.loads(line)['pet'] for line in out.getvalue().splitlines()], ['Max'])
+
+    def test_only_staff(self):
+        """
+        Checks that users who are not staff members cannot export.
+        """
+        self.client.force_login(User.objects.get(username='walker'))
+        self.assertEqual(self.client.get(reverse('export_requests')).status_code, 403)
+
+    def test_command(self):
+        """
+        Checks that the command writes the same CSV to a file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_requests', '--output', f'{directory}/requests.csv', '--date-to', '2030-01-31')
+            with open(f'{directory}/requests.csv', encoding='utf-8') as file:
+                self.assertEqual(len(file.read().splitlines()), 2)
+
+
+class RequestSeriesTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner's pet with a series on Mon/Wed/Fri over the next two weeks.
+        """
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.pet = Pet.objects.create(owner=self.owner, nickname='Max', breed='Akita')
+        self.start = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())  # next Monday
+        self.client.force_login(self.owner)
+
+    def create_series(self):
+        return self.client.post(reverse('series'), {
+            'pet': self.pet.id, 'weekdays': [0, 2, 4], 'start_date': self.start,
+            'until': self.start + timedelta(days=13), 'price': 30, 'duration': 1})
+
+    def test_expand_skips_taken_dates(self):
+        """
+        Checks that the series is expanded into one request per weekday occurrence with one insert,
+        and that a date already taken by the pet is skipped.
+        """
+        Request.objects.create(pet=self.pet, date=self.start + timedelta(days=2), price=99, duration=3)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertRedirects(self.create_series(), reverse('series'), fetch_redirect_response=False)
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if query['sql'].startswith('INSERT') and 'INTO "Pet_walking_request"' in query['sql']]), 1)
+        series = RequestSeries.objects.get()
+        self.assertEqual(sorted(series.occurrences.values_list('date', flat=True)),
+                         [self.start + timedelta(days=days) for days in (0, 4, 7, 9, 11)])
+        self.assertContains(self.client.get(reverse('series')), '1 dates were skipped')
+
+    def test_update_and_cancel_touch_only_future_open_walks(self):
+        """
+        Checks that editing changes the upcoming open occurrences and cancelling removes them,
+        while reserved walks stay untouched.
+        """
+        self.create_series()
+        series = RequestSeries.objects.get()
+        reserved = series.occurrences.order_by('date').first()
+        Request.objects.filter(id=reserved.id).update(available_for_booking=False, walker=self.owner)
+
+        self.client.post(reverse('series_change', args=[series.id]), {'action': 'update', 'price': 45, 'duration': 2})
+        self.assertEqual(series.occurrences.filter(price=45, duration=2).count(), 5)
+        self.assertEqual(Request.objects.get(id=reserved.id).price, 30)
+
+        self.client.post(reverse('series_change', args=[series.id]), {'action': 'cancel'})
+        self.assertEqual(list(series.occurrences.values_list('id', flat=True)), [reserved.id])
+
+    def test_failed_update_changes_nothing(self):
+        """
+        Checks that the series and its occurrences are changed in one transaction, which a failing UPDATE
+        rolls back as a whole, and that the listings are only invalidated on commit.
+        """
+        self.create_series()
+        series = RequestSeries.objects.get()
+        with patch.object(RequestSeries, 'future_occurrences', side_effect=DatabaseError('lost connection')):
+            with self.assertRaises(DatabaseError):
+                series.update_future(45, 2)
+        series.refresh_from_db()
+        self.assertEqual((series.price, series.duration), (30, 1))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(series.update_future(45, 2), 6)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_invalid_change_is_rejected(self):
+        """
+        Checks that a non-numeric or out of range price or duration leaves the walks unchanged and answers 400.
+        """
+        self.create_series()
+        series = RequestSeries.objects.get()
+        for data in ({'price': 'a lot', 'duration': 1}, {'price': 30, 'duration': 0}, {'price': -5, 'duration': 1},
+                     {'price': 30}):
+            with self.subTest(data):
+                response = self.client.post(reverse('series_change', args=[series.id]), {'action': 'update', **data})
+                self.assertEqual(response.status_code, 400)
+        self.assertContains(response, 'Duration: This field is required.', status_code=400)
+        self.assertEqual(series.occurrences.exclude(price=30, duration=1).count(), 0)
+
+    def test_other_owners_cannot_change_series(self):
+        """
+        Checks that a series can only be changed by the owner of the pet.
+        """
+        self.create_series()
+        self.client.force_login(User.objects.create_user(username='other', password='testpassword'))
+        series = RequestSeries.objects.get()
+        response = self.client.post(reverse('series_change', args=[series.id]), {'action': 'cancel'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(series.occurrences.count(), 6)
+
+
+class UserRoleTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner and a walker with their profiles.
+        """
+        self.owner = User.objects.create_user(username='owner', password='testpass', is_owner=True)
+        self.walker = User.objects.create_user(username='walker', password='testpass', is_walker=True)
+        self.owner_profile = Owner.objects.create(user=self.owner, phone_number='+48500100200')
+        self.walker_profile = Walker.objects.create(user=self.walker, phone_number='+48500100300')
+
+    def profile_queries(self, queries):
+        return [query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith('SELECT') and ('FROM "Pet_walking_owner"' in query['sql']
+                                                         or 'FROM "Pet_walking_walker"' in query['sql'])]
+
+    def test_login_stores_role_without_profile_queries(self):
+        """
+        Checks that logging in stores the right role and profile id in the session
+        and that the profiles are loaded with the user instead of by separate queries.
+        """
+        for user, role, profile in ((self.owner, 'owner', self.owner_profile),
+                                    (self.walker, 'walker', self.walker_profile)):
+            with self.subTest(role=role):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.post(reverse('login'), {'username': user.username, 'password': 'testpass'})
+                self.assertEqual(self.profile_queries(queries), [])
+                self.assertEqual(self.client.session['user_type'], role)
+                self.assertEqual(self.client.session['user_id'], profile.id)
+
+    def test_authenticated_page_loads_user_and_profile_in_one_query(self):
+        """
+        Checks that an authenticated page loads the user with his/her profile in one query,
+        also for a session that does not have the role cached yet.
+        """
+        self.client.force_login(self.walker)
+        session = self.client.session
+        del session['user_type']
+        session.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+        user_queries = [query['sql'] for query in queries.captured_queries if 'FROM "Pet_walking_user"' in query['sql']]
+        self.assertEqual(len(user_queries), 1)
+        self.assertEqual(self.profile_queries(queries), [])
+        self.assertEqual(self.client.session['user_type'], 'walker')
+
+    def test_model_backend_sessions_stay_logged_in(self):
+        """
+        Checks that a session logged in by the plain ModelBackend is still authenticated and gets its role stored.
+        """
+        self.client.force_login(self.owner, backend='django.contrib.auth.backends.ModelBackend')
+        session = self.client.session
+        del session['user_type']
+        session.save()
+        self.assertTrue(self.client.get(reverse('home')).wsgi_request.user.is_authenticated)
+        self.assertEqual(self.client.session['user_type'], 'owner')
+
+    async def test_middleware_in_async_chain(self):
+        """
+        Checks that the role middleware stays asynchronous in front of an async handler and still stores the role.
+        """
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = UserRoleMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.user = self.walker
+        self.assertEqual((await middleware(request)).status_code, 200)
+        self.assertEqual(request.session['user_type'], 'walker')
+
+
+class TrackedFieldsTest(TestCase):
+    def writes(self, queries):
+        return [query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith(('INSERT', 'UPDATE'))]
+
+    def test_owner_signup_write_count(self):
+        """
+        Checks that signing up an owner inserts the user and the owner profile,
+        without rewriting the user from Owner.save().
+        """
+        form = OwnerSignUpForm({'username': 'owner', 'password1': 'Sup3r-secret!', 'password2': 'Sup3r-secret!',
+                                'first_name': 'Anna', 'last_name': 'Nowak', 'city': 'Krakow', 'street': 'Long',
+                                'number_of_flat': '5', 'phone_number': '+48500100200'})
+        self.assertTrue(form.is_valid(), form.errors)
+        with CaptureQueriesContext(connection) as queries:
+            user = form.data_save()
+        writes = self.writes(queries)
+        self.assertEqual(len(writes), 2, writes)
+        self.assertTrue(all(sql.startswith('INSERT') for sql in writes), writes)
+        self.assertTrue(User.objects.get(id=user.id).is_owner)
+
+    def test_profile_edit_writes_only_changed_fields(self):
+        """
+        Checks that saving an unchanged profile is a no-op and an edit updates only the modified column.
+        """
+        user = User.objects.create_user(username='walker', password='testpass')
+        Walker.objects.create(user=user, phone_number='+48500100300')
+        walker = Walker.objects.select_related('user').get(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            walker.save()
+        self.assertEqual(self.writes(queries), [])
+
+        owner = Owner.objects.create(user=User.objects.create_user(username='owner', password='testpass'),
+                                     phone_number='+48500100200')
+        owner = Owner.objects.select_related('user').get(id=owner.id)
+        owner.city = 'Gdansk'
+        with CaptureQueriesContext(connection) as queries:
+            owner.save()
+        writes = self.writes(queries)
+        self.assertEqual(len(writes), 1, writes)
+        self.assertIn('"city"', writes[0])
+        self.assertNotIn('"street"', writes[0])
+        self.assertEqual(Owner.objects.get(id=owner.id).city, 'Gdansk')
+
+    def test_refresh_from_db_resets_tracking(self):
+        """
+        Checks that a value changed in the database and set back on a refreshed instance is written.
+        """
+        user = User.objects.create_user(username='owner', password='testpass')
+        owner = Owner.objects.create(user=user, city='Krakow', phone_number='+48500100200')
+        Owner.objects.filter(id=owner.id).update(city='Gdansk')
+        owner.refresh_from_db()
+        owner.city = 'Krakow'
+        owner.save()
+        self.assertEqual(Owner.objects.get(id=owner.id).city, 'Krakow')
+
+    def test_copy_is_inserted(self):
+        """
+        Checks that a loaded instance saved with a cleared primary key is inserted as a copy, and the copy is tracked.
+        """
+        Owner.objects.create(city='Krakow', street='Long', phone_number='+48500100200')
+        copy = Owner.objects.get()
+        copy.pk = None
+        copy.phone_number = '+48500100201'
+        copy.save()
+        self.assertEqual(sorted(Owner.objects.values_list('phone_number', 'street')),
+                         [('+48500100200', 'Long'), ('+48500100201', 'Long')])
+        copy.city = 'Gdansk'
+        with CaptureQueriesContext(connection) as queries:
+            copy.save()
+        self.assertEqual(len(self.writes(queries)), 1)
+        self.assertNotIn('"street"', self.writes(queries)[0])
+        self.assertEqual(Owner.objects.get(id=copy.id).city, 'Gdansk')
+
+
+class SignUpTest(TestCase):
+    owner_data = {'username': 'owner', 'password1': 'Sup3r-secret!', 'password2': 'Sup3r-secret!',
+                  'first_name': 'Anna', 'last_name': 'Nowak', 'city': 'Krakow', 'street': 'Long',
+                  'number_of_flat': '5', 'phone_number': '+48500100200'}
+
+    def test_owner_signup(self):
+        """
+        Checks that a valid owner registration creates the user with the profile and logs the user in.
+        """
+        response = self.client.post(reverse('add_owner'), self.owner_data)
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        owner = Owner.objects.select_related('user').get(user__username='owner')
+        self.assertEqual(owner.city, 'Krakow')
+        self.assertTrue(owner.user.is_owner)
+        self.assertEqual(self.client.session['user_type'], 'owner')
+
+    def test_duplicate_phone_number_rolls_back(self):
+        """
+        Checks that an owner or walker registration with a taken phone number leaves no user behind
+        and shows the error on the form.
+        """
+        walker_data = {'username': 'walker', 'password1': 'Sup3r-secret!', 'password2': 'Sup3r-secret!',
+                       'first_name': 'Jan', 'last_name': 'Kowalski', 'phone_number': '+48500100300'}
+        for url, data in ((reverse('add_owner'), self.owner_data), (reverse('add_walker'), walker_data)):
+            with self.subTest(url=url):
+                self.client.post(url, data)
+                self.client.logout()
+                users = User.objects.count()
+                response = self.client.post(url, {**data, 'username': 'taken-phone'})
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'This phone number already exists. Try again!')
+                self.assertEqual(User.objects.count(), users)
+                self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_signup_does_not_precheck_phone_number(self):
+        """
+        Checks that saving a registration takes only the inserts of the user and the profile.
+        """
+        form = WalkerSignUpForm({'username': 'walker', 'password1': 'Sup3r-secret!', 'password2': 'Sup3r-secret!',
+                                 'first_name': 'Jan', 'last_name': 'Kowalski', 'phone_number': '+48500100300'})
+        self.assertTrue(form.is_valid(), form.errors)
+        with CaptureQueriesContext(connection) as queries:
+            user = form.data_save()
+        statements = [query['sql'] for query in queries.captured_queries
+                      if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        self.assertEqual(len(statements), 2, statements)
+        self.assertTrue(Walker.objects.filter(user=user, phone_number='+48500100300').exists())
+
+
+class BenchUrlsCommandTest(TransactionTestCase):
+    def test_every_route_is_benchmarked(self):
+        """
+        Checks that the URL benchmark covers every route and stores a successful result for each as JSON.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/bench.json'
+            call_command('bench_urls', '--owners', '2', '--walkers', '2', '--pets', '4', '--requests', '20',
+                         '--iterations', '2', '--threads', '2', '--output', output, stdout=StringIO())
+            with open(output) as file:
+                routes = json.load(file)['routes']
+        self.assertEqual(set(routes), {pattern.name for pattern in urls.urlpatterns})
+        for name, result in routes.items():
+            self.assertEqual(result['requests'], 2, name)
+            self.assertTrue(all(int(status) < 400 for status in result['statuses']), (name, result['statuses']))
+
+
+class SeedDataCommandTest(TestCase):
+    def test_seed_data(self):
+        """
+        Checks that the seeder creates users with valid, unique profile phone numbers, a working shared
+        password and requests that never repeat a (pet, date) pair, the same for the same seed.
+        """
+        call_command('seed_data', '--owners', '3', '--walkers', '2', '--pets', '6', '--requests', '40',
+                     '--seed', '1', stdout=StringIO())
+        self.assertEqual((Owner.objects.count(), Walker.objects.count(), Pet.objects.count()), (3, 2, 6))
+        owner = Owner.objects.select_related('user').get(user__username='s1owner0')
+        self.assertTrue(owner.user.is_owner)
+        self.assertTrue(owner.user.check_password('password'))
+        self.assertTrue(owner.phone_number.is_valid())
+        self.assertTrue(Walker.objects.get(user__username='s1walker1').phone_number.is_valid())
+        self.assertEqual(Request.objects.values('pet', 'date').distinct().count(), 40)
+        dataset = list(Request.objects.order_by('id').values_list('pet__nickname', 'date', 'price'))
+
+        Request.objects.all().delete()
+        User.objects.all().delete()
+        call_command('seed_data', '--owners', '3', '--walkers', '2', '--pets', '6', '--requests', '40',
+                     '--seed', '1', stdout=StringIO())
+        self.assertEqual(list(Request.objects.order_by('id').values_list('pet__nickname', 'date', 'price')), dataset)
+
+    def test_impossible_counts_are_rejected(self):
+        """
+        Checks that requests without pets and pets without owners are refused before anything is written.
+        """
+        for counts in (['--pets', '0', '--requests', '10'], ['--owners', '0', '--pets', '5', '--requests', '0'],
+                       ['--walkers', '-1']):
+            with self.subTest(counts), self.assertRaises(CommandError):
+                call_command('seed_data', *counts, stdout=StringIO())
+        self.assertFalse(User.objects.exists())
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user(username='owner', password='testpass', is_owner=True)
+        Pet.objects.create(owner=self.user, nickname='Max', breed='Akita')
+        self.client.login(username='owner', password='testpass')
+
+    def test_server_timing_header(self):
+        """
+        Checks that a response reports its total, database and template time in the Server-Timing header.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('my_pets_view'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+$')
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+
+    def test_metrics_endpoint(self):
+        """
+        Checks that /metrics exposes per-view histograms and totals, including the queries of async views,
+        to staff members and the allowed addresses only (none by default, not even the local one).
+        """
+        self.client.get(reverse('my_pets_view'))
+        self.client.get(reverse('my_pets_view'))
+        self.client.get(reverse('async_my_pets_view'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('pet_walking_request_duration_seconds_bucket{view="my_pets_view",le="+Inf"} 2', text)
+        self.assertIn('pet_walking_request_duration_seconds_count{view="my_pets_view"} 2', text)
+        self.assertIn('pet_walking_responses_total{view="my_pets_view",method="GET",status="200"} 2', text)
+        self.assertRegex(text, r'pet_walking_db_queries_total\{view="async_my_pets_view"\} [1-9]')
+        self.assertRegex(text, r'pet_walking_template_duration_seconds_total\{view="my_pets_view"\} 0\.0*[1-9]')
+        stats = cache_stats()
+        self.assertIn(f'pet_walking_cache_lookups_total{{result="hit"}} {stats["hits"]}', text)
+        self.assertIn(f'pet_walking_cache_lookups_total{{result="miss"}} {stats["misses"]}', text)
+        self.assertGreater(stats['hits'], 0)
+
+        self.client.logout()
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.2']):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.2').status_code, 200)
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    def test_async_chain(self):
+        """
+        Checks that the middleware stays asynchronous in front of an async handler and measures async views
+        served over ASGI, including the queries they run in worker threads.
+        """
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(MetricsMiddleware(get_response)))
+        async def fetch():
+            return await self.async_client.get(reverse('async_my_pets_view'))
+
+        self.async_client.force_login(self.user)
+        response = async_to_sync(fetch)()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        self.assertIn('pet_walking_responses_total{view="async_my_pets_view",method="GET",status="200"} 1',
+                      registry.render())
+
+
+class AvailabilityTest(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.walker = User.objects.create_user(username='walker', password='testpass', is_walker=True)
+        owner = User.objects.create_user(username='owner', password='testpass', is_owner=True)
+        self.pet = Pet.objects.create(owner=owner, nickname='Max', breed='Akita')
+        self.client.login(username='walker', password='testpass')
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def test_windows_are_merged(self):
+        """
+        Checks that overlapping or touching windows with the same longest walk are joined
+        and that past days are cut off.
+        """
+        for start, end, max_duration in ((-5, 2, 1), (3, 6, 1), (5, 9, 1), (4, 8, 3), (-9, -1, 3)):
+            Availability.objects.create(walker=self.walker, start_date=self.day(start), end_date=self.day(end),
+                                        max_duration=max_duration)
+        self.assertEqual(Availability.objects.filter(walker=self.walker).windows(),
+                         [(self.day(0), self.day(9), 1), (self.day(4), self.day(8), 3)])
+
+    def test_matches_only_fitting_requests(self):
+        """
+        Checks that the matching endpoint returns the open requests whose date and duration fit
+        a window, querying one date range per window.
+        """
+        Availability.objects.create(walker=self.walker, start_date=self.day(1), end_date=self.day(3), max_duration=2)
+        Availability.objects.create(walker=self.walker, start_date=self.day(10), end_date=self.day(10),
+                                    max_duration=1)
+        fitting = [Request.objects.create(pet=self.pet, date=self.day(1), price=10, duration=2),
+                   Request.objects.create(pet=self.pet, date=self.day(10), price=10, duration=1)]
+        Request.objects.create(pet=self.pet, date=self.day(2), price=10, duration=3)
+        Request.objects.create(pet=self.pet, date=self.day(3), price=10, duration=1, available_for_booking=False)
+        Request.objects.create(pet=self.pet, date=self.day(5), price=10, duration=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('availability_matches'))
+        self.assertEqual([row['id'] for row in response.json()['results']], [request.id for request in fitting])
+        self.assertEqual(queries.captured_queries[-1]['sql'].count('BETWEEN'), 2)
+
+        Availability.objects.all().delete()
+        self.assertEqual(self.client.get(reverse('availability_matches')).json()['results'], [])
+
+    def test_add_and_remove_window(self):
+        """
+        Checks that a walker can add a window, sees the fitting walks and can remove the window again.
+        """
+        request = Request.objects.create(pet=self.pet, date=self.day(2), price=10, duration=1)
+        response = self.client.post(reverse('availability'), {'start_date': self.day(1), 'end_date': self.day(4),
+                                                              'max_duration': 1})
+        self.assertRedirects(response, reverse('availability'))
+        window = Availability.objects.get(walker=self.walker)
+        response = self.client.get(reverse('availability'))
+        self.assertEqual([row.id for row in response.context['requests']], [request.id])
+
+        response = self.client.post(reverse('availability'), {'start_date': self.day(-3), 'end_date': self.day(-1),
+                                                              'max_duration': 1})
+        self.assertContains(response, 'The window cannot end in the past.')
+
+        self.client.post(reverse('availability'), {'action': 'remove', 'window': window.pk})
+        self.assertFalse(Availability.objects.exists())
+
+
+class DispatchTest(TestCase):
+    def setUp(self):
+        self.day = timezone.localdate() + timedelta(days=1)
+        owner = User.objects.create_user(username='owner', password='testpass', is_owner=True)
+        self.pets = [Pet.objects.create(owner=owner, nickname=f'pet{number}', breed='Akita') for number in range(3)]
+        self.walkers = []
+        for number, (capacity, pets) in enumerate(((1, self.pets[:2]), (2, self.pets[1:]))):
+            user = User.objects.create_user(username=f'walker{number}', password='testpass')
+            walker = Walker.objects.create(user=user, phone_number=f'+4850010010{number}', daily_capacity=capacity)
+            walker.pets.set(pets)
+            self.walkers.append(user)
+
+    def test_assign_covers_as_many_requests_as_possible(self):
+        """
+        Checks on random instances that the assignment respects candidates and capacities
+        and covers as many requests as an exhaustive search.
+        """
+        def best(requests, candidates, capacity):
+            if not requests:
+                return 0
+            first, rest = requests[0], requests[1:]
+            result = best(rest, candidates, capacity)
+            for walker_id in candidates[first]:
+                if capacity[walker_id]:
+                    capacity[walker_id] -= 1
+                    result = max(result, 1 + best(rest, candidates, capacity))
+                    capacity[walker_id] += 1
+            return result
+
+        generator = random.Random(1)
+        for _ in range(50):
+            walkers = range(generator.randint(1, 4))
+            capacity = {walker_id: generator.randint(0, 2) for walker_id in walkers}
+            candidates = {request_id: generator.sample(walkers, generator.randint(0, len(walkers)))
+                          for request_id in range(generator.randint(1, 7))}
+            assignment = assign(candidates, capacity)
+            self.assertTrue(all(walker_id in candidates[request_id] for request_id, walker_id in assignment.items()))
+            self.assertTrue(all(list(assignment.values()).count(walker_id) <= capacity[walker_id]
+                                for walker_id in walkers))
+            self.assertEqual(len(assignment), best(list(candidates), candidates, dict(capacity)))
+
+    def test_dispatch_day(self):
+        """
+        Checks that the open requests of the day are reserved for walkers who walk the pet,
+        counting the walks they already have against their capacity.
+        """
+        requests = [Request.objects.create(pet=pet, date=self.day, price=10, duration=1) for pet in self.pets]
+        Request.objects.create(pet=self.pets[0], date=self.day + timedelta(days=1), price=10, duration=1)
+        other_pet = Pet.objects.create(owner=self.pets[0].owner, nickname='other', breed='Pug')
+        Request.objects.create(pet=other_pet, date=self.day, price=10, duration=1,
+                               available_for_booking=False, walker=self.walkers[1])
+
+        result = dispatch(self.day)
+        self.assertEqual((result.open, result.assigned, result.written, result.lost), (3, 2, 2, []))
+        reserved = dict(Request.objects.filter(id__in=[request.id for request in requests],
+                                               available_for_booking=False).values_list('pet', 'walker'))
+        self.assertEqual(len(reserved), 2)
+        self.assertEqual(list(reserved.values()).count(self.walkers[0].id), 1)
+        self.assertEqual(list(reserved.values()).count(self.walkers[1].id), 1)
+
+    def test_requests_reserved_meanwhile_are_kept(self):
+        """
+        Checks that saving an assignment does not take over requests reserved in the meantime.
+        """
+        first, second = [Request.objects.create(pet=pet, date=self.day, price=10, duration=1) for pet in self.pets[1:]]
+        Request.objects.reserve([first.id], self.walkers[0])
+        written = save_assignment({first.id: self.walkers[1].id, second.id: self.walkers[1].id})
+        self.assertEqual(written, [second.id])
+        self.assertEqual(Request.objects.get(id=first.id).walker, self.walkers[0])
+        self.assertEqual(Request.objects.get(id=second.id).walker, self.walkers[1])
+
+
+calls = []
+
+
+@task(name='tests.record')
+def record_call(value):
+    calls.append(value)
+
+
+@task(name='tests.fail', max_attempts=2)
+def fail():
+    raise ValueError('Broken job')
+
+
+@task(name='tests.stop_worker')
+def stop_worker():
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_worker_runs_queued_jobs(self):
+        """
+        Checks that the worker runs the due jobs in order, leaves jobs scheduled later and reports throughput.
+        """
+        record_call.delay(value=1)
+        record_call.delay(value=2)
+        later = record_call.delay(run_at=timezone.now() + timedelta(hours=1), value=3)
+        out = StringIO()
+        call_command('run_worker', '--once', '--concurrency', '1', '--batch-size', '2', stdout=out)
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+        self.assertEqual(Job.objects.get(id=later.id).status, Job.QUEUED)
+        self.assertIn('2 jobs in', out.getvalue())
+
+    def test_finished_jobs_are_pruned(self):
+        """
+        Checks that the worker deletes done and failed jobs older than --keep-days, keeps the others
+        and that the metrics only count queued and running jobs.
+        """
+        old, recent = timezone.now() - timedelta(days=8), timezone.now() - timedelta(days=1)
+        Job.objects.bulk_create([Job(task=record_call.task_name, status=status, finished_at=finished_at)
+                                 for status, finished_at in ((Job.DONE, old), (Job.FAILED, old), (Job.DONE, recent))])
+        later = record_call.delay(run_at=timezone.now() + timedelta(hours=1), value=1)
+        out = StringIO()
+        call_command('run_worker', '--once', '--concurrency', '1', '--keep-days', '7', stdout=out)
+        self.assertIn('Pruned 2 finished jobs.', out.getvalue())
+        self.assertEqual(sorted(Job.objects.values_list('status', flat=True)), [Job.DONE, Job.QUEUED])
+        metrics = render_metrics()
+        self.assertIn(f'pet_walking_jobs{{task="{later.task}",status="queued"}} 1', metrics)
+        self.assertNotIn('status="done"', metrics)
+
+    def test_single_worker_stops_on_sigterm(self):
+        """
+        Checks that a single worker reports periodically and on SIGTERM finishes its batch and prints the summary.
+        """
+        stop_worker.delay()
+        record_call.delay(value=1)
+        out = StringIO()
+        call_command('run_worker', '--concurrency', '1', '--batch-size', '2', '--report-interval', '0', stdout=out)
+        self.assertEqual(calls, [1])
+        self.assertGreaterEqual(out.getvalue().count('2 jobs in'), 2)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        """
+        Checks that a failing job is queued again later and fails for good after its last attempt.
+        """
+        job = fail.delay()
+        self.assertEqual(run(claim('test')[0]), Job.QUEUED)
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('Broken job', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=4))
+        self.assertEqual(claim('test'), [])
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        self.assertEqual(run(claim('test')[0]), Job.FAILED)
+        self.assertEqual(Job.objects.get(id=job.id).attempts, 2)
+
+    def test_job_is_claimed_once(self):
+        """
+        Checks that a claimed job is not given to another worker and that jobs of stopped workers are requeued.
+        """
+        job = record_call.delay(value=1)
+        self.assertEqual([claimed.id for claimed in claim('first', 5)], [job.id])
+        self.assertEqual(claim('second', 5), [])
+        self.assertEqual(requeue_stale(), 0)
+        self.assertEqual(requeue_stale(older_than=timedelta(seconds=-1)), 1)
+        self.assertEqual([claimed.id for claimed in claim('second', 5)], [job.id])
+
+    def test_dispatch_can_be_queued(self):
+        """
+        Checks that dispatch_requests --enqueue queues a dispatch job per day.
+        """
+        call_command('dispatch_requests', '--enqueue', '--days', '2', stdout=StringIO())
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.assertEqual(list(Job.objects.order_by('id').values_list('task', 'payload')),
+                         [('dispatch_day', {'day': str(tomorrow)}),
+                          ('dispatch_day', {'day': str(tomorrow + timedelta(days=1))})])
+
+
+class FailingChannel(Channel):
+    name = 'failing'
+
+    def send(self, events):
+        raise ConnectionError('Channel down')
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner with a pet, a walker who walks that pet and an open request.
+        """
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True,
+                                              email='owner@example.com')
+        self.walker = User.objects.create_user(username='walker', password='testpassword', email='walker@example.com')
+        self.pet = Pet.objects.create(owner=self.owner, nickname='Max', breed='Akita')
+        Walker.objects.create(user=self.walker, phone_number='+48600000001').pets.add(self.pet)
+        self.request = Request.objects.create(pet=self.pet, date=timezone.localdate() + timedelta(days=1),
+                                              price=30, duration=1)
+
+    def test_events_are_written_with_the_change(self):
+        """
+        Checks that creating and reserving requests adds one event per change, however often it is recorded.
+        """
+        self.client.login(username='owner', password='testpassword')
+        self.client.post(reverse('create_request'), {'date': timezone.localdate() + timedelta(days=2),
+                                                     'pet': self.pet.id, 'price': 40, 'duration': 2})
+        created = Request.objects.latest('id')
+        Request.objects.reserve([self.request.id], self.walker)
+        OutboxEvent.objects.record_reserved([self.request.id])
+        self.assertEqual(list(OutboxEvent.objects.order_by('id').values_list('key', flat=True)),
+                         [f'request_created:{created.id}', f'request_reserved:{self.request.id}:{self.walker.id}'])
+        self.assertEqual(OutboxEvent.objects.get(kind=OutboxEvent.RESERVED).payload['owner'], self.owner.id)
+
+    def test_concurrent_dispatchers_send_once(self):
+        """
+        Checks that a dispatcher draining the outbox while another one is still sending the same batch
+        gets none of its events, so nothing is emailed twice.
+        """
+        OutboxEvent.objects.record_created(self.request)
+        inner = []
+
+        class RacingChannel(EmailChannel):
+            def send(self, events):
+                if not inner:
+                    inner.append(drain([EmailChannel()]))
+                super().send(events)
+
+        self.assertEqual(drain([RacingChannel()]), (1, 0))
+        self.assertEqual(inner, [(0, 0)])
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_views_enqueue_the_delivery(self):
+        """
+        Checks that creating and reserving requests enqueue one delivery job, which the worker runs.
+        """
+        self.client.login(username='owner', password='testpassword')
+        for days in (2, 3):
+            self.client.post(reverse('create_request'), {'date': timezone.localdate() + timedelta(days=days),
+                                                         'pet': self.pet.id, 'price': 40, 'duration': 2})
+        self.client.login(username='walker', password='testpassword')
+        self.client.post(reverse('all_created_requests'), {'request': [self.request.id]})
+        self.assertEqual(Job.objects.filter(task='send_notifications').count(), 1)
+        call_command('run_worker', '--once', '--concurrency', '1', stdout=StringIO())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['owner@example.com', 'walker@example.com'])
+        self.assertFalse(OutboxEvent.objects.filter(sent_at__isnull=True).exists())
+
+    def test_send_notifications(self):
+        """
+        Checks that the pending events are emailed to the owner and walkers once and marked as sent.
+        """
+        new_request = Request.objects.create(pet=self.pet, date=timezone.localdate() + timedelta(days=3),
+                                             price=40, duration=2)
+        OutboxEvent.objects.record_created(new_request)
+        Request.objects.reserve([self.request.id], self.walker)
+        call_command('send_notifications', '--once', stdout=StringIO())
+        self.assertEqual(sorted((message.to[0], message.body) for message in mail.outbox),
+                         [('owner@example.com', f'walker will walk Max on {self.request.date}.'),
+                          ('walker@example.com', f'New walk on {new_request.date}: 2 h for 40 '
+                                                 f'(request #{new_request.id}).')])
+        self.assertFalse(OutboxEvent.objects.filter(sent_at__isnull=True).exists())
+        call_command('send_notifications', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_channel_is_retried_alone(self):
+        """
+        Checks that an event a channel failed to deliver is retried later, without sending it again
+        through the channels that delivered it.
+        """
+        Request.objects.reserve([self.request.id], self.walker)
+        self.assertEqual(drain([EmailChannel(), FailingChannel()]), (0, 1))
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.delivered, event.attempts, event.sent_at), (['email'], 1, None))
+        self.assertIn('Channel down', event.last_error)
+        self.assertEqual(drain([EmailChannel()]), (0, 0))
+
+        OutboxEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain([EmailChannel()]), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class RetentionTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner's pet with walks in the past, one of them reserved by a walker, and an upcoming request.
+        """
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.walker = User.objects.create_user(username='walker', password='testpassword')
+        self.pet = Pet.objects.create(owner=self.owner, nickname='Max', breed='Akita')
+        today = timezone.localdate()
+        self.walked = Request.objects.create(pet=self.pet, date=today - timedelta(days=10), price=30, duration=1,
+                                             available_for_booking=False, walker=self.walker)
+        self.expired = Request.objects.create(pet=self.pet, date=today - timedelta(days=5), price=20, duration=2)
+        self.upcoming = Request.objects.create(pet=self.pet, date=today + timedelta(days=1), price=40, duration=1)
+        self.owner_profile = Owner.objects.create(user=self.owner, phone_number='+48500000001', requests=self.walked)
+
+    def test_archive_moves_past_requests(self):
+        """
+        Checks that requests dated before the cut-off are moved with their ids and columns, in batches.
+        """
+        out = StringIO()
+        call_command('archive_requests', '--keep-days', '0', '--batch-size', '1', stdout=out)
+        self.assertIn('Archived 2 requests', out.getvalue())
+        self.assertEqual(list(Request.objects.values_list('id', flat=True)), [self.upcoming.id])
+        self.assertEqual(list(ArchivedRequest.objects.order_by('date').values_list(
+            'id', 'date', 'pet', 'price', 'duration', 'available_for_booking', 'walker')),
+            [(self.walked.id, self.walked.date, self.pet.id, 30, 1, False, self.walker.id),
+             (self.expired.id, self.expired.date, self.pet.id, 20, 2, True, None)])
+        self.owner_profile.refresh_from_db()
+        self.assertIsNone(self.owner_profile.requests)
+
+    def test_history_lists_read_the_archive(self):
+        """
+        Checks that the owner's and the walker's listings show archived requests in date order, across pages.
+        """
+        archive(timezone.localdate())
+        self.client.login(username='owner', password='testpassword')
+        response = self.client.get(reverse('owner_requests_view'))
+        self.assertEqual([request.id for request in response.context['requests']],
+                         [self.walked.id, self.expired.id, self.upcoming.id])
+
+        page = MergedKeysetPage([Request.objects.all(), ArchivedRequest.objects.all()], size=2)
+        self.assertEqual([request.id for request in page], [self.walked.id, self.expired.id])
+        page = MergedKeysetPage([Request.objects.all(), ArchivedRequest.objects.all()], page.next_cursor, size=2)
+        self.assertEqual([request.id for request in page], [self.upcoming.id])
+        self.assertFalse(page.has_next)
+
+        self.client.login(username='walker', password='testpassword')
+        response = self.client.get(reverse('selected_requests'))
+        self.assertEqual([request.id for request in response.context['requests']], [self.walked.id])
+
+
+class RequestStatsTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner with two pets, a walker who walks them and a request for tomorrow.
+        """
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.walker = User.objects.create_user(username='walker', password='testpassword', is_walker=True)
+        self.pets = [Pet.objects.create(owner=self.owner, nickname=name, breed='Akita') for name in ('Max', 'Rex')]
+        Walker.objects.create(user=self.walker, phone_number='+48600000001').pets.set(self.pets)
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+        self.request = Request.objects.create(pet=self.pets[0], date=self.tomorrow, price=30, duration=1)
+
+    def assertConsistent(self):
+        self.assertEqual(stats.differences(stats.recompute(), stats.stored()), [])
+
+    def test_single_changes_are_counted(self):
+        """
+        Checks that creating, reserving, editing and deleting requests keep the statistics and dashboards exact.
+        """
+        past = Request.objects.create(pet=self.pets[1], date=timezone.localdate() - timedelta(days=3), price=50,
+                                      duration=2, available_for_booking=False, walker=self.walker)
+        Request.objects.reserve([self.request.id], self.walker)
+        self.assertEqual(stats.dashboard(self.owner),
+                         {'open_requests': 0, 'reserved_requests': 1, 'spend': 80, 'walks': 0, 'earnings': 0})
+        self.assertEqual(stats.dashboard(self.walker),
+                         {'open_requests': 0, 'reserved_requests': 0, 'spend': 0, 'walks': 1, 'earnings': 80})
+
+        past.price = 60
+        past.save()
+        Request.objects.get(id=self.request.id).delete()
+        Request.objects.create(pet=self.pets[0], date=self.tomorrow, price=20, duration=1)
+        self.assertConsistent()
+        self.assertEqual(stats.dashboard(self.owner)['open_requests'], 1)
+        self.assertEqual(stats.dashboard(self.walker)['earnings'], 60)
+
+        self.client.login(username='walker', password='testpassword')
+        self.assertContains(self.client.get(reverse('home')), 'Earnings: 60')
+
+    def test_repeated_reservation_is_counted_once(self):
+        """
+        Checks that reserving the same request twice leaves the statistics of the second call unchanged.
+        """
+        Request.objects.reserve([self.request.id], self.walker)
+        before = stats.stored()
+        Request.objects.reserve([self.request.id], self.walker)
+        self.assertEqual(stats.stored(), before)
+        self.assertEqual(stats.dashboard(self.owner)['open_requests'], 0)
+        self.assertEqual(stats.dashboard(self.walker)['walks'], 1)
+        self.assertConsistent()
+
+    def test_bulk_changes_are_counted(self):
+        """
+        Checks that series, dispatch, pet removal and archiving keep the statistics consistent.
+        """
+        series = RequestSeries.objects.create(pet=self.pets[1], weekdays='0,1,2,3,4,5,6', start_date=self.tomorrow,
+                                              until=self.tomorrow + timedelta(days=6), price=10, duration=1)
+        series.expand()
+        dispatch(self.tomorrow)
+        self.assertConsistent()
+        self.assertEqual(stats.dashboard(self.walker)['walks'], 2)
+
+        series.cancel()
+        archive(self.tomorrow + timedelta(days=1))
+        self.assertConsistent()
+        self.pets[1].delete()
+        self.walker.delete()
+        self.assertConsistent()
+        self.assertEqual(stats.dashboard(self.owner),
+                         {'open_requests': 0, 'reserved_requests': 0, 'spend': 0, 'walks': 0, 'earnings': 0})
+
+    def test_signal_queries(self):
+        """
+        Checks that saving a request looks its owner up only with the pre-save query and that deleting a pet
+        costs as many queries with 30 requests as with 3, and keeps the statistics consistent.
+        """
+        request = Request.objects.get(id=self.request.id)
+        request.available_for_booking, request.walker = False, self.walker
+        with CaptureQueriesContext(connection) as queries:
+            request.save()
+        self.assertEqual(len(queries), 3)
+        self.assertFalse([query for query in queries.captured_queries if 'FROM "Pet_walking_pet"' in query['sql']])
+
+        counts = []
+        for number in (3, 30):
+            pet = Pet.objects.create(owner=self.owner, nickname=f'Pet{number}', breed='Akita')
+            Request.objects.bulk_create(
+                Request(pet=pet, date=self.tomorrow + timedelta(days=day), price=10, duration=1,
+                        available_for_booking=day % 2 == 0, walker=None if day % 2 == 0 else self.walker)
+                for day in range(number))
+            call_command('rebuild_stats', stdout=StringIO())
+            with CaptureQueriesContext(connection) as queries:
+                pet.delete()
+            counts.append(len(queries))
+            self.assertConsistent()
+        self.assertEqual(counts[0], counts[1])
+
+    def test_rebuild_stats_command(self):
+        """
+        Checks that the command reports drifted statistics and replaces them with recomputed ones.
+        """
+        call_command('rebuild_stats', '--check', stdout=StringIO())
+        RequestStats.objects.update(open_requests=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stats', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_stats', stdout=out)
+        self.assertIn('1 differ', out.getvalue())
+        self.assertConsistent()
+
+
+class PetSearchTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner with three described pets.
+        """
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.max = Pet.objects.create(owner=self.owner, nickname='Max', breed='Labrador',
+                                      description='A calm senior dog who loves swimming.')
+        self.rex = Pet.objects.create(owner=self.owner, nickname='Rex', breed='Beagle',
+                                      description='A playful puppy, calm with labrador friends.')
+        self.bella = Pet.objects.create(owner=self.owner, nickname='Bella', breed='Pug', description='Shy with cats.')
+
+    def search(self, query):
+        return [pet.nickname for pet in search_pets(query)]
+
+    def test_results_are_ranked(self):
+        """
+        Checks that every word has to match, words are stemmed and a breed match ranks above a description match.
+        """
+        self.assertEqual(self.search('labrador'), ['Max', 'Rex'])
+        self.assertEqual(self.search('calm LABRADOR'), ['Max', 'Rex'])
+        self.assertEqual(self.search('swim'), ['Max'])
+        self.assertEqual(self.search('labrador cats'), [])
+        self.assertEqual(self.search('!!'), [])
+
+    def test_index_follows_changes(self):
+        """
+        Checks that saved, updated, bulk inserted and deleted pets are found (or no longer found) right away.
+        """
+        self.bella.description = 'Shy with cats, loves swimming.'
+        self.bella.save()
+        Pet.objects.filter(id=self.max.id).update(description='Afraid of water.')
+        Pet.objects.bulk_create([Pet(owner=self.owner, nickname='Luna', breed='Husky', description='Swimming champion')])
+        self.rex.delete()
+        self.assertEqual(sorted(self.search('swimming')), ['Bella', 'Luna'])
+        self.assertEqual(self.search('labrador'), ['Max'])
+        self.assertEqual(self.search('rex'), [])
+
+    def test_pet_search_view(self):
+        """
+        Checks that the endpoint requires a login, validates the query and returns the ranked pets.
+        """
+        self.assertEqual(self.client.get(reverse('pet_search'), {'q': 'labrador'}).status_code, 401)
+        self.client.login(username='owner', password='testpassword')
+        self.assertEqual(self.client.get(reverse('pet_search')).status_code, 400)
+        response = self.client.get(reverse('pet_search'), {'q': 'labrador', 'limit': 1})
+        results = response.json()['results']
+        self.assertEqual([(result['id'], result['breed']) for result in results], [(self.max.id, 'Labrador')])
+        self.assertGreater(results[0]['rank'], 0)
+
+
+class ConditionalListingTest(TestCase):
+    def setUp(self):
+        """
+        Sets up an owner's pet with a request reserved by a walker and an empty, shared (file based) cache.
+        """
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        shared_cache = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location.name}})
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+        self.owner = User.objects.create_user(username='owner', password='testpassword', is_owner=True)
+        self.walker = User.objects.create_user(username='walker', password='testpassword', is_walker=True)
+        self.pet = Pet.objects.create(owner=self.owner, nickname='Max', breed='Akita')
+        self.request = Request.objects.create(pet=self.pet, date=timezone.localdate() + timedelta(days=1), price=30,
+                                              duration=1, available_for_booking=False, walker=self.walker)
+
+    def test_process_local_cache_gives_no_validators(self):
+        """
+        Checks that with the locmem backend, whose versions other workers do not see, listings get no ETag
+        or Last-Modified header, so no worker answers 304 for a page another one changed.
+        """
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.client.force_login(self.owner)
+            response = self.client.get(reverse('my_pets_view'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def refresh(self, url, response):
+        """
+        Requests the url again with the validators of a previous response.
+        :return: The response and the queries that read pets or requests.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            refreshed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'],
+                                        HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        return refreshed, [query for query in queries.captured_queries
+                           if 'Pet_walking_request' in query['sql'] or 'Pet_walking_pet' in query['sql']]
+
+    def test_unchanged_listings_are_not_modified(self):
+        """
+        Checks that refreshing an unchanged listing answers 304 without any listing query or rendering.
+        """
+        for user, name in ((self.owner, 'my_pets_view'), (self.owner, 'owner_requests_view'),
+                           (self.walker, 'selected_requests')):
+            with self.subTest(name):
+                self.client.force_login(user)
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                with patch('Pet_walking.views.render') as render:
+                    refreshed, queries = self.refresh(reverse(name), response)
+                self.assertEqual(refreshed.status_code, 304)
+                self.assertEqual(queries, [])
+                render.assert_not_called()
+
+    def test_other_users_changes_keep_listings_unmodified(self):
+        """
+        Checks that requests of other owners and walkers changing leaves the listings of a user not modified.
+        """
+        other_owner = User.objects.create_user(username='other', password='testpassword', is_owner=True)
+        other_walker = User.objects.create_user(username='other_walker', password='testpassword', is_walker=True)
+        other_pet = Pet.objects.create(owner=other_owner, nickname='Rex', breed='Boxer')
+        responses = {}
+        for user, name in ((self.owner, 'owner_requests_view'), (self.walker, 'selected_requests')):
+            self.client.force_login(user)
+            responses[user, name] = self.client.get(reverse(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Request.objects.create(pet=other_pet, date=timezone.localdate(), price=20, duration=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Request.objects.reserve([other.id], other_walker)
+        for (user, name), response in responses.items():
+            with self.subTest(name):
+                self.client.force_login(user)
+                self.assertEqual(self.refresh(reverse(name), response)[0].status_code, 304)
+
+    def test_changes_make_listings_modified(self):
+        """
+        Checks that a changed request or pet, another user or another page get a full response.
+        """
+        self.client.force_login(self.owner)
+        url = reverse('owner_requests_view')
+        response = self.client.get(url)
+        self.assertEqual(self.refresh(url, response)[0].status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Request.objects.reserve([Request.objects.create(pet=self.pet, date=timezone.localdate(), price=20,
+                                                            duration=1).id], self.walker)
+        refreshed = self.refresh(url, response)[0]
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertNotEqual(refreshed['ETag'], response['ETag'])
+
+        self.pet.nickname = 'Rex'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pet.save()
+        self.assertContains(self.refresh(url, refreshed)[0], 'Rex')
+        self.assertEqual(self.refresh(f'{url}?after=x', refreshed)[0].status_code, 200)
+        self.client.force_login(self.walker)
+        self.assertEqual(self.refresh(url, refreshed)[0].status_code, 200)
@@ -28,7 +28,18 @@ urlpatterns = [
     path('add_pet/', views.AddPetView.as_view(), name='add_pet'),
     path('my_pets_view/', views.MyPetsView.as_view(), name='my_pets_view'),
     path('create_request/', views.CreateRequestView.as_view(), name='create_request'),
+    path('series/', views.SeriesView.as_view(), name='series'),
+    path('series/<int:pk>/', views.SeriesChangeView.as_view(), name='series_change'),
     path('owner_requests_view/', views.OwnerRequestsView.as_view(), name='owner_requests_view'),
     path('all_created_requests/', views.AllCreatedRequests.as_view(), name='all_created_requests'),
     path('selected_requests/', views.SelectedRequests.as_view(), name='selected_requests'),
+    path('availability/', views.AvailabilityView.as_view(), name='availability'),
+    path('api/requests/', views.RequestSearchView.as_view(), name='request_search'),
+    path('api/availability/matches/', views.AvailabilityMatchesView.as_view(), name='availability_matches'),
+    path('api/pets/search/', views.PetSearchView.as_view(), name='pet_search'),
+    path('export/requests/', views.ExportRequestsView.as_view(), name='export_requests'),
+    path('async/my_pets_view/', views.AsyncMyPetsView.as_view(), name='async_my_pets_view'),
+    path('async/owner_requests_view/', views.AsyncOwnerRequestsView.as_view(), name='async_owner_requests_view'),
+    path('async/all_created_requests/', views.AsyncAllCreatedRequests.as_view(), name='async_all_created_requests'),
+    path('async/selected_requests/', views.AsyncSelectedRequests.as_view(), name='async_selected_requests'),
 ]
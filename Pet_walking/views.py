@@ -1,22 +1,88 @@
 # Aplikacja powinna mieć co najmniej jeden widok dostępny
 # tylko dla zalogowanego użytkownika (używając Django Auth system).
+import hashlib
+from datetime import datetime, time, timezone as dt_timezone
+
 from pyexpat.errors import messages
-from django.shortcuts import render, redirect
-from Pet_walking.models import Owner, Walker, Pet, Request, SIZES, User
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from Pet_walking.models import ArchivedRequest, Availability, OutboxEvent, Pet, Request, RequestSeries, SIZES, User
 from django.views import View
 from .forms import WalkerSignUpForm, OwnerSignUpForm
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
 from django.views.generic import CreateView
-from Pet_walking.forms import Requests
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from Pet_walking.forms import (AvailabilityForm, ExportForm, PetSearchForm, Requests, RequestSearchForm, RequestSeriesForm,
+                               SeriesChangeForm)
+from Pet_walking.exports import FORMATS, export_rows
+from Pet_walking.jobs import render_metrics
+from Pet_walking.metrics import registry
+from Pet_walking.caching import (LISTINGS_SCOPE, REQUESTS_SCOPE, aowner_pets, get_version, last_modified, listings_scope,
+                                 owner_pets, pets_scope, render_cache_metrics, versions_are_shared)
+from Pet_walking.pagination import KeysetPage, MergedKeysetPage
+from Pet_walking.search import search_pets
+from Pet_walking.stats import dashboard
+from Pet_walking.tasks import send_notifications
+
+
+async def aload_user(http_request):
+    """
+    Resolves the lazy request.user (session and user queries) in a worker thread,
+    so async views and the templates they render can use it without touching the database.
+    """
+    await sync_to_async(lambda: http_request.user.is_authenticated)()
+    return http_request.user
+
+
+def conditional_listing(scopes):
+    """
+    Decorates the get() of a listing view with ETag and Last-Modified headers and 304 Not Modified answers.
+
+    The values come from the cached versions of the scopes the page shows (scopes is a function of
+    the http request returning their names), the user, the page URL and the day, so a refresh of an
+    unchanged page is answered before the listing is queried or rendered. Anonymous users, pages
+    with messages waiting to be shown and every page of a process-local cache (whose versions
+    other workers do not see move) are always rendered.
+    """
+    def page_scopes(http_request):
+        if (not versions_are_shared() or not http_request.user.is_authenticated
+                or len(messages.get_messages(http_request))):
+            return None
+        return scopes(http_request)
+
+    def etag(http_request, *args, **kwargs):
+        names = page_scopes(http_request)
+        if names is None:
+            return None
+        key = ':'.join([str(http_request.user.pk), http_request.get_full_path(), str(timezone.localdate()),
+                        *(f'{name}={get_version(name)}' for name in names)])
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def modified(http_request, *args, **kwargs):
+        names = page_scopes(http_request)
+        if names is None:
+            return None
+        # the pages change at midnight too
+        midnight = datetime.combine(timezone.localdate(), time(), tzinfo=timezone.get_current_timezone())
+        return max([midnight, *(datetime.fromtimestamp(last_modified(name), tz=dt_timezone.utc) for name in names)])
+
+    return method_decorator(condition(etag_func=etag, last_modified_func=modified))
 
 
 class HomeView(View):
     """
-    Displays the home page of the website.
+    Displays the home page of the website, with the request statistics of a logged in owner or walker.
     """
     def get(self, request):
+        if request.user.is_authenticated and (request.user.is_owner or request.user.is_walker):
+            return render(request, 'home.html', {'dashboard': dashboard(request.user)})
         return render(request, 'home.html')
 
 
@@ -38,21 +104,11 @@ class OwnerRegistration(CreateView):
     template_name = 'add_owner.html'
 
     def form_valid(self, form):
-        request = self.request
-        user = form.save()
-        phone_number = form.cleaned_data['phone_number']
-        city = form.cleaned_data['city']
-        number_of_flat = form.cleaned_data['number_of_flat']
-        street = form.cleaned_data['street']
-        owner = Owner(user=user, city=city, street=street, number_of_flat=number_of_flat, phone_number=phone_number)
-        check_phone_number = Owner.objects.filter(phone_number=phone_number)
-        if check_phone_number:
-            message = messages.error(request, "This phone number already exists. Try again!")
-            return render(request, 'wrong_number_message.html', {'message': message})
-        else:
-            owner.save()
-            login(request, user)
-            return redirect('home')
+        user = form.data_save()
+        if user is None:
+            return self.form_invalid(form)
+        login(self.request, user, backend='Pet_walking.backends.ProfileModelBackend')
+        return redirect('home')
 
 
 class WalkerRegistration(CreateView):
@@ -64,11 +120,10 @@ class WalkerRegistration(CreateView):
     template_name = 'add_walker.html'
 
     def form_valid(self, form):
-        user = form.save()
-        phone_number = form.cleaned_data['phone_number']
-        walker = Walker(user=user, phone_number=phone_number)
-        walker.save()
-        login(self.request, user)
+        user = form.data_save()
+        if user is None:
+            return self.form_invalid(form)
+        login(self.request, user, backend='Pet_walking.backends.ProfileModelBackend')
         return redirect('home')
 
 
@@ -85,13 +140,8 @@ class LoginView(View):
         password = http_request.POST['password']
         user = authenticate(http_request, username=username, password=password)
         if user is not None:
+            # the role and profile id are stored in the session on login (see signals.store_user_role)
             login(http_request, user)
-            if hasattr(user, 'owner'):
-                http_request.session['user_type'] = 'owner'
-                http_request.session['user_id'] = user.owner.id
-            elif hasattr(user, 'walker'):
-                http_request.session['user_type'] = 'walker'
-                http_request.session['user_id'] = user.walker.id
             # Redirect the user to the home page
             message = messages.error(http_request, f"Hello, {user.username}!")
             return render(http_request, 'hello_message.html', {'message': message})
@@ -118,8 +168,7 @@ class AddPetView(View):
     """
     def get(self, request):
         if request.user.is_authenticated:
-            user = request.user
-            pets = Pet.objects.filter(owner=user).order_by("nickname")
+            pets = owner_pets(request.user)
             return render(request, 'add_pet.html', {'pets': pets, 'sizes': SIZES})
         else:
             message = messages.error(request, "You must be logged in to add a pet.")
@@ -128,7 +177,6 @@ class AddPetView(View):
     def post(self, request):
         if request.user.is_authenticated:
             user = request.user
-            pets = Pet.objects.filter(owner=user).order_by("nickname")
             nickname = request.POST['nickname']
             breed = request.POST['breed']
             description = request.POST['description']
@@ -141,7 +189,7 @@ class AddPetView(View):
                 Pet.objects.create(nickname=nickname, breed=breed, description=description, size=size, owner=user)
                 message = messages.success(request, 'Your pet was successfully added!')
                 return render(request, 'messages.html',
-                              {'message': message, 'pets': pets, 'sizes': SIZES})
+                              {'message': message, 'pets': owner_pets(user), 'sizes': SIZES})
         else:
             message = messages.error(request, "You must be logged in to add a pet.")
             return render(request, 'messages.html', {'message': message})
@@ -151,10 +199,24 @@ class MyPetsView(View):
     """
     View responsible for displaying the list of pets belonging to the currently logged in user.
     """
+    @conditional_listing(lambda request: [pets_scope(request.user.pk)])
     def get(self, request):
         if request.user.is_authenticated:
-            user = request.user
-            pets = Pet.objects.filter(owner=user).order_by("nickname")
+            pets = owner_pets(request.user)
+            return render(request, 'my_pets_view.html', {'pets': pets, 'sizes': SIZES})
+        else:
+            message = messages.error(request, "You must be logged in to see your pets.")
+            return render(request, 'messages.html', {'message': message})
+
+
+class AsyncMyPetsView(View):
+    """
+    Async version of MyPetsView for ASGI servers, the pets are loaded with the async ORM.
+    """
+    async def get(self, request):
+        user = await aload_user(request)
+        if user.is_authenticated:
+            pets = await aowner_pets(user)
             return render(request, 'my_pets_view.html', {'pets': pets, 'sizes': SIZES})
         else:
             message = messages.error(request, "You must be logged in to see your pets.")
@@ -179,62 +241,333 @@ class CreateRequestView(View):
         price = http_request.POST['price']
         duration = http_request.POST['duration']
         pet = Pet.objects.get(id=pet_id)
-        Request.objects.create(date=date, pet=pet, price=price, duration=duration)
+        with transaction.atomic():
+            request = Request.objects.create(date=date, pet=pet, price=price, duration=duration)
+            OutboxEvent.objects.record_created(request)
+            send_notifications.delay_once()
         message = messages.success(http_request, 'Your request was successfully created!')
         return render(http_request, 'messages_requests.html', {'message': message, 'pet': pet})
 
 
-class OwnerRequestsView(View):
+class SeriesView(View):
     """
-    A view that displays a list of the requests associated with the owner's pets.
+    A view that displays the owner's recurring walks and creates new ones,
+    every occurrence of a new series is inserted at once.
     """
+    def render_page(self, http_request, form):
+        series = RequestSeries.objects.filter(pet__owner=http_request.user).select_related('pet').order_by('-id')
+        return render(http_request, 'series.html', {'form': form, 'series': series})
+
     def get(self, http_request):
+        if not http_request.user.is_authenticated:
+            message = messages.error(http_request, "You must be logged in to plan walks.")
+            return render(http_request, 'messages.html', {'message': message})
+        return self.render_page(http_request, RequestSeriesForm(owner=http_request.user))
+
+    def post(self, http_request):
+        if not http_request.user.is_authenticated:
+            message = messages.error(http_request, "You must be logged in to plan walks.")
+            return render(http_request, 'messages.html', {'message': message})
+        form = RequestSeriesForm(http_request.POST, owner=http_request.user)
+        if not form.is_valid():
+            return self.render_page(http_request, form)
+        series = form.save()
+        created = series.expand()
+        skipped = len(list(series.dates())) - created
+        messages.success(http_request, f'{created} walks were planned.')
+        if skipped:
+            messages.error(http_request, f'{skipped} dates were skipped, {series.pet} already has a walk then.')
+        return redirect('series')
+
+
+class SeriesChangeView(View):
+    """
+    A view that changes the price and duration of a series or cancels it,
+    touching only the occurrences that are still ahead and not reserved.
+    """
+    def post(self, http_request, pk):
+        series = get_object_or_404(RequestSeries, pk=pk, pet__owner_id=http_request.user.id)
+        if http_request.POST.get('action') == 'cancel':
+            removed = series.cancel()
+            messages.success(http_request, f'The series was cancelled, {removed} walks were removed.')
+        else:
+            form = SeriesChangeForm(http_request.POST)
+            if not form.is_valid():
+                for field, errors in form.errors.items():
+                    messages.error(http_request, f'{field.title()}: {" ".join(errors)}')
+                response = SeriesView().render_page(http_request, RequestSeriesForm(owner=http_request.user))
+                response.status_code = 400
+                return response
+            updated = series.update_future(form.cleaned_data['price'], form.cleaned_data['duration'])
+            messages.success(http_request, f'{updated} upcoming walks were updated.')
+        return redirect('series')
+
+
+class OwnerRequestsView(View):
+    """
+    A view that displays a list of the requests associated with the owner's pets,
+    one page at a time, archived past requests included.
+    """
+    template_name = 'owner_requests_view.html'
+
+    def get_context(self, http_request):
+        """
+        Builds the (still unevaluated) listing of the page.
+        """
         if http_request.user.is_owner:
             pets = Pet.objects.filter(owner=http_request.user)
-            requests = Request.objects.filter(pet__in=pets)
+            requests = Request.objects.filter(pet__owner=http_request.user)
+            archived = ArchivedRequest.objects.filter(pet__owner=http_request.user)
         else:
             pets = Pet.objects.all()
             requests = Request.objects.all()
-        return render(http_request, 'owner_requests_view.html', {'pets': pets, 'requests': requests})
+            archived = ArchivedRequest.objects.all()
+        page = MergedKeysetPage([requests.select_related('pet'), archived.select_related('pet')],
+                                http_request.GET.get('after'))
+        return {'pets': pets, 'requests': page, 'requests_version': get_version(REQUESTS_SCOPE)}
+
+    @conditional_listing(lambda http_request: [LISTINGS_SCOPE, listings_scope(http_request.user.pk)]
+                         if http_request.user.is_owner else [REQUESTS_SCOPE])
+    def get(self, http_request):
+        return render(http_request, self.template_name, self.get_context(http_request))
+
+
+class AsyncListingMixin:
+    """
+    Turns a listing view into an async one: the user is resolved off the event loop
+    and the page of requests is fetched with the async ORM before the template is rendered.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, http_request):
+        await aload_user(http_request)
+        context = self.get_context(http_request)
+        await context['requests'].afetch()
+        return render(http_request, self.template_name, context)
+
+
+class AsyncOwnerRequestsView(AsyncListingMixin, OwnerRequestsView):
+    """
+    Async version of OwnerRequestsView for ASGI servers.
+    """
 
 
 class AllCreatedRequests(View):
     """
     A view that displays a list of all created requests and available only for walkers.
+    Only requests that are still open (available and not in the past) are fetched,
+    ordered by date and paged with a cursor.
     """
-    def get(self, http_request):
+    template_name = 'all_created_requests.html'
+
+    def get_context(self, http_request):
+        """
+        Builds the (still unevaluated) listing of the page.
+        """
         if http_request.user.is_owner:
             pets = Pet.objects.filter(owner=http_request.user).order_by("nickname")
-            requests = Request.objects.filter(pet__in=pets)
+            requests = Request.objects.filter(pet__owner=http_request.user)
         else:
             pets = Pet.objects.all()
             requests = Request.objects.all()
-        return render(http_request, 'all_created_requests.html',
-                      {'pets': pets, 'requests': requests})
+        requests = requests.filter(available_for_booking=True, date__gte=timezone.localdate())
+        page = KeysetPage(requests.select_related('pet'), http_request.GET.get('after'))
+        return {'pets': pets, 'requests': page, 'requests_version': get_version(REQUESTS_SCOPE),
+                'board': http_request.user.id if http_request.user.is_owner else 'all'}
+
+    def get(self, http_request):
+        return render(http_request, self.template_name, self.get_context(http_request))
 
     def post(self, http_request):
         form = Requests(http_request.POST)
         if form.is_valid():
-            # new_status = form.cleaned_data['available_for_booking']
-            selected_requests = http_request.POST.getlist('request')
-            for request_id in selected_requests:
-                request = Request.objects.get(id=request_id)
-                # new_status = request.POST.get('available_for_booking', True) == False
-                request.available_for_booking = False
-                request.walker = http_request.user
-                request.save()
-            message = messages.success(http_request, 'You successfully reserved a walk!')
-            return render(http_request, 'walker_message.html', {'message': message, 'form': form})
+            selected_requests = [request_id for request_id in http_request.POST.getlist('request')
+                                 if request_id.isdigit()]
+            reservation = Request.objects.reserve(selected_requests, http_request.user)
+            if reservation.claimed:
+                send_notifications.delay_once()
+            if reservation.lost:
+                messages.error(http_request, 'Some of the selected walks were already reserved by someone else.')
+            if reservation.claimed or not reservation.lost:
+                messages.success(http_request, 'You successfully reserved a walk!')
+            return render(http_request, 'walker_message.html', {'form': form, 'reservation': reservation})
+
+
+class AsyncAllCreatedRequests(AsyncListingMixin, AllCreatedRequests):
+    """
+    Async version of the AllCreatedRequests board (read only, reservations are posted to the sync view).
+    """
 
 
 class SelectedRequests(View):
     """
-    It retrieves and displays requests assigned to a walker that is currently logged in.
+    It retrieves and displays requests assigned to a walker that is currently logged in, archived walks included.
     """
+    template_name = 'selected_requests.html'
+
+    def get_context(self, request):
+        """
+        Builds the (still unevaluated) listing of the page.
+        """
+        requests = Request.objects.filter(walker=request.user).select_related('pet')
+        archived = ArchivedRequest.objects.filter(walker=request.user).select_related('pet')
+        page = MergedKeysetPage([requests, archived], request.GET.get('after'))
+        return {'requests': page, 'requests_version': get_version(REQUESTS_SCOPE)}
+
+    @conditional_listing(lambda request: [LISTINGS_SCOPE, listings_scope(request.user.pk)])
     def get(self, request):
         if request.user.is_authenticated:
-            requests = Request.objects.filter(walker=request.user)
-            return render(request, 'selected_requests.html', {'requests': requests})
+            return render(request, self.template_name, self.get_context(request))
+        else:
+            message = messages.error(request, "You must be logged in to see your requests.")
+            return render(request, 'walker_message.html', {'message': message})
+
+
+class AsyncSelectedRequests(AsyncListingMixin, SelectedRequests):
+    """
+    Async version of SelectedRequests for ASGI servers.
+    """
+    async def get(self, request):
+        user = await aload_user(request)
+        if user.is_authenticated:
+            return await super().get(request)
         else:
             message = messages.error(request, "You must be logged in to see your requests.")
             return render(request, 'walker_message.html', {'message': message})
+
+
+class RequestSearchView(View):
+    """
+    A JSON endpoint searching open requests by date, price, duration and pet size.
+    Results are sorted by one of the indexed columns and paged with a cursor.
+    """
+    def get(self, http_request):
+        if not http_request.user.is_authenticated:
+            return JsonResponse({'error': 'You must be logged in to search requests.'}, status=401)
+        form = RequestSearchForm(http_request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        filters = form.filters()
+        filters.setdefault('date__gte', timezone.localdate())
+        requests = Request.objects.filter(available_for_booking=True, **filters).select_related('pet')
+        page = KeysetPage(requests, form.cleaned_data['after'], ordering=form.ordering(),
+                          size=form.cleaned_data['limit'])
+        return JsonResponse({'results': [request_data(request) for request in page], 'next': page.next_cursor})
+
+
+def request_data(request):
+    """
+    Returns the JSON representation of an open request (with its pet loaded) used by the search endpoints.
+    """
+    return {
+        'id': request.id,
+        'date': request.date,
+        'price': request.price,
+        'duration': request.duration,
+        'pet': {
+            'id': request.pet.id,
+            'nickname': request.pet.nickname,
+            'breed': request.pet.breed,
+            'size': request.pet.size,
+        },
+    }
+
+
+class PetSearchView(View):
+    """
+    A JSON endpoint searching pets by nickname, breed and description, the best matches first.
+    """
+    def get(self, http_request):
+        if not http_request.user.is_authenticated:
+            return JsonResponse({'error': 'You must be logged in to search pets.'}, status=401)
+        form = PetSearchForm(http_request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        pets = search_pets(form.cleaned_data['q'], form.cleaned_data['limit'] or 20)
+        return JsonResponse({'results': [{'id': pet.id, 'nickname': pet.nickname, 'breed': pet.breed, 'size': pet.size,
+                                          'description': pet.description, 'rank': pet.rank} for pet in pets]})
+
+
+class AvailabilityView(View):
+    """
+    A view in which a walker adds and removes the days he/she is available on
+    and sees the open requests that fit them, one page at a time.
+    """
+    def render_page(self, http_request, form):
+        windows = Availability.objects.filter(walker=http_request.user, end_date__gte=timezone.localdate())
+        requests = Request.objects.filter(available_for_booking=True).fitting(
+            Availability.objects.filter(walker=http_request.user).windows())
+        page = KeysetPage(requests.select_related('pet'), http_request.GET.get('after'))
+        return render(http_request, 'availability.html',
+                      {'form': form, 'windows': windows.order_by('start_date'), 'requests': page})
+
+    def get(self, http_request):
+        if not (http_request.user.is_authenticated and http_request.user.is_walker):
+            message = messages.error(http_request, "You must be logged in as a walker to set your availability.")
+            return render(http_request, 'messages.html', {'message': message})
+        return self.render_page(http_request, AvailabilityForm(walker=http_request.user))
+
+    def post(self, http_request):
+        if not (http_request.user.is_authenticated and http_request.user.is_walker):
+            message = messages.error(http_request, "You must be logged in as a walker to set your availability.")
+            return render(http_request, 'messages.html', {'message': message})
+        if http_request.POST.get('action') == 'remove':
+            Availability.objects.filter(walker=http_request.user, pk=http_request.POST.get('window')).delete()
+            messages.success(http_request, 'The window was removed.')
+            return redirect('availability')
+        form = AvailabilityForm(http_request.POST, walker=http_request.user)
+        if not form.is_valid():
+            return self.render_page(http_request, form)
+        form.save()
+        messages.success(http_request, 'Your availability was saved.')
+        return redirect('availability')
+
+
+class AvailabilityMatchesView(View):
+    """
+    A JSON endpoint returning the open requests that fit the walker's availability windows,
+    accepting the filters, sorting and paging of the request search.
+    """
+    def get(self, http_request):
+        if not http_request.user.is_authenticated:
+            return JsonResponse({'error': 'You must be logged in to search requests.'}, status=401)
+        form = RequestSearchForm(http_request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        windows = Availability.objects.filter(walker=http_request.user).windows()
+        requests = (Request.objects.filter(available_for_booking=True, **form.filters())
+                    .fitting(windows).select_related('pet'))
+        page = KeysetPage(requests, form.cleaned_data['after'], ordering=form.ordering(),
+                          size=form.cleaned_data['limit'])
+        return JsonResponse({'results': [request_data(request) for request in page], 'next': page.next_cursor})
+
+
+class ExportRequestsView(View):
+    """
+    Streams all walk requests with pet and walker as CSV or JSONL, available only for staff.
+    The rows are never held in memory at once, so the export works for any table size.
+    """
+    def get(self, http_request):
+        if not http_request.user.is_staff:
+            return HttpResponseForbidden('Only staff members can export requests.')
+        form = ExportForm(http_request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        lines, content_type = FORMATS[form.cleaned_data['format']]
+        rows = export_rows(form.cleaned_data['date_from'], form.cleaned_data['date_to'])
+        response = StreamingHttpResponse(lines(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="requests.{form.cleaned_data["format"]}"'
+        return response
+
+
+class MetricsView(View):
+    """
+    Exposes the per-view performance metrics and cache hits and misses of this process and the state of the job queue
+    in the Prometheus text format, available for staff members and the addresses listed in METRICS_ALLOWED_IPS.
+    """
+    def get(self, http_request):
+        if not (http_request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+                or http_request.user.is_staff):
+            return HttpResponseForbidden('Metrics are not available from this address.')
+        return HttpResponse(registry.render() + render_cache_metrics() + render_metrics(),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')